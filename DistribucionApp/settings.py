@@ -156,6 +156,14 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 GOOGLE_MAPS_API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
 
+# Red vial local preprocesada (comando preparar_red_vial). Si está
+# configurada, las matrices de distancia se calculan sin Google.
+RUTAS_RED_VIAL = os.getenv("RUTAS_RED_VIAL", "")
+
+# Dashboard y balance desde columnas de ventas en memoria (por proceso)
+# en vez de consultar VentaDiaria. Ver crm/services_analitica.py
+CRM_ANALITICA_EN_MEMORIA = os.getenv("CRM_ANALITICA_EN_MEMORIA", "False") == "True"
+
 
 
 # ========== AGREGAR ESTAS LÍNEAS AL FINAL DE settings.py ==========
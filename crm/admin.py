@@ -7,6 +7,9 @@ from .models import (
     VentaItem,
     Importacion,
     GastoOperacional,
+    MovimientoInventario,
+    ComposicionBolsa,
+    MovimientoBolsa,
 )
 from .services import segmentar_cliente
 
@@ -14,12 +17,29 @@ from .services import segmentar_cliente
 # =========================
 # PRODUCTOS ✅
 # =========================
+class ComposicionBolsaInline(admin.TabularInline):
+    model = ComposicionBolsa
+    extra = 0
+
+
 @admin.register(Producto)
 class ProductoAdmin(admin.ModelAdmin):
     list_display = ("sku", "nombre", "peso_kg", "precio_sugerido", "activo")
     list_filter = ("activo",)
     search_fields = ("sku", "nombre")
     ordering = ("nombre",)
+    inlines = [ComposicionBolsaInline]
+
+
+# =========================
+# BOLSAS DE EMPAQUE (el consumo por ventas se calcula, no se registra aquí)
+# =========================
+@admin.register(MovimientoBolsa)
+class MovimientoBolsaAdmin(admin.ModelAdmin):
+    list_display = ("fecha", "tipo_bolsa", "tipo", "cantidad", "nota")
+    list_filter = ("tipo_bolsa", "tipo")
+    date_hierarchy = "fecha"
+    ordering = ("-fecha", "-id")
 
 
 # =========================
@@ -89,8 +109,10 @@ class VentaAdmin(admin.ModelAdmin):
         "kilos_total",
         "monto_total",
         "canal",
+        "fecha_entrega",
+        "entregada",
     )
-    list_filter = ("canal", "fecha", "tipo_documento")
+    list_filter = ("canal", "fecha", "tipo_documento", "entregada")
     date_hierarchy = "fecha"
     search_fields = ("cliente__nombre", "numero_documento")
     ordering = ("-id",)
@@ -106,6 +128,7 @@ class VentaItemAdmin(admin.ModelAdmin):
         "producto",
         "cantidad",
         "precio_unitario",
+        "kilos",
         "subtotal",
     )
     search_fields = ("producto__nombre", "producto__sku", "venta__cliente__nombre")
@@ -130,6 +153,26 @@ class ImportacionAdmin(admin.ModelAdmin):
     list_filter = ("activo",)
     ordering = ("-fecha",)
 
+
+# =========================
+# LIBRO DE INVENTARIO (sólo lectura: se escribe desde services_inventario)
+# =========================
+@admin.register(MovimientoInventario)
+class MovimientoInventarioAdmin(admin.ModelAdmin):
+    list_display = ("id", "fecha", "tipo", "referencia_id", "kilos", "saldo")
+    list_filter = ("tipo",)
+    date_hierarchy = "fecha"
+    ordering = ("-id",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
 # =========================
 # GASTOS OPERACIONALES ✅
 # =========================
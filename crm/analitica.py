@@ -0,0 +1,140 @@
+# crm/analitica.py
+"""
+Columnas de ventas en memoria para agregar sin ir a la base de datos.
+
+- Una serie por (canal, tipo de documento): el código categórico queda
+  en la clave y no se repite por fila
+- Cada serie está ordenada por día (ordinal local) en arreglos compactos
+  (`array`), con sumas acumuladas de monto, kilos y primeras compras:
+  la suma de un rango de días es acumulado[j] - acumulado[i]
+- Los límites de los intervalos se ubican con búsqueda binaria (bisect),
+  así que agrupar por mes o por día cuesta O(series × intervalos × log n),
+  no O(ventas)
+- Las ventas nuevas se agregan al final de su serie; un cambio
+  retroactivo recorta las series desde ese día y se recarga la cola
+
+Montos en centavos y kilos en centésimas (enteros, ver crm.dinero).
+Sin Django: la carga y la sincronización están en services_analitica.
+"""
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+
+# Totales de un grupo: cantidad de ventas, monto (centavos), kilos
+# (centésimas), ventas que son la primera del cliente y monto vendido el
+# día de la primera compra del cliente (centavos). Como VentaDiaria.
+Totales = namedtuple('Totales', 'cantidad monto kilos primeras monto_primeras')
+
+
+def sumar(a, b):
+    return Totales(*(x + y for x, y in zip(a, b)))
+
+
+class SerieVentas:
+    """Ventas de un canal y tipo de documento, ordenadas por día"""
+
+    def __init__(self):
+        self.dias = array('l')
+        self.clientes = array('q')
+        # Sumas acumuladas: el elemento k es la suma de las ventas [0, k)
+        self.monto = array('q', [0])
+        self.kilos = array('q', [0])
+        self.primeras = array('l', [0])
+        self.monto_primeras = array('q', [0])
+
+    def __len__(self):
+        return len(self.dias)
+
+    def agregar(self, dia, cliente, monto, kilos, primera, monto_primera):
+        """dia no puede ser anterior al último (ver recortar)"""
+        self.dias.append(dia)
+        self.clientes.append(cliente)
+        self.monto.append(self.monto[-1] + monto)
+        self.kilos.append(self.kilos[-1] + kilos)
+        self.primeras.append(self.primeras[-1] + primera)
+        self.monto_primeras.append(self.monto_primeras[-1] + monto_primera)
+
+    def recortar(self, dia):
+        """Descarta las ventas desde `dia` (inclusive)"""
+        i = bisect_left(self.dias, dia)
+        del self.dias[i:], self.clientes[i:]
+        for acumulado in (self.monto, self.kilos, self.primeras, self.monto_primeras):
+            del acumulado[i + 1:]
+
+    def posiciones(self, cortes):
+        return [bisect_left(self.dias, c) for c in cortes]
+
+    def totales(self, i, j):
+        return Totales(
+            j - i,
+            self.monto[j] - self.monto[i],
+            self.kilos[j] - self.kilos[i],
+            self.primeras[j] - self.primeras[i],
+            self.monto_primeras[j] - self.monto_primeras[i],
+        )
+
+
+class AlmacenVentas:
+    """
+    Series por (canal, tipo de documento).
+
+        almacen.agregar(filas)       # (dia, canal, tipo, cliente, monto, kilos, primera, monto_primera)
+        almacen.resumen([d0, d1, d2])  # intervalos [d0, d1) y [d1, d2)
+    """
+
+    def __init__(self):
+        self.series = {}
+
+    def __len__(self):
+        return sum(len(s) for s in self.series.values())
+
+    def agregar(self, filas):
+        """Filas ordenadas por día y no anteriores a lo ya cargado"""
+        series = self.series
+        for dia, canal, tipo, cliente, monto, kilos, primera, monto_primera in filas:
+            serie = series.get((canal, tipo))
+            if serie is None:
+                serie = series[(canal, tipo)] = SerieVentas()
+            serie.agregar(dia, cliente, monto, kilos, primera, monto_primera)
+
+    def recortar(self, dia):
+        for serie in self.series.values():
+            serie.recortar(dia)
+
+    def resumen(self, cortes):
+        """
+        Totales por intervalo [cortes[k], cortes[k + 1]) de días
+        (ordinales), canal y tipo de documento. Sólo los grupos con ventas.
+
+        Returns:
+            dict: {(k, canal, tipo): Totales}
+        """
+        salida = {}
+        for (canal, tipo), serie in self.series.items():
+            pos = serie.posiciones(cortes)
+            for k in range(len(cortes) - 1):
+                i, j = pos[k], pos[k + 1]
+                if j > i:
+                    salida[(k, canal, tipo)] = serie.totales(i, j)
+        return salida
+
+    def top_clientes(self, desde, hasta, n, excluir_tipos=()):
+        """
+        Los n clientes con más monto en [desde, hasta) (ordinales); empates
+        por id de cliente.
+
+        Returns:
+            list[(cliente_id, monto, cantidad)]
+        """
+        monto, cantidad = {}, {}
+        for (_, tipo), serie in self.series.items():
+            if tipo in excluir_tipos:
+                continue
+            i, j = serie.posiciones((desde, hasta))
+            acumulado, clientes = serie.monto, serie.clientes
+            for k in range(i, j):
+                cliente = clientes[k]
+                monto[cliente] = monto.get(cliente, 0) + acumulado[k + 1] - acumulado[k]
+                cantidad[cliente] = cantidad.get(cliente, 0) + 1
+        mejores = sorted(monto, key=lambda c: (-monto[c], c))[:n]
+        return [(c, monto[c], cantidad[c]) for c in mejores]
@@ -0,0 +1,78 @@
+# crm/dinero.py
+"""
+Montos en CLP como enteros de centavos para los cálculos calientes
+(balance, IVA, sumas).
+
+- En SQL: SumaCentavos('campo') suma cada monto redondeado a centavos
+  como INTEGER (exacto; la suma de DecimalField en SQLite es de floats).
+- En Python: neto / IVA con aritmética entera y redondeo al par
+  (ROUND_HALF_EVEN), el mismo que daba Decimal.quantize con el contexto
+  por defecto, así que los resultados coinciden al centavo.
+- Decimal sólo al presentar: a_decimal(centavos).
+"""
+from decimal import ROUND_HALF_EVEN, Decimal
+
+from django.db.models import F, IntegerField, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Round
+
+CENTAVOS = 100
+TASA_IVA = 19  # %
+CENTAVO = Decimal('0.01')
+
+
+def a_centavos(monto):
+    """Decimal / int / str / None → centavos (int), redondeo al par"""
+    if monto is None:
+        return 0
+    if isinstance(monto, int):
+        return monto * CENTAVOS
+    return int((Decimal(monto) * CENTAVOS).quantize(Decimal('1'), rounding=ROUND_HALF_EVEN))
+
+
+def a_decimal(centavos):
+    """Centavos → Decimal con 2 decimales (para templates, JSON, admin)"""
+    return Decimal(centavos).scaleb(-2).quantize(CENTAVO)
+
+
+def dividir(numerador, denominador):
+    """numerador / denominador redondeado al entero más cercano (empates al par)"""
+    if denominador < 0:
+        numerador, denominador = -numerador, -denominador
+    cociente, resto = divmod(numerador, denominador)
+    if 2 * resto > denominador or (2 * resto == denominador and cociente % 2):
+        cociente += 1
+    return cociente
+
+
+def neto_de_bruto(bruto):
+    """Neto (sin IVA) de un monto bruto, en centavos"""
+    return dividir(bruto * 100, 100 + TASA_IVA)
+
+
+def iva_de_bruto(bruto):
+    return bruto - neto_de_bruto(bruto)
+
+
+def iva_de_neto(neto):
+    return dividir(neto * TASA_IVA, 100)
+
+
+def porcentaje(parte, total):
+    """parte / total × 100 en centésimas de punto (0 si total <= 0)"""
+    if total <= 0:
+        return 0
+    return dividir(parte * 100 * CENTAVOS, total)
+
+
+def SumaCentavos(campo, **kwargs):
+    """Sum() de un DecimalField como entero de centavos (0 sin filas)"""
+    return Coalesce(
+        Sum(Cast(Round(F(campo) * CENTAVOS), IntegerField()), **kwargs),
+        Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def Centavos(campo):
+    """El monto de la fila como entero de centavos"""
+    return Cast(Round(F(campo) * CENTAVOS), IntegerField())
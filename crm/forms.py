@@ -33,8 +33,13 @@ class VentaForm(forms.ModelForm):
             "numero_documento",
             "canal",
             "kilos_total",      # ✅ kilos (antes era total)
+            "fecha_entrega",
+            "entregada",
             "observaciones",
         ]
+        widgets = {
+            "fecha_entrega": forms.DateInput(attrs={"type": "date"}, format="%Y-%m-%d"),
+        }
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -0,0 +1,53 @@
+# crm/management/commands/benchmark_analitica.py
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from django.utils import timezone
+
+from crm import services_analitica
+from crm.management.commands.benchmark_dinero import _mejor_tiempo
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara los resúmenes de ventas desde VentaDiaria contra la '
+        'analítica en memoria (crm.analitica) sobre la base de datos '
+        'actual: tiempos y que los resultados sean idénticos.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=365, help='Largo del período a resumir')
+        parser.add_argument('--repeticiones', type=int, default=5, help='Se informa el mejor de N')
+
+    def handle(self, *args, **options):
+        hasta = timezone.localdate()
+        desde = hasta - datetime.timedelta(days=options['dias'])
+        consultas = {
+            'por mes': services_analitica.cortes_mensuales(desde, hasta),
+            'por día': services_analitica.cortes_diarios(desde, hasta),
+        }
+        rep = options['repeticiones']
+
+        services_analitica.reiniciar()
+        with override_settings(CRM_ANALITICA_EN_MEMORIA=True):
+            t_carga, almacen = _mejor_tiempo(services_analitica.almacen, 1)
+        self.stdout.write(f"Carga inicial: {len(almacen)} ventas en {t_carga * 1000:.0f} ms")
+
+        for nombre, cortes in consultas.items():
+            t_sql, r_sql = _mejor_tiempo(lambda: services_analitica.resumen(cortes), rep)
+            with override_settings(CRM_ANALITICA_EN_MEMORIA=True):
+                t_mem, r_mem = _mejor_tiempo(lambda: services_analitica.resumen(cortes), rep)
+            if r_sql != r_mem:
+                self.stderr.write(self.style.ERROR(f"Resumen {nombre}: resultados distintos"))
+            self.stdout.write(
+                f"Resumen {nombre} ({len(cortes) - 1} intervalos): VentaDiaria {t_sql * 1000:.1f} ms, "
+                f"memoria {t_mem * 1000:.1f} ms"
+            )
+
+        t_sql, r_sql = _mejor_tiempo(lambda: services_analitica.top_clientes(desde, hasta), rep)
+        with override_settings(CRM_ANALITICA_EN_MEMORIA=True):
+            t_mem, r_mem = _mejor_tiempo(lambda: services_analitica.top_clientes(desde, hasta), rep)
+        if r_sql != r_mem:
+            self.stderr.write(self.style.ERROR("Top clientes: resultados distintos"))
+        self.stdout.write(f"Top clientes: SQL {t_sql * 1000:.1f} ms, memoria {t_mem * 1000:.1f} ms")
@@ -0,0 +1,85 @@
+# crm/management/commands/benchmark_dinero.py
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+
+from crm import dinero
+from crm.models import Venta
+from crm.services_balance import calcular_balance_anual
+
+
+def _mejor_tiempo(funcion, repeticiones):
+    mejor = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        transcurrido = time.perf_counter() - inicio
+        mejor = transcurrido if mejor is None else min(mejor, transcurrido)
+    return mejor, resultado
+
+
+def _neto_iva_decimal(montos):
+    """Como Venta.monto_neto / iva y GastoOperacional.iva antes de crm.dinero"""
+    total_neto = total_iva = total_iva_gastos = Decimal('0.00')
+    for monto in montos:
+        neto = (monto / Decimal('1.19')).quantize(Decimal('0.01'))
+        total_neto += neto
+        total_iva += (monto - neto).quantize(Decimal('0.01'))
+        total_iva_gastos += (monto * Decimal('0.19')).quantize(Decimal('0.01'))
+    return total_neto, total_iva, total_iva_gastos
+
+
+def _neto_iva_enteros(centavos):
+    total_neto = total_iva = total_iva_gastos = 0
+    for monto in centavos:
+        neto = dinero.neto_de_bruto(monto)
+        total_neto += neto
+        total_iva += monto - neto
+        total_iva_gastos += dinero.iva_de_neto(monto)
+    return dinero.a_decimal(total_neto), dinero.a_decimal(total_iva), dinero.a_decimal(total_iva_gastos)
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara el cálculo de neto / IVA con Decimal y quantize contra '
+        'enteros de centavos (crm.dinero), y mide las sumas SQL y el '
+        'balance anual sobre la base de datos actual.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--montos', type=int, default=200_000, help='Montos sintéticos')
+        parser.add_argument('--repeticiones', type=int, default=3, help='Se informa el mejor de N')
+        parser.add_argument('--anio', type=int, help='Año para medir calcular_balance_anual')
+        parser.add_argument('--semilla', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['semilla'])
+        centavos = [rnd.randint(0, 5_000_000_00) for _ in range(options['montos'])]
+        montos = [dinero.a_decimal(c) for c in centavos]
+        rep = options['repeticiones']
+
+        t_decimal, r_decimal = _mejor_tiempo(lambda: _neto_iva_decimal(montos), rep)
+        t_enteros, r_enteros = _mejor_tiempo(lambda: _neto_iva_enteros(centavos), rep)
+        if r_decimal != r_enteros:
+            self.stderr.write(self.style.ERROR(f"Resultados distintos: {r_decimal} != {r_enteros}"))
+        self.stdout.write(
+            f"neto/IVA de {len(montos)} montos: Decimal {t_decimal * 1000:.0f} ms, "
+            f"enteros {t_enteros * 1000:.0f} ms ({t_decimal / t_enteros:.1f}×)"
+        )
+
+        if Venta.objects.exists():
+            t_sum, s_decimal = _mejor_tiempo(lambda: Venta.objects.aggregate(s=Sum('monto_total'))['s'], rep)
+            t_cent, s_cent = _mejor_tiempo(
+                lambda: Venta.objects.aggregate(s=dinero.SumaCentavos('monto_total'))['s'], rep,
+            )
+            self.stdout.write(
+                f"Suma de monto_total ({Venta.objects.count()} ventas): Sum {t_sum * 1000:.0f} ms "
+                f"= {s_decimal}, SumaCentavos {t_cent * 1000:.0f} ms = {dinero.a_decimal(s_cent)}"
+            )
+
+        if options['anio']:
+            t_balance, _ = _mejor_tiempo(lambda: calcular_balance_anual(options['anio']), rep)
+            self.stdout.write(f"calcular_balance_anual({options['anio']}): {t_balance * 1000:.0f} ms")
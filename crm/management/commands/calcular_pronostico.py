@@ -0,0 +1,25 @@
+# crm/management/commands/calcular_pronostico.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from crm import services_pronostico
+
+
+class Command(BaseCommand):
+    help = (
+        'Ajusta el pronóstico de demanda y el plan de reposición de cada '
+        'ventana (PronosticoDemanda). Pensado para cron (una vez al día).'
+    )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        filas = services_pronostico.calcular()
+        for f in filas:
+            self.stdout.write(
+                f"{f.ventana_dias:>4} días  {f.metodo:<22} {f.consumo_diario} kg/día  "
+                f"quiebre {f.fecha_quiebre or '—'}  ordenar {f.fecha_orden or '—'}"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(filas)} pronósticos ({time.perf_counter() - inicio:.1f} s)"
+        ))
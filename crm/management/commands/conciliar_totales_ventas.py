@@ -0,0 +1,55 @@
+# crm/management/commands/conciliar_totales_ventas.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from crm import services_mantencion
+
+
+class Command(BaseCommand):
+    help = (
+        'Detecta ventas cuyo monto_total (y opcionalmente kilos_total) no cuadra '
+        'con sus ítems, con una sola consulta. Con --corregir las arregla con un '
+        'UPDATE correlacionado.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--kilos', action='store_true',
+            help='Revisar también kilos_total (se ingresa a mano) en ventas con ítems',
+        )
+        parser.add_argument('--corregir', action='store_true', help='Corregir los descuadres')
+        parser.add_argument('--muestra', type=int, default=20, help='Ventas a listar (default 20)')
+
+    def handle(self, *args, **options):
+        kilos = options['kilos']
+        inicio = time.perf_counter()
+
+        descuadres = services_mantencion.descuadres(kilos)
+        muestra = list(
+            descuadres
+            .order_by('-dif_monto', 'id')
+            .values('id', 'fecha', 'monto_total', 'monto_items', 'kilos_total', 'kilos_items')
+            [:max(options['muestra'], 0)]
+        )
+        total = descuadres.count() if len(muestra) >= options['muestra'] else len(muestra)
+
+        if not total:
+            self.stdout.write(self.style.SUCCESS(
+                f"Sin descuadres ({time.perf_counter() - inicio:.1f} s)"
+            ))
+            return
+
+        self.stdout.write(self.style.WARNING(f"{total} ventas descuadradas"))
+        for v in muestra:
+            linea = f"  #{v['id']} {v['fecha']:%Y-%m-%d}: monto {v['monto_total']} vs ítems {v['monto_items']}"
+            if kilos:
+                linea += f" | kilos {v['kilos_total']} vs ítems {v['kilos_items']}"
+            self.stdout.write(linea)
+
+        if options['corregir']:
+            n = services_mantencion.corregir_descuadres(kilos)
+            self.stdout.write(self.style.SUCCESS(f"{n} ventas corregidas"))
+        else:
+            self.stdout.write('Usa --corregir para arreglarlas.')
+        self.stdout.write(f"({time.perf_counter() - inicio:.1f} s)")
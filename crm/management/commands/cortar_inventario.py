@@ -0,0 +1,17 @@
+# crm/management/commands/cortar_inventario.py
+from django.core.management.base import BaseCommand
+
+from crm import services_inventario
+
+
+class Command(BaseCommand):
+    help = (
+        'Crea los cortes diarios de inventario pendientes hasta ayer y '
+        'completa StockDiario. Pensado para cron (una vez al día); acelera '
+        'el stock a una fecha y el historial de stock.'
+    )
+
+    def handle(self, *args, **options):
+        n = services_inventario.crear_cortes()
+        dias = services_inventario.rellenar_stock_diario()
+        self.stdout.write(self.style.SUCCESS(f"{n} cortes creados, {dias} días de stock diario"))
@@ -0,0 +1,21 @@
+# crm/management/commands/recalcular_primeras_compras.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from crm.services import recalcular_primeras_compras
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula Cliente.primera_compra y primera_venta desde Venta '
+        '(excluye notas de crédito). Útil tras cargas masivas o ediciones '
+        'hechas con update().'
+    )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        n = recalcular_primeras_compras()
+        self.stdout.write(self.style.SUCCESS(
+            f"Primera compra recalculada para {n} clientes ({time.perf_counter() - inicio:.1f} s)"
+        ))
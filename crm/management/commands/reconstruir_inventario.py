@@ -0,0 +1,21 @@
+# crm/management/commands/reconstruir_inventario.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from crm import services_inventario
+
+
+class Command(BaseCommand):
+    help = (
+        'Rehace el libro de inventario (MovimientoInventario) desde las '
+        'importaciones y ventas, con sus cortes diarios.'
+    )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        n = services_inventario.reconstruir_libro()
+        self.stdout.write(self.style.SUCCESS(
+            f"{n} movimientos, stock actual {services_inventario.stock_actual()} kg "
+            f"({time.perf_counter() - inicio:.1f} s)"
+        ))
@@ -0,0 +1,20 @@
+# crm/management/commands/reconstruir_stock_diario.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from crm import services_inventario
+
+
+class Command(BaseCommand):
+    help = (
+        'Rehace StockDiario (kilos y bolsas al cierre de cada día) desde el '
+        'primer movimiento hasta ayer, en una sola pasada ordenada.'
+    )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        n = services_inventario.reconstruir_stock_diario()
+        self.stdout.write(self.style.SUCCESS(
+            f"{n} días de stock diario ({time.perf_counter() - inicio:.1f} s)"
+        ))
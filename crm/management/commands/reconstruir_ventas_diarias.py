@@ -0,0 +1,40 @@
+# crm/management/commands/reconstruir_ventas_diarias.py
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm import services_ventas_diarias
+from crm.services import recalcular_primeras_compras
+
+
+def _fecha(texto):
+    try:
+        return datetime.date.fromisoformat(texto)
+    except ValueError:
+        raise CommandError(f"Fecha inválida: {texto} (usa AAAA-MM-DD)")
+
+
+class Command(BaseCommand):
+    help = (
+        'Reconstruye la tabla VentaDiaria desde Venta (completa o en un rango '
+        'de días). Útil tras cargas masivas o si se sospecha que quedó desfasada.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', type=str, help='Primer día (AAAA-MM-DD)')
+        parser.add_argument('--hasta', type=str, help='Último día (AAAA-MM-DD)')
+
+    def handle(self, *args, **options):
+        desde = _fecha(options['desde']) if options['desde'] else None
+        hasta = _fecha(options['hasta']) if options['hasta'] else None
+        if desde and hasta and desde > hasta:
+            raise CommandError('--desde no puede ser posterior a --hasta')
+
+        inicio = time.perf_counter()
+        # Las columnas de primeras compras dependen de Cliente.primera_compra
+        recalcular_primeras_compras()
+        filas = services_ventas_diarias.reconstruir(desde, hasta)
+        self.stdout.write(self.style.SUCCESS(
+            f"VentaDiaria reconstruida: {filas} filas ({time.perf_counter() - inicio:.1f} s)"
+        ))
@@ -0,0 +1,33 @@
+# crm/management/commands/reprocesar_costos.py
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from crm import services_costos
+
+
+class Command(BaseCommand):
+    help = (
+        'Reasigna el costo FIFO (ConsumoLote, Venta.costo_fifo, '
+        'Importacion.kilos_restantes) de todas las ventas o desde un día.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', type=str, help='Primer día a reprocesar (AAAA-MM-DD)')
+
+    def handle(self, *args, **options):
+        desde = None
+        if options['desde']:
+            try:
+                dia = datetime.date.fromisoformat(options['desde'])
+            except ValueError:
+                raise CommandError(f"Fecha inválida: {options['desde']} (usa AAAA-MM-DD)")
+            desde = timezone.make_aware(datetime.datetime.combine(dia, datetime.time.min))
+
+        inicio = time.perf_counter()
+        n = services_costos.reprocesar(desde)
+        self.stdout.write(self.style.SUCCESS(
+            f"Costo FIFO de {n} ventas reasignado ({time.perf_counter() - inicio:.1f} s)"
+        ))
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.27 on 2026-10-19 14:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0012_alter_cliente_options_alter_gastooperacional_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='venta',
+            name='entregada',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='venta',
+            name='fecha_entrega',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='venta',
+            index=models.Index(fields=['entregada', 'fecha_entrega'], name='crm_venta_entrega_0db6c0_idx'),
+        ),
+    ]
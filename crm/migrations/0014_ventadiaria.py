@@ -0,0 +1,78 @@
+# Generated by Django 4.2.27 on 2026-10-19 16:00
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def llenar_ventas_diarias(apps, schema_editor):
+    """
+    Agrupa las ventas existentes como services_ventas_diarias._filas.
+    Cliente.primera_venta aún no existe (0015): la primera compra de cada
+    cliente es su primera venta sin nota de crédito por (fecha, id).
+    """
+    Venta = apps.get_model('crm', 'Venta')
+    VentaDiaria = apps.get_model('crm', 'VentaDiaria')
+
+    ventas = list(
+        Venta.objects.order_by('fecha', 'id')
+        .values_list('id', 'fecha', 'canal', 'tipo_documento', 'cliente_id', 'monto_total', 'kilos_total')
+    )
+    primera = {}
+    for venta_id, fecha, _, tipo, cliente_id, _, _ in ventas:
+        if tipo != 'nota_credito' and cliente_id not in primera:
+            primera[cliente_id] = (venta_id, timezone.localtime(fecha).date())
+
+    filas = {}
+    for venta_id, fecha, canal, tipo, cliente_id, monto, kilos in ventas:
+        dia = timezone.localtime(fecha).date()
+        fila = filas.get((dia, canal, tipo))
+        if fila is None:
+            fila = filas[(dia, canal, tipo)] = VentaDiaria(
+                dia=dia, canal=canal, tipo_documento=tipo, cantidad=0,
+                monto=Decimal('0'), kilos=Decimal('0'),
+                primeras_compras=0, monto_primeras=Decimal('0'),
+            )
+        fila.cantidad += 1
+        fila.monto += monto or 0
+        fila.kilos += kilos or 0
+        venta_primera, dia_primera = primera.get(cliente_id, (None, None))
+        if venta_primera == venta_id:
+            fila.primeras_compras += 1
+        if dia == dia_primera and tipo != 'nota_credito':
+            fila.monto_primeras += monto or 0
+    VentaDiaria.objects.bulk_create(filas.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0013_venta_entregada_venta_fecha_entrega_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VentaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('canal', models.CharField(choices=[('instagram', 'Instagram'), ('whatsapp', 'WhatsApp'), ('web', 'Web'), ('otro', 'Otro')], max_length=20)),
+                ('tipo_documento', models.CharField(choices=[('sin_doc', 'Sin documento'), ('boleta', 'Boleta'), ('factura', 'Factura'), ('nota_credito', 'Nota crédito')], max_length=20)),
+                ('cantidad', models.PositiveIntegerField(default=0)),
+                ('monto', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('kilos', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('primeras_compras', models.PositiveIntegerField(default=0)),
+                ('monto_primeras', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'verbose_name': 'Venta Diaria',
+                'verbose_name_plural': 'Ventas Diarias',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='ventadiaria',
+            constraint=models.UniqueConstraint(fields=('dia', 'canal', 'tipo_documento'), name='uniq_venta_diaria'),
+        ),
+        migrations.RunPython(llenar_ventas_diarias, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.27 on 2026-10-19 16:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import OuterRef, Subquery
+
+
+def calcular_primera_compra(apps, schema_editor):
+    Cliente = apps.get_model('crm', 'Cliente')
+    Venta = apps.get_model('crm', 'Venta')
+    primeras = (
+        Venta.objects
+        .exclude(tipo_documento='nota_credito')
+        .filter(cliente_id=OuterRef('pk'))
+        .order_by('fecha', 'id')
+    )
+    Cliente.objects.update(
+        primera_venta_id=Subquery(primeras.values('id')[:1]),
+        primera_compra=Subquery(primeras.values('fecha')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0014_ventadiaria'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='primera_compra',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='primera_venta',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='crm.venta'),
+        ),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['primera_compra'], name='crm_cliente_primera_e18e3b_idx'),
+        ),
+        migrations.RunPython(calcular_primera_compra, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.27 on 2026-10-19 16:03
+
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def calcular_kilos_subtotal(apps, schema_editor):
+    VentaItem = apps.get_model('crm', 'VentaItem')
+    Producto = apps.get_model('crm', 'Producto')
+    peso = Subquery(Producto.objects.filter(pk=OuterRef('producto_id')).values('peso_kg')[:1])
+    VentaItem.objects.update(
+        kilos=F('cantidad') * Coalesce(peso, Value(0), output_field=DecimalField(max_digits=6, decimal_places=2)),
+        subtotal=F('cantidad') * F('precio_unitario'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0015_cliente_primera_compra'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='ventaitem',
+            name='crm_ventait_venta_i_74c3bf_idx',
+        ),
+        migrations.AddField(
+            model_name='ventaitem',
+            name='kilos',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='ventaitem',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddIndex(
+            model_name='ventaitem',
+            index=models.Index(fields=['venta', 'producto', 'kilos'], name='crm_ventait_venta_i_bdf084_idx'),
+        ),
+        migrations.RunPython(calcular_kilos_subtotal, migrations.RunPython.noop),
+    ]
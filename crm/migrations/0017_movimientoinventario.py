@@ -0,0 +1,95 @@
+# Generated by Django 4.2.27 on 2026-10-19 16:10
+
+import datetime
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Sum
+from django.utils import timezone
+
+
+def llenar_libro(apps, schema_editor):
+    """
+    Libro y cortes desde las importaciones y ventas existentes, como
+    services_inventario.reconstruir_libro (cortes hasta ayer).
+    """
+    Importacion = apps.get_model('crm', 'Importacion')
+    Venta = apps.get_model('crm', 'Venta')
+    MovimientoInventario = apps.get_model('crm', 'MovimientoInventario')
+    CorteInventario = apps.get_model('crm', 'CorteInventario')
+
+    movimientos = []
+    for imp in Importacion.objects.values('id', 'fecha', 'kilos_ingresados', 'merma_kg'):
+        fecha = timezone.make_aware(datetime.datetime.combine(imp['fecha'], datetime.time.min))
+        movimientos.append(MovimientoInventario(
+            fecha=fecha, tipo='importacion', referencia_id=imp['id'], kilos=imp['kilos_ingresados'],
+        ))
+        if imp['merma_kg']:
+            movimientos.append(MovimientoInventario(
+                fecha=fecha, tipo='merma', referencia_id=imp['id'], kilos=-imp['merma_kg'],
+            ))
+    ventas = (
+        Venta.objects.annotate(kilos=Sum('items__kilos'))
+        .filter(kilos__gt=0)
+        .values_list('id', 'fecha', 'tipo_documento', 'kilos')
+    )
+    for venta_id, fecha, tipo_documento, kilos in ventas:
+        nota = tipo_documento == 'nota_credito'
+        movimientos.append(MovimientoInventario(
+            fecha=fecha, tipo='nota_credito' if nota else 'venta',
+            referencia_id=venta_id, kilos=kilos if nota else -kilos,
+        ))
+
+    movimientos.sort(key=lambda m: m.fecha)
+    hasta = timezone.localdate() - datetime.timedelta(days=1)
+    saldo, cortes = Decimal('0'), {}
+    for m in movimientos:
+        saldo += m.kilos
+        m.saldo = saldo
+        dia = timezone.localtime(m.fecha).date()
+        if dia <= hasta:
+            cortes[dia] = saldo
+    MovimientoInventario.objects.bulk_create(movimientos, batch_size=500)
+    CorteInventario.objects.bulk_create(
+        [CorteInventario(dia=dia, saldo=saldo) for dia, saldo in cortes.items()], batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0016_ventaitem_kilos_subtotal'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CorteInventario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField(unique=True)),
+                ('saldo', models.DecimalField(decimal_places=2, max_digits=14)),
+            ],
+            options={
+                'verbose_name': 'Corte de Inventario',
+                'verbose_name_plural': 'Cortes de Inventario',
+            },
+        ),
+        migrations.CreateModel(
+            name='MovimientoInventario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateTimeField()),
+                ('tipo', models.CharField(choices=[('importacion', 'Importación'), ('merma', 'Merma'), ('venta', 'Venta'), ('nota_credito', 'Nota crédito'), ('ajuste', 'Ajuste')], max_length=20)),
+                ('referencia_id', models.PositiveIntegerField(blank=True, null=True)),
+                ('kilos', models.DecimalField(decimal_places=2, help_text='Con signo: + entra, - sale', max_digits=12)),
+                ('saldo', models.DecimalField(decimal_places=2, help_text='Stock después de este movimiento', max_digits=14)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Movimiento de Inventario',
+                'verbose_name_plural': 'Movimientos de Inventario',
+                'indexes': [models.Index(fields=['referencia_id', 'tipo'], name='crm_movimie_referen_ef3377_idx'), models.Index(fields=['fecha', 'tipo', 'kilos'], name='crm_movimie_fecha_cffb3c_idx')],
+            },
+        ),
+        migrations.RunPython(llenar_libro, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,112 @@
+# Generated by Django 4.2.27 on 2026-10-19 16:12
+
+from decimal import Decimal
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Sum
+from django.utils import timezone
+
+
+def calcular_costo_fifo(apps, schema_editor):
+    """
+    Costo FIFO de las ventas existentes, como services_costos.reprocesar():
+    cada venta saca sus kilos (de los ítems) de los lotes más antiguos con
+    stock y ya llegados; una nota de crédito los devuelve a los lotes de los
+    que se sacó lo último.
+    """
+    Importacion = apps.get_model('crm', 'Importacion')
+    Venta = apps.get_model('crm', 'Venta')
+    ConsumoLote = apps.get_model('crm', 'ConsumoLote')
+
+    lotes = list(Importacion.objects.order_by('fecha', 'id').values(
+        'id', 'fecha', 'kilos_ingresados', 'merma_kg', 'costo_por_kg'
+    ))
+    for lote in lotes:
+        lote['neto'] = lote['disponible'] = lote['kilos_ingresados'] - lote['merma_kg']
+
+    def costo(kilos, lote):
+        return (kilos * lote['costo_por_kg']).quantize(Decimal('0.01'))
+
+    ventas = (
+        Venta.objects.annotate(kilos=Sum('items__kilos'))
+        .filter(kilos__gt=0)
+        .order_by('fecha', 'id')
+        .values_list('id', 'fecha', 'tipo_documento', 'kilos')
+    )
+    consumos, costeadas, actual = [], [], 0
+    for venta_id, fecha, tipo_documento, kilos in ventas:
+        partes = []
+        if tipo_documento == 'nota_credito':
+            for i in range(len(lotes) - 1, -1, -1):
+                lote = lotes[i]
+                vuelto = min(kilos, lote['neto'] - lote['disponible'])
+                if vuelto > 0:
+                    lote['disponible'] += vuelto
+                    kilos -= vuelto
+                    actual = min(actual, i)
+                    partes.append((lote['id'], -vuelto, -costo(vuelto, lote)))
+                if kilos <= 0:
+                    break
+            if kilos > 0:
+                partes.append((None, -kilos, Decimal('0.00')))
+        else:
+            dia = timezone.localtime(fecha).date()
+            while kilos > 0:
+                while actual < len(lotes) and lotes[actual]['disponible'] <= 0:
+                    actual += 1
+                if actual == len(lotes) or lotes[actual]['fecha'] > dia:
+                    partes.append((None, kilos, Decimal('0.00')))
+                    break
+                lote = lotes[actual]
+                sacado = min(kilos, lote['disponible'])
+                lote['disponible'] -= sacado
+                kilos -= sacado
+                partes.append((lote['id'], sacado, costo(sacado, lote)))
+        for importacion_id, kilos_parte, costo_parte in partes:
+            consumos.append(ConsumoLote(
+                venta_id=venta_id, importacion_id=importacion_id,
+                fecha=fecha, kilos=kilos_parte, costo=costo_parte,
+            ))
+        costeadas.append(Venta(pk=venta_id, costo_fifo=sum((p[2] for p in partes), Decimal('0.00'))))
+
+    ConsumoLote.objects.bulk_create(consumos, batch_size=2000)
+    Venta.objects.update(costo_fifo=Decimal('0.00'))
+    Venta.objects.bulk_update(costeadas, ['costo_fifo'], batch_size=500)
+    Importacion.objects.bulk_update(
+        [Importacion(pk=l['id'], kilos_restantes=max(l['disponible'], Decimal('0'))) for l in lotes],
+        ['kilos_restantes'],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0017_movimientoinventario'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='venta',
+            name='costo_fifo',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=14, null=True),
+        ),
+        migrations.CreateModel(
+            name='ConsumoLote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateTimeField(help_text='Fecha de la venta')),
+                ('kilos', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('costo', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('importacion', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='consumos', to='crm.importacion')),
+                ('venta', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='consumos', to='crm.venta')),
+            ],
+            options={
+                'verbose_name': 'Consumo de Lote',
+                'verbose_name_plural': 'Consumos de Lotes',
+                'indexes': [models.Index(fields=['fecha', 'venta'], name='crm_consumo_fecha_53692b_idx'), models.Index(fields=['importacion', 'fecha'], name='crm_consumo_importa_3f4e88_idx')],
+            },
+        ),
+        migrations.RunPython(calcular_costo_fifo, migrations.RunPython.noop),
+    ]
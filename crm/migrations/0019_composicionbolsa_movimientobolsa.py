@@ -0,0 +1,81 @@
+# Generated by Django 4.2.27 on 2026-10-19 16:15
+
+import datetime
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils import timezone
+
+# Lo que estaba fijo en services_inventario (SKU_BOLSAS_MAP / STOCK_INICIAL_*)
+SKU_BOLSAS = {
+    "1": (1, 0), "2": (2, 0), "3": (0, 1), "4": (3, 0),
+    "5": (1, 1), "6": (4, 0), "7": (0, 2), "8": (5, 0),
+}
+STOCK_INICIAL = {"8": 1095 - 4, "20": 862 - 8}
+
+
+def cargar_bolsas(apps, schema_editor):
+    Producto = apps.get_model('crm', 'Producto')
+    ComposicionBolsa = apps.get_model('crm', 'ComposicionBolsa')
+    MovimientoBolsa = apps.get_model('crm', 'MovimientoBolsa')
+
+    composiciones = []
+    for producto in Producto.objects.filter(sku__in=SKU_BOLSAS):
+        for tipo, cantidad in zip(("8", "20"), SKU_BOLSAS[producto.sku]):
+            if cantidad:
+                composiciones.append(ComposicionBolsa(producto=producto, tipo_bolsa=tipo, cantidad=cantidad))
+    ComposicionBolsa.objects.bulk_create(composiciones)
+
+    # El stock inicial se restaba del consumo desde el inicio del rango por
+    # defecto de la vista: el conteo queda con esa fecha
+    hoy = timezone.localdate()
+    fecha = hoy.replace(day=1) - datetime.timedelta(days=180)
+    MovimientoBolsa.objects.bulk_create([
+        MovimientoBolsa(fecha=fecha, tipo_bolsa=tipo, tipo='conteo', cantidad=cantidad,
+                        nota='Stock inicial (antes fijo en el código)')
+        for tipo, cantidad in STOCK_INICIAL.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0018_consumolote'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovimientoBolsa',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('tipo_bolsa', models.CharField(choices=[('8', 'Bolsa 8 kg'), ('20', 'Bolsa 20 kg')], max_length=5)),
+                ('tipo', models.CharField(choices=[('conteo', 'Conteo inicial'), ('compra', 'Compra'), ('merma', 'Merma'), ('ajuste', 'Ajuste')], max_length=10)),
+                ('cantidad', models.IntegerField(help_text='Con signo: + entra, - sale')),
+                ('nota', models.CharField(blank=True, max_length=200)),
+            ],
+            options={
+                'verbose_name': 'Movimiento de Bolsas',
+                'verbose_name_plural': 'Movimientos de Bolsas',
+                'indexes': [models.Index(fields=['tipo_bolsa', 'fecha'], name='crm_movimie_tipo_bo_7d0f3b_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ComposicionBolsa',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo_bolsa', models.CharField(choices=[('8', 'Bolsa 8 kg'), ('20', 'Bolsa 20 kg')], max_length=5)),
+                ('cantidad', models.PositiveIntegerField(help_text='Bolsas por unidad vendida')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bolsas', to='crm.producto')),
+            ],
+            options={
+                'verbose_name': 'Composición de Bolsas',
+                'verbose_name_plural': 'Composición de Bolsas',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='composicionbolsa',
+            constraint=models.UniqueConstraint(fields=('producto', 'tipo_bolsa'), name='uniq_composicion_bolsa'),
+        ),
+        migrations.RunPython(cargar_bolsas, migrations.RunPython.noop),
+    ]
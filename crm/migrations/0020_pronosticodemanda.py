@@ -0,0 +1,35 @@
+# Generated by Django 4.2.27 on 2026-10-19 16:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0019_composicionbolsa_movimientobolsa'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PronosticoDemanda',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ventana_dias', models.PositiveIntegerField(unique=True)),
+                ('calculado_en', models.DateTimeField()),
+                ('dia_base', models.DateField(help_text='Último día observado; el pronóstico parte al día siguiente')),
+                ('metodo', models.CharField(max_length=30)),
+                ('parametros', models.JSONField(blank=True, default=dict)),
+                ('kilos_ventana', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('pronostico', models.JSONField(default=list, help_text='Kilos por día desde dia_base + 1')),
+                ('consumo_diario', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('stock_kg', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('fecha_quiebre', models.DateField(blank=True, null=True)),
+                ('fecha_orden', models.DateField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Pronóstico de Demanda',
+                'verbose_name_plural': 'Pronósticos de Demanda',
+                'ordering': ['ventana_dias'],
+            },
+        ),
+    ]
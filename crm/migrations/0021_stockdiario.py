@@ -0,0 +1,28 @@
+# Generated by Django 4.2.27 on 2026-10-19 16:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0020_pronosticodemanda'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField(unique=True)),
+                ('kilos', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('bolsas_8', models.IntegerField(default=0)),
+                ('bolsas_20', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Stock Diario',
+                'verbose_name_plural': 'Stock Diario',
+                'ordering': ['dia'],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.27 on 2026-10-19 16:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0021_stockdiario'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CambioVentas',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('desde', models.DateField()),
+                ('creado_en', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Cambio de Ventas',
+                'verbose_name_plural': 'Cambios de Ventas',
+            },
+        ),
+    ]
@@ -2,10 +2,12 @@
 from decimal import Decimal
 
 from django.db import models, transaction
-from django.db.models import Sum, F, DecimalField, ExpressionWrapper
+from django.db.models import Sum
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 
+from . import dinero
+
 
 class Cliente(models.Model):
     nombre = models.CharField(max_length=120)
@@ -16,6 +18,18 @@ class Cliente(models.Model):
     observaciones = models.TextField(blank=True)
     creado_en = models.DateTimeField(auto_now_add=True)
 
+    # Primera compra (sin notas de crédito). Se mantiene desde las señales
+    # de Venta; `recalcular_primeras_compras` la reconstruye.
+    primera_compra = models.DateTimeField(null=True, blank=True, editable=False)
+    primera_venta = models.ForeignKey(
+        "Venta",
+        null=True,
+        blank=True,
+        editable=False,
+        on_delete=models.SET_NULL,
+        related_name="+",
+    )
+
     # ✅ NUEVO: Meta con índices
     class Meta:
         verbose_name = "Cliente"
@@ -25,6 +39,7 @@ class Cliente(models.Model):
             models.Index(fields=['email']),
             models.Index(fields=['nombre']),
             models.Index(fields=['-creado_en']),
+            models.Index(fields=['primera_compra']),
         ]
 
     @property
@@ -99,6 +114,13 @@ class Venta(models.Model):
     )
     numero_documento = models.CharField(max_length=30, blank=True, db_index=True)
 
+    # Costo FIFO de los kilos vendidos (services_costos; vacío = aún sin calcular)
+    costo_fifo = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True, editable=False)
+
+    # Despacho: día comprometido de entrega (vacío = retiro / sin despacho)
+    fecha_entrega = models.DateField(null=True, blank=True)
+    entregada = models.BooleanField(default=False)
+
     # ✅ NUEVO: Meta con índices
     class Meta:
         verbose_name = "Venta"
@@ -115,17 +137,14 @@ class Venta(models.Model):
             models.Index(fields=['tipo_documento', 'fecha']),
             models.Index(fields=['-fecha']),
             models.Index(fields=['cliente', '-fecha']),
+            models.Index(fields=['entregada', 'fecha_entrega']),
         ]
 
     def __str__(self):
         return f"Venta #{self.id} - {self.cliente}"
 
     def recalcular_monto_total(self, guardar=True):
-        expr = ExpressionWrapper(
-            F("cantidad") * F("precio_unitario"),
-            output_field=DecimalField(max_digits=12, decimal_places=2),
-        )
-        total_items = self.items.aggregate(s=Sum(expr))["s"] or Decimal("0.00")
+        total_items = self.items.aggregate(s=Sum("subtotal"))["s"] or Decimal("0.00")
         self.monto_total = total_items
         if guardar:
             self.save(update_fields=["monto_total"])
@@ -133,15 +152,16 @@ class Venta(models.Model):
 
     @property
     def monto_neto(self):
-        total = self.monto_total or Decimal("0")
-        return (total / Decimal("1.19")).quantize(Decimal("0.01"))
+        return dinero.a_decimal(dinero.neto_de_bruto(dinero.a_centavos(self.monto_total)))
 
     @property
     def iva(self):
-        return (self.monto_total - self.monto_neto).quantize(Decimal("0.01"))
+        return dinero.a_decimal(dinero.iva_de_bruto(dinero.a_centavos(self.monto_total)))
 
     @property
     def costo_estimado(self):
+        if self.costo_fifo is not None:
+            return self.costo_fifo
         from .services import costo_promedio_kg
         cpk = costo_promedio_kg() or Decimal("0")
         kilos = self.kilos_total or Decimal("0")
@@ -160,11 +180,7 @@ class Venta(models.Model):
 
     @property
     def kilos_calculados(self):
-        total = Decimal("0.00")
-        for it in self.items.select_related("producto"):
-            peso = it.producto.peso_kg or Decimal("0")
-            total += it.cantidad * peso
-        return total
+        return self.items.aggregate(s=Sum("kilos"))["s"] or Decimal("0.00")
 
 
 class VentaItem(models.Model):
@@ -173,18 +189,82 @@ class VentaItem(models.Model):
     cantidad = models.PositiveIntegerField(default=1)
     precio_unitario = models.DecimalField(max_digits=12, decimal_places=2)
 
+    # Calculados al guardar (kilos se recalcula en bloque si cambia Producto.peso_kg)
+    kilos = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+
     # ✅ NUEVO: Meta con índices
     class Meta:
         verbose_name = "Item de Venta"
         verbose_name_plural = "Items de Venta"
         indexes = [
-            models.Index(fields=['venta', 'producto']),
+            # Cubre las sumas de kilos por venta y por producto sin leer la tabla
+            models.Index(fields=['venta', 'producto', 'kilos']),
             models.Index(fields=['producto']),
         ]
 
-    @property
-    def subtotal(self):
-        return self.cantidad * self.precio_unitario
+    def calcular_totales(self):
+        peso = self.producto.peso_kg or Decimal("0")
+        self.kilos = self.cantidad * peso
+        self.subtotal = self.cantidad * self.precio_unitario
+
+    def save(self, *args, **kwargs):
+        self.calcular_totales()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = set(update_fields) | {"kilos", "subtotal"}
+        super().save(*args, **kwargs)
+
+
+class VentaDiaria(models.Model):
+    """
+    Hechos diarios de ventas por (día local, canal, tipo de documento).
+    Se mantiene desde las señales de Venta (ver services_ventas_diarias) y
+    se reconstruye con `reconstruir_ventas_diarias`. Alimenta el dashboard.
+    """
+    dia = models.DateField()
+    canal = models.CharField(max_length=20, choices=Venta.Canal.choices)
+    tipo_documento = models.CharField(max_length=20, choices=Venta.TipoDocumento.choices)
+
+    cantidad = models.PositiveIntegerField(default=0)
+    monto = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    kilos = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    # Clientes cuya primera compra (sin notas de crédito) es de este grupo,
+    # y el monto de sus compras de ese primer día
+    primeras_compras = models.PositiveIntegerField(default=0)
+    monto_primeras = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = "Venta Diaria"
+        verbose_name_plural = "Ventas Diarias"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["dia", "canal", "tipo_documento"],
+                name="uniq_venta_diaria",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.dia} {self.canal}/{self.tipo_documento}: {self.cantidad} ventas"
+
+
+class CambioVentas(models.Model):
+    """
+    Desde qué día cambiaron las ventas (una fila por recálculo de
+    VentaDiaria). Con la analítica en memoria activa, cada proceso lee
+    las filas nuevas para recargar sólo la cola de sus columnas (ver
+    services_analitica). Se borran las más antiguas que RETENCION.
+    """
+    desde = models.DateField()
+    creado_en = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = "Cambio de Ventas"
+        verbose_name_plural = "Cambios de Ventas"
+
+    def __str__(self):
+        return f"#{self.id} desde {self.desde}"
 
 
 class Importacion(models.Model):
@@ -276,8 +356,8 @@ class Importacion(models.Model):
         
         self.costo_por_kg = (self.costo_total / kilos_netos).quantize(Decimal("0.01"))
         
-        # ✅ SIMPLIFICADO: kilos_restantes siempre es kilos_netos
-        # (el descuento de ventas se hace a nivel agregado en la vista)
+        # kilos_restantes lo descuenta el FIFO de costos (services_costos)
+        # al registrar ventas; aquí sólo se ajusta por el cambio de netos
         if not self.pk:
             # Nueva importación
             self.kilos_restantes = kilos_netos
@@ -303,6 +383,182 @@ class Importacion(models.Model):
         super().save(*args, **kwargs)
 
 
+class MovimientoInventario(models.Model):
+    """
+    Libro de inventario (kilos): una fila por entrada o salida, con el
+    saldo acumulado en orden de registro. Se escribe desde
+    services_inventario; no se edita a mano (las correcciones son
+    movimientos compensatorios).
+    """
+    class Tipo(models.TextChoices):
+        IMPORTACION = "importacion", "Importación"
+        MERMA = "merma", "Merma"
+        VENTA = "venta", "Venta"
+        NOTA_CREDITO = "nota_credito", "Nota crédito"
+        AJUSTE = "ajuste", "Ajuste"
+
+    fecha = models.DateTimeField()
+    tipo = models.CharField(max_length=20, choices=Tipo.choices)
+    # Importacion (importación / merma) o Venta (venta / nota de crédito)
+    referencia_id = models.PositiveIntegerField(null=True, blank=True)
+
+    kilos = models.DecimalField(max_digits=12, decimal_places=2, help_text="Con signo: + entra, - sale")
+    saldo = models.DecimalField(max_digits=14, decimal_places=2, help_text="Stock después de este movimiento")
+    creado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Movimiento de Inventario"
+        verbose_name_plural = "Movimientos de Inventario"
+        indexes = [
+            models.Index(fields=['referencia_id', 'tipo']),
+            models.Index(fields=['fecha', 'tipo', 'kilos']),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha:%Y-%m-%d} {self.get_tipo_display()} {self.kilos:+} kg (saldo {self.saldo})"
+
+
+class CorteInventario(models.Model):
+    """Stock al cierre de un día (movimientos con fecha local <= dia)"""
+    dia = models.DateField(unique=True)
+    saldo = models.DecimalField(max_digits=14, decimal_places=2)
+
+    class Meta:
+        verbose_name = "Corte de Inventario"
+        verbose_name_plural = "Cortes de Inventario"
+
+    def __str__(self):
+        return f"{self.dia}: {self.saldo} kg"
+
+
+class StockDiario(models.Model):
+    """
+    Stock al cierre de cada día (todos los días, también los sin
+    movimientos): kilos y bolsas de empaque. Para gráficos históricos;
+    lo llena services_inventario.rellenar_stock_diario y se invalida
+    desde el día más antiguo que cambie.
+    """
+    dia = models.DateField(unique=True)
+    kilos = models.DecimalField(max_digits=14, decimal_places=2)
+    bolsas_8 = models.IntegerField(default=0)
+    bolsas_20 = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Stock Diario"
+        verbose_name_plural = "Stock Diario"
+        ordering = ["dia"]
+
+    def __str__(self):
+        return f"{self.dia}: {self.kilos} kg, {self.bolsas_8} × 8 kg, {self.bolsas_20} × 20 kg"
+
+
+class ConsumoLote(models.Model):
+    """
+    Kilos de una venta consumidos de una importación (FIFO), con su costo.
+    importacion vacía = vendido sin stock disponible (costo 0). En notas de
+    crédito kilos y costo son negativos: lo devuelto vuelve al lote.
+    Lo escribe services_costos; se rehace desde la primera venta afectada.
+    """
+    venta = models.ForeignKey(Venta, on_delete=models.CASCADE, related_name="consumos")
+    importacion = models.ForeignKey(
+        Importacion, on_delete=models.CASCADE, null=True, blank=True, related_name="consumos"
+    )
+    fecha = models.DateTimeField(help_text="Fecha de la venta")
+    kilos = models.DecimalField(max_digits=12, decimal_places=2)
+    costo = models.DecimalField(max_digits=14, decimal_places=2)
+
+    class Meta:
+        verbose_name = "Consumo de Lote"
+        verbose_name_plural = "Consumos de Lotes"
+        indexes = [
+            models.Index(fields=['fecha', 'venta']),
+            models.Index(fields=['importacion', 'fecha']),
+        ]
+
+    def __str__(self):
+        return f"Venta #{self.venta_id}: {self.kilos} kg de {self.importacion_id or 'sin lote'}"
+
+
+class PronosticoDemanda(models.Model):
+    """
+    Pronóstico de kilos vendidos por día ajustado con los últimos
+    `ventana_dias` días, y el plan de reposición que resultaba con el
+    stock del momento. Lo calcula services_pronostico (comando
+    calcular_pronostico); una fila por ventana.
+    """
+    ventana_dias = models.PositiveIntegerField(unique=True)
+    calculado_en = models.DateTimeField()
+    dia_base = models.DateField(help_text="Último día observado; el pronóstico parte al día siguiente")
+    metodo = models.CharField(max_length=30)
+    parametros = models.JSONField(default=dict, blank=True)
+
+    kilos_ventana = models.DecimalField(max_digits=12, decimal_places=2)
+    pronostico = models.JSONField(default=list, help_text="Kilos por día desde dia_base + 1")
+    consumo_diario = models.DecimalField(max_digits=10, decimal_places=2)
+
+    stock_kg = models.DecimalField(max_digits=14, decimal_places=2)
+    fecha_quiebre = models.DateField(null=True, blank=True)
+    fecha_orden = models.DateField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Pronóstico de Demanda"
+        verbose_name_plural = "Pronósticos de Demanda"
+        ordering = ["ventana_dias"]
+
+    def __str__(self):
+        return f"{self.ventana_dias} días ({self.metodo}): {self.consumo_diario} kg/día"
+
+
+class ComposicionBolsa(models.Model):
+    """Bolsas de empaque que lleva una unidad de un producto"""
+    class TipoBolsa(models.TextChoices):
+        KG8 = "8", "Bolsa 8 kg"
+        KG20 = "20", "Bolsa 20 kg"
+
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name="bolsas")
+    tipo_bolsa = models.CharField(max_length=5, choices=TipoBolsa.choices)
+    cantidad = models.PositiveIntegerField(help_text="Bolsas por unidad vendida")
+
+    class Meta:
+        verbose_name = "Composición de Bolsas"
+        verbose_name_plural = "Composición de Bolsas"
+        constraints = [
+            models.UniqueConstraint(fields=['producto', 'tipo_bolsa'], name='uniq_composicion_bolsa'),
+        ]
+
+    def __str__(self):
+        return f"{self.producto.sku}: {self.cantidad} × {self.get_tipo_bolsa_display()}"
+
+
+class MovimientoBolsa(models.Model):
+    """
+    Libro de bolsas: conteos, compras, mermas y ajustes. El consumo por
+    ventas no se guarda aquí; sale de VentaItem × ComposicionBolsa desde
+    el primer movimiento de cada tipo (ver services_inventario.consumo_bolsas).
+    """
+    class Tipo(models.TextChoices):
+        CONTEO = "conteo", "Conteo inicial"
+        COMPRA = "compra", "Compra"
+        MERMA = "merma", "Merma"
+        AJUSTE = "ajuste", "Ajuste"
+
+    fecha = models.DateField()
+    tipo_bolsa = models.CharField(max_length=5, choices=ComposicionBolsa.TipoBolsa.choices)
+    tipo = models.CharField(max_length=10, choices=Tipo.choices)
+    cantidad = models.IntegerField(help_text="Con signo: + entra, - sale")
+    nota = models.CharField(max_length=200, blank=True)
+
+    class Meta:
+        verbose_name = "Movimiento de Bolsas"
+        verbose_name_plural = "Movimientos de Bolsas"
+        indexes = [
+            models.Index(fields=['tipo_bolsa', 'fecha']),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} {self.get_tipo_display()} {self.cantidad:+} × {self.get_tipo_bolsa_display()}"
+
+
 class GastoOperacional(models.Model):
     class Tipo(models.TextChoices):
         ARRIENDO = "arriendo", "Arriendo"
@@ -342,7 +598,7 @@ class GastoOperacional(models.Model):
     def iva(self):
         if not self.aplica_iva:
             return Decimal("0.00")
-        return (self.monto_neto * Decimal("0.19")).quantize(Decimal("0.01"))
+        return dinero.a_decimal(dinero.iva_de_neto(dinero.a_centavos(self.monto_neto)))
 
     @property
     def total_con_iva(self):
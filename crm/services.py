@@ -1,8 +1,8 @@
 # crm/services.py
 from django.utils import timezone
-from django.db.models import Sum, Max, Count
+from django.db.models import Sum, Max, Count, OuterRef, Subquery, F, Value, DecimalField
 from decimal import Decimal
-from .models import Venta, Importacion
+from .models import Cliente, Venta, VentaItem, Importacion
 
 
 def segmentar_cliente(c):
@@ -74,4 +74,54 @@ def costo_promedio_kg():
         costo = imp.costo_por_kg or Decimal("0")
         valor_total += kilos * costo
 
-    return (valor_total / total_kilos).quantize(Decimal("0.01"))
\ No newline at end of file
+    return (valor_total / total_kilos).quantize(Decimal("0.01"))
+
+def _primeras_ventas():
+    """Ventas sin notas de crédito, de la más antigua a la más reciente"""
+    return (
+        Venta.objects
+        .exclude(tipo_documento=Venta.TipoDocumento.NOTA_CREDITO)
+        .order_by("fecha", "id")
+    )
+
+
+def actualizar_primera_compra(cliente_ids):
+    """
+    Recalcula Cliente.primera_compra / primera_venta de esos clientes.
+    Cada cliente cuesta una búsqueda por el índice (cliente, fecha).
+    """
+    for cliente_id in {c for c in cliente_ids if c is not None}:
+        primera = _primeras_ventas().filter(cliente_id=cliente_id).values("id", "fecha").first()
+        Cliente.objects.filter(pk=cliente_id).update(
+            primera_venta_id=primera["id"] if primera else None,
+            primera_compra=primera["fecha"] if primera else None,
+        )
+
+
+def recalcular_primeras_compras():
+    """
+    Reconstruye primera_compra / primera_venta de todos los clientes
+    en un solo UPDATE.
+
+    Returns:
+        int: clientes actualizados
+    """
+    primeras = _primeras_ventas().filter(cliente_id=OuterRef("pk"))
+    return Cliente.objects.update(
+        primera_venta_id=Subquery(primeras.values("id")[:1]),
+        primera_compra=Subquery(primeras.values("fecha")[:1]),
+    )
+
+
+def recalcular_kilos_producto(producto):
+    """
+    Recalcula VentaItem.kilos de todos los ítems del producto en un solo
+    UPDATE (se llama cuando cambia Producto.peso_kg).
+
+    Returns:
+        int: ítems actualizados
+    """
+    peso = producto.peso_kg or Decimal("0")
+    return VentaItem.objects.filter(producto_id=producto.pk).update(
+        kilos=F("cantidad") * Value(peso, output_field=DecimalField(max_digits=6, decimal_places=2))
+    )
@@ -0,0 +1,215 @@
+# crm/services_analitica.py
+"""
+Resúmenes de ventas por intervalo de días, canal y tipo de documento
+(dashboard, balance).
+
+Por defecto salen de VentaDiaria. Con settings.CRM_ANALITICA_EN_MEMORIA
+cada proceso mantiene las ventas en columnas (crm.analitica): se cargan
+una vez y después, si hay filas nuevas en CambioVentas (las escribe
+services_ventas_diarias al recalcular días), se recorta y recarga sólo
+desde el día más antiguo que cambió. Los dos caminos dan los mismos
+totales, en centavos.
+
+Dentro de una transacción se usa siempre VentaDiaria: el almacén sólo
+refleja datos confirmados.
+"""
+import datetime
+import logging
+import threading
+from bisect import bisect_right
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, Max, Min
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import dinero, services_inventario
+from .analitica import AlmacenVentas, Totales, sumar
+from .models import CambioVentas, Cliente, Venta, VentaDiaria
+
+logger = logging.getLogger(__name__)
+
+# Antigüedad desde la que se borran filas de CambioVentas; un proceso
+# que no se sincroniza hace más que esto recarga todo
+RETENCION = datetime.timedelta(days=1)
+
+NOTA_CREDITO = Venta.TipoDocumento.NOTA_CREDITO
+
+_lock = threading.Lock()
+_estado = {'almacen': None, 'ultimo_cambio': 0, 'sincronizado_en': None}
+
+
+def activa():
+    return getattr(settings, 'CRM_ANALITICA_EN_MEMORIA', False)
+
+
+def _en_memoria():
+    return activa() and not connection.in_atomic_block
+
+
+def registrar_cambio(desde):
+    """Anota que las ventas cambiaron desde `desde` (no hace nada sin la analítica en memoria)"""
+    if not activa() or desde is None:
+        return
+    cambio = CambioVentas.objects.create(desde=desde)
+    # Nunca se borra la última: los ids no deben reutilizarse
+    CambioVentas.objects.filter(creado_en__lt=cambio.creado_en - RETENCION).exclude(pk=cambio.pk).delete()
+
+
+def reiniciar():
+    """Descarta el almacén del proceso (se recarga en la próxima consulta)"""
+    with _lock:
+        _estado.update(almacen=None, ultimo_cambio=0, sincronizado_en=None)
+
+
+def _filas(ventas):
+    """Ventas → filas de AlmacenVentas.agregar, ordenadas por fecha"""
+    filas = (
+        ventas
+        .annotate(
+            dia=TruncDate('fecha'),
+            dia_primera=TruncDate('cliente__primera_compra'),
+            monto_c=dinero.Centavos('monto_total'),
+            kilos_c=dinero.Centavos('kilos_total'),
+        )
+        .order_by('fecha', 'id')
+        .values_list(
+            'id', 'dia', 'canal', 'tipo_documento', 'cliente_id', 'monto_c', 'kilos_c',
+            'cliente__primera_venta_id', 'dia_primera',
+        )
+    )
+    # Como services_ventas_diarias._filas: primera venta del cliente (de
+    # cualquier tipo) y monto del día de su primera compra (sin notas de crédito)
+    for venta_id, dia, canal, tipo, cliente, monto, kilos, primera_venta, dia_primera in filas.iterator(chunk_size=2000):
+        en_dia_primera = dia == dia_primera and tipo != NOTA_CREDITO
+        yield (
+            dia.toordinal(), canal, tipo, cliente, monto, kilos,
+            int(primera_venta == venta_id), monto if en_dia_primera else 0,
+        )
+
+
+def almacen():
+    """AlmacenVentas del proceso, al día con lo confirmado"""
+    with _lock:
+        ahora = timezone.now()
+        # El registro de cambios se lee antes que las ventas: lo que se
+        # confirme entre ambas lecturas se vuelve a cargar la próxima vez
+        cambios = CambioVentas.objects.filter(id__gt=_estado['ultimo_cambio']).aggregate(
+            desde=Min('desde'), ultimo=Max('id'),
+        )
+        almacen = _estado['almacen']
+        if almacen is None or ahora - _estado['sincronizado_en'] > RETENCION:
+            almacen = AlmacenVentas()
+            almacen.agregar(_filas(Venta.objects.all()))
+            logger.info(f"Analítica en memoria: {len(almacen)} ventas cargadas")
+        elif cambios['desde'] is not None:
+            almacen.recortar(cambios['desde'].toordinal())
+            almacen.agregar(_filas(
+                Venta.objects.filter(fecha__gte=services_inventario._inicio_dia(cambios['desde']))
+            ))
+        _estado.update(
+            almacen=almacen,
+            ultimo_cambio=cambios['ultimo'] or _estado['ultimo_cambio'],
+            sincronizado_en=ahora,
+        )
+        return almacen
+
+
+def cortes_mensuales(desde, hasta):
+    """Límites de [desde, hasta] partido por mes calendario"""
+    cortes = [desde]
+    mes = desde.replace(day=1)
+    while True:
+        mes = (mes + datetime.timedelta(days=32)).replace(day=1)
+        if mes > hasta:
+            break
+        cortes.append(mes)
+    cortes.append(hasta + datetime.timedelta(days=1))
+    return cortes
+
+
+def cortes_diarios(desde, hasta):
+    return [desde + datetime.timedelta(days=i) for i in range((hasta - desde).days + 2)]
+
+
+def resumen(cortes):
+    """
+    Totales de ventas por intervalo [cortes[k], cortes[k + 1]) de días
+    locales, canal y tipo de documento (sólo los grupos con ventas).
+
+    Returns:
+        dict: {(k, canal, tipo_documento): analitica.Totales}
+    """
+    if _en_memoria():
+        return almacen().resumen([c.toordinal() for c in cortes])
+
+    filas = (
+        VentaDiaria.objects
+        .filter(dia__gte=cortes[0], dia__lt=cortes[-1])
+        .annotate(
+            monto_c=dinero.Centavos('monto'),
+            kilos_c=dinero.Centavos('kilos'),
+            monto_primeras_c=dinero.Centavos('monto_primeras'),
+        )
+        .values_list('dia', 'canal', 'tipo_documento', 'cantidad', 'monto_c', 'kilos_c',
+                     'primeras_compras', 'monto_primeras_c')
+    )
+    sumas = {}
+    for dia, canal, tipo, *valores in filas:
+        clave = (bisect_right(cortes, dia) - 1, canal, tipo)
+        suma = sumas.get(clave)
+        if suma is None:
+            sumas[clave] = valores
+        else:
+            for i, valor in enumerate(valores):
+                suma[i] += valor
+    return {clave: Totales(*suma) for clave, suma in sumas.items()}
+
+
+def agrupar(resumen, clave, sin_nc=False):
+    """
+    Suma un resumen por clave(k, canal, tipo_documento); con sin_nc=True
+    sin las notas de crédito.
+
+    Returns:
+        dict: {clave: analitica.Totales}
+    """
+    salida = {}
+    for (k, canal, tipo), totales in resumen.items():
+        if sin_nc and tipo == NOTA_CREDITO:
+            continue
+        c = clave(k, canal, tipo)
+        salida[c] = sumar(salida[c], totales) if c in salida else totales
+    return salida
+
+
+def top_clientes(desde, hasta, n=10):
+    """
+    Clientes con más ventas (sin notas de crédito) en los días [desde, hasta].
+
+    Returns:
+        list[dict]: cliente_id, nombre, monto (Decimal), ventas
+    """
+    if _en_memoria():
+        filas = almacen().top_clientes(
+            desde.toordinal(), hasta.toordinal() + 1, n, excluir_tipos={NOTA_CREDITO},
+        )
+    else:
+        filas = list(
+            Venta.objects
+            .filter(
+                fecha__gte=services_inventario._inicio_dia(desde),
+                fecha__lt=services_inventario._inicio_dia(hasta + datetime.timedelta(days=1)),
+            )
+            .exclude(tipo_documento=NOTA_CREDITO)
+            .values('cliente_id')
+            .annotate(monto=dinero.SumaCentavos('monto_total'), ventas=Count('id'))
+            .order_by('-monto', 'cliente_id')
+            .values_list('cliente_id', 'monto', 'ventas')[:n]
+        )
+    nombres = dict(Cliente.objects.filter(id__in=[f[0] for f in filas]).values_list('id', 'nombre'))
+    return [
+        {'cliente_id': c, 'nombre': nombres.get(c, ''), 'monto': dinero.a_decimal(monto), 'ventas': ventas}
+        for c, monto, ventas in filas
+    ]
@@ -1,10 +1,198 @@
 # crm/services_balance.py
+"""
+Balance mensual / anual. Los montos se agregan y operan como enteros de
+centavos (ver crm.dinero) y se pasan a Decimal sólo al armar el
+resultado; un año completo son 4 consultas agrupadas por mes.
+"""
+import datetime
 from decimal import Decimal
-from datetime import date, datetime
-from dateutil.relativedelta import relativedelta
-from django.db.models import Sum, Q, F, DecimalField, ExpressionWrapper
-from django.db.models.functions import TruncMonth
-from .models import Venta, Importacion, GastoOperacional
+
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from . import dinero, services_analitica
+from .dinero import a_decimal
+from .models import ConsumoLote, GastoOperacional, Importacion, Venta
+
+MESES_ES = ['Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio',
+            'Julio', 'Agosto', 'Septiembre', 'Octubre', 'Noviembre', 'Diciembre']
+
+
+def _inicio_mes(anio, mes):
+    if mes == 13:
+        anio, mes = anio + 1, 1
+    return datetime.date(anio, mes, 1)
+
+
+def _datos_meses(anio, meses):
+    """
+    Centavos por mes (ventas por canal, CMV FIFO, gastos por tipo con su
+    IVA documento a documento). Las ventas salen de
+    services_analitica.resumen; CMV y gastos se recorren una vez en el
+    rango del período, con una suma filtrada por mes (FILTER) en vez de
+    agrupar por una fecha truncada, que en SQLite se evalúa fila a fila
+    en Python.
+    """
+    def aware(dia):
+        return timezone.make_aware(datetime.datetime.combine(dia, datetime.time.min))
+
+    limites = {mes: (_inicio_mes(anio, mes), _inicio_mes(anio, mes + 1)) for mes in meses}
+    desde, hasta = min(l[0] for l in limites.values()), max(l[1] for l in limites.values())
+
+    def en_mes(campo, convertir=lambda dia: dia):
+        return {
+            mes: Q(**{f'{campo}__gte': convertir(a), f'{campo}__lt': convertir(b)})
+            for mes, (a, b) in limites.items()
+        }
+
+    datos = {
+        mes: {
+            'bruto': 0,
+            'num_ventas': 0,
+            'kilos': Decimal('0.00'),
+            'por_canal': {codigo: 0 for codigo in Venta.Canal.values},
+            'cmv': 0,
+            'kilos_cmv': 0,
+            'costo_importaciones_kg': 0,
+            'gastos': {codigo: {'neto': 0, 'iva': 0, 'cantidad': 0} for codigo in GastoOperacional.Tipo.values},
+        }
+        for mes in meses
+    }
+
+    # Ventas por mes y canal: VentaDiaria o la analítica en memoria
+    # (días locales; ver services_analitica)
+    cortes = [limites[mes][0] for mes in meses] + [hasta]
+    for (k, canal, _), t in services_analitica.resumen(cortes).items():
+        d = datos[meses[k]]
+        d['bruto'] += t.monto
+        d['num_ventas'] += t.cantidad
+        d['kilos'] += a_decimal(t.kilos)
+        d['por_canal'][canal] += t.monto
+
+    por_mes = {}
+    for mes, q in en_mes('fecha', aware).items():
+        por_mes[f'costo_{mes}'] = dinero.SumaCentavos('costo', filter=q)
+        por_mes[f'kilos_{mes}'] = dinero.SumaCentavos('kilos', filter=q)  # centésimas de kg
+    cmv = ConsumoLote.objects.filter(fecha__gte=aware(desde), fecha__lt=aware(hasta)).aggregate(**por_mes)
+    for mes, d in datos.items():
+        d['cmv'], d['kilos_cmv'] = cmv[f'costo_{mes}'], cmv[f'kilos_{mes}']
+
+    # Meses sin consumos: costo por kg ponderado de las importaciones
+    # activas llegadas hasta fin de mes (pocas filas, una consulta)
+    sin_consumo = [mes for mes, d in datos.items() if not d['kilos_cmv']]
+    if sin_consumo:
+        importaciones = list(
+            Importacion.objects.filter(activo=True, fecha__lt=hasta)
+            .annotate(costo_c=dinero.Centavos('costo_total'))
+            .values_list('fecha', 'costo_c', 'kilos_ingresados', 'merma_kg')
+        )
+        for mes in sin_consumo:
+            costo, kilos = 0, 0
+            for fecha, costo_c, ingresados, merma in importaciones:
+                if fecha < limites[mes][1]:
+                    costo += costo_c
+                    kilos += dinero.a_centavos(ingresados - merma)  # centésimas de kg
+            if kilos > 0:
+                datos[mes]['costo_importaciones_kg'] = dinero.dividir(costo * dinero.CENTAVOS, kilos)
+
+    gastos = GastoOperacional.objects.filter(fecha__gte=desde, fecha__lt=hasta)
+    por_mes = {}
+    for mes, q in en_mes('fecha').items():
+        por_mes[f'neto_{mes}'] = dinero.SumaCentavos('monto_neto', filter=q)
+        por_mes[f'n_{mes}'] = Count('id', filter=q)
+    for r in gastos.values('tipo').annotate(**por_mes).order_by():
+        for mes, d in datos.items():
+            g = d['gastos'][r['tipo']]
+            g['neto'], g['cantidad'] = r[f'neto_{mes}'], r[f'n_{mes}']
+    # El IVA se redondea por documento (como GastoOperacional.iva)
+    for fecha, tipo, neto in (
+        gastos.filter(aplica_iva=True).annotate(neto_c=dinero.Centavos('monto_neto'))
+        .values_list('fecha', 'tipo', 'neto_c')
+    ):
+        datos[fecha.month]['gastos'][tipo]['iva'] += dinero.iva_de_neto(neto)
+    return datos
+
+
+def _resultado(d):
+    """Totales y utilidades del mes en centavos"""
+    neto = dinero.neto_de_bruto(d['bruto'])
+    gastos_neto = sum(g['neto'] for g in d['gastos'].values())
+    gastos_iva = sum(g['iva'] for g in d['gastos'].values())
+    utilidad_bruta = neto - d['cmv']
+    utilidad_operacional = utilidad_bruta - gastos_neto
+    # La utilidad neta considera también el IVA (es la utilidad real después de impuestos)
+    # En Chile, el IVA es un impuesto que se paga/recupera, pero afecta el flujo de caja
+    utilidad_neta = utilidad_operacional - gastos_iva
+    return {
+        'bruto': d['bruto'],
+        'neto': neto,
+        'cmv': d['cmv'],
+        'gastos_neto': gastos_neto,
+        'gastos_iva': gastos_iva,
+        'utilidad_bruta': utilidad_bruta,
+        'utilidad_operacional': utilidad_operacional,
+        'utilidad_neta': utilidad_neta,
+    }
+
+
+def _balance_mes(anio, mes, d):
+    r = _resultado(d)
+    nombres_canal = dict(Venta.Canal.choices)
+    nombres_tipo = dict(GastoOperacional.Tipo.choices)
+
+    ingresos = {
+        'total_bruto': a_decimal(r['bruto']),
+        'total_neto': a_decimal(r['neto']),
+        'iva': a_decimal(r['bruto'] - r['neto']),
+        'kilos_vendidos': d['kilos'],
+        'num_ventas': d['num_ventas'],
+        'ticket_promedio': a_decimal(dinero.dividir(r['bruto'], d['num_ventas']) if d['num_ventas'] else 0),
+        'por_canal': {nombres_canal[c]: a_decimal(v) for c, v in d['por_canal'].items()},
+    }
+
+    # CMV FIFO precalculado por venta (ConsumoLote, ver services_costos);
+    # sin ventas, el costo promedio de las importaciones activas
+    if d['kilos_cmv'] > 0:
+        costo_promedio_kg = dinero.dividir(d['cmv'] * dinero.CENTAVOS, d['kilos_cmv'])
+    else:
+        costo_promedio_kg = d['costo_importaciones_kg']
+    costos = {
+        'cmv': a_decimal(r['cmv']),
+        'costo_promedio_kg': a_decimal(costo_promedio_kg),
+        'kilos_vendidos': d['kilos'],
+    }
+
+    gastos = {
+        'total_neto': a_decimal(r['gastos_neto']),
+        'total_iva': a_decimal(r['gastos_iva']),
+        'total': a_decimal(r['gastos_neto'] + r['gastos_iva']),
+        'por_tipo': {
+            nombres_tipo[t]: {
+                'neto': a_decimal(g['neto']),
+                'iva': a_decimal(g['iva']),
+                'total': a_decimal(g['neto'] + g['iva']),
+                'cantidad': g['cantidad'],
+            }
+            for t, g in d['gastos'].items()
+        },
+    }
+
+    return {
+        'periodo': {
+            'anio': anio,
+            'mes': mes,
+            'mes_nombre': MESES_ES[mes - 1],
+        },
+        'ingresos': ingresos,
+        'costos': costos,
+        'gastos': gastos,
+        'utilidad_bruta': a_decimal(r['utilidad_bruta']),
+        'utilidad_operacional': a_decimal(r['utilidad_operacional']),
+        'utilidad_neta': a_decimal(r['utilidad_neta']),
+        'margen_bruto_pct': a_decimal(dinero.porcentaje(r['utilidad_bruta'], r['neto'])),
+        'margen_operacional_pct': a_decimal(dinero.porcentaje(r['utilidad_operacional'], r['neto'])),
+        'margen_neto_pct': a_decimal(dinero.porcentaje(r['utilidad_neta'], r['neto'])),
+    }
 
 
 def calcular_balance_mensual(anio, mes):
@@ -26,163 +214,7 @@ def calcular_balance_mensual(anio, mes):
             'margen_neto_pct': Decimal,
         }
     """
-    # Crear fecha de inicio y fin del mes
-    fecha_inicio = date(anio, mes, 1)
-    if mes == 12:
-        fecha_fin = date(anio + 1, 1, 1)
-    else:
-        fecha_fin = date(anio, mes + 1, 1)
-    
-    # === INGRESOS ===
-    ventas = Venta.objects.filter(
-        fecha__gte=fecha_inicio,
-        fecha__lt=fecha_fin
-    )
-    
-    total_ventas_bruto = ventas.aggregate(
-        total=Sum('monto_total')
-    )['total'] or Decimal('0.00')
-    
-    # Calcular neto e IVA
-    total_ventas_neto = (total_ventas_bruto / Decimal('1.19')).quantize(Decimal('0.01'))
-    iva_ventas = (total_ventas_bruto - total_ventas_neto).quantize(Decimal('0.01'))
-    
-    kilos_vendidos = ventas.aggregate(
-        total=Sum('kilos_total')
-    )['total'] or Decimal('0.00')
-    
-    num_ventas = ventas.count()
-    ticket_promedio = (total_ventas_bruto / num_ventas).quantize(Decimal('0.01')) if num_ventas > 0 else Decimal('0.00')
-    
-    # Ventas por canal
-    ventas_por_canal = {}
-    for canal_code, canal_name in Venta.Canal.choices:
-        total = ventas.filter(canal=canal_code).aggregate(
-            total=Sum('monto_total')
-        )['total'] or Decimal('0.00')
-        ventas_por_canal[canal_name] = total
-    
-    ingresos = {
-        'total_bruto': total_ventas_bruto,
-        'total_neto': total_ventas_neto,
-        'iva': iva_ventas,
-        'kilos_vendidos': kilos_vendidos,
-        'num_ventas': num_ventas,
-        'ticket_promedio': ticket_promedio,
-        'por_canal': ventas_por_canal,
-    }
-    
-    # === COSTOS DE MERCADERÍA ===
-    # Obtener importaciones activas en el período
-    importaciones = Importacion.objects.filter(
-        activo=True,
-        fecha__lte=fecha_fin
-    )
-    
-    # Calcular costo promedio ponderado
-    if importaciones.exists():
-        total_kilos = Decimal('0.00')
-        total_costo = Decimal('0.00')
-        
-        for imp in importaciones:
-            kilos_netos = imp.kilos_ingresados - imp.merma_kg
-            total_kilos += kilos_netos
-            total_costo += imp.costo_total
-        
-        if total_kilos > 0:
-            costo_promedio_kg = (total_costo / total_kilos).quantize(Decimal('0.01'))
-        else:
-            costo_promedio_kg = Decimal('0.00')
-    else:
-        costo_promedio_kg = Decimal('0.00')
-    
-    # Costo de mercadería vendida (CMV)
-    cmv = (kilos_vendidos * costo_promedio_kg).quantize(Decimal('0.01'))
-    
-    costos = {
-        'cmv': cmv,
-        'costo_promedio_kg': costo_promedio_kg,
-        'kilos_vendidos': kilos_vendidos,
-    }
-    
-    # === GASTOS OPERACIONALES ===
-    gastos_mes = GastoOperacional.objects.filter(
-        fecha__gte=fecha_inicio,
-        fecha__lt=fecha_fin
-    )
-    
-    gastos_por_tipo = {}
-    total_gastos_neto = Decimal('0.00')
-    total_iva_gastos = Decimal('0.00')
-    
-    for tipo_code, tipo_name in GastoOperacional.Tipo.choices:
-        gastos_tipo = gastos_mes.filter(tipo=tipo_code)
-        neto = gastos_tipo.aggregate(total=Sum('monto_neto'))['total'] or Decimal('0.00')
-        
-        # Calcular IVA solo para gastos que lo aplican
-        iva = Decimal('0.00')
-        for gasto in gastos_tipo.filter(aplica_iva=True):
-            iva += gasto.iva
-        
-        total = neto + iva
-        
-        gastos_por_tipo[tipo_name] = {
-            'neto': neto,
-            'iva': iva,
-            'total': total,
-            'cantidad': gastos_tipo.count()
-        }
-        
-        total_gastos_neto += neto
-        total_iva_gastos += iva
-    
-    total_gastos = total_gastos_neto + total_iva_gastos
-    
-    gastos = {
-        'total_neto': total_gastos_neto,
-        'total_iva': total_iva_gastos,
-        'total': total_gastos,
-        'por_tipo': gastos_por_tipo,
-    }
-    
-    # === UTILIDADES ===
-    utilidad_bruta = (total_ventas_neto - cmv).quantize(Decimal('0.01'))
-    utilidad_operacional = (utilidad_bruta - total_gastos_neto).quantize(Decimal('0.01'))
-    
-    # La utilidad neta considera también el IVA (es la utilidad real después de impuestos)
-    # En Chile, el IVA es un impuesto que se paga/recupera, pero afecta el flujo de caja
-    utilidad_neta = (utilidad_operacional - total_iva_gastos).quantize(Decimal('0.01'))
-    
-    # Márgenes porcentuales
-    if total_ventas_neto > 0:
-        margen_bruto_pct = ((utilidad_bruta / total_ventas_neto) * Decimal('100')).quantize(Decimal('0.01'))
-        margen_operacional_pct = ((utilidad_operacional / total_ventas_neto) * Decimal('100')).quantize(Decimal('0.01'))
-        margen_neto_pct = ((utilidad_neta / total_ventas_neto) * Decimal('100')).quantize(Decimal('0.01'))
-    else:
-        margen_bruto_pct = Decimal('0.00')
-        margen_operacional_pct = Decimal('0.00')
-        margen_neto_pct = Decimal('0.00')
-    
-    # Nombre del mes en español
-    meses_es = ['Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio',
-                'Julio', 'Agosto', 'Septiembre', 'Octubre', 'Noviembre', 'Diciembre']
-    
-    return {
-        'periodo': {
-            'anio': anio,
-            'mes': mes,
-            'mes_nombre': meses_es[mes - 1],
-        },
-        'ingresos': ingresos,
-        'costos': costos,
-        'gastos': gastos,
-        'utilidad_bruta': utilidad_bruta,
-        'utilidad_operacional': utilidad_operacional,
-        'utilidad_neta': utilidad_neta,
-        'margen_bruto_pct': margen_bruto_pct,
-        'margen_operacional_pct': margen_operacional_pct,
-        'margen_neto_pct': margen_neto_pct,
-    }
+    return _balance_mes(anio, mes, _datos_meses(anio, [mes])[mes])
 
 
 def calcular_balance_anual(anio):
@@ -197,60 +229,37 @@ def calcular_balance_anual(anio):
             'promedios': {...}
         }
     """
-    meses_data = []
-    
-    # Calcular balance para cada mes
-    for mes in range(1, 13):
-        balance_mes = calcular_balance_mensual(anio, mes)
-        meses_data.append(balance_mes)
-    
-    # Calcular totales anuales
-    total_ingresos = sum(m['ingresos']['total_bruto'] for m in meses_data)
-    total_ingresos_neto = sum(m['ingresos']['total_neto'] for m in meses_data)
-    total_cmv = sum(m['costos']['cmv'] for m in meses_data)
-    total_gastos = sum(m['gastos']['total'] for m in meses_data)
-    total_gastos_neto = sum(m['gastos']['total_neto'] for m in meses_data)
-    total_kilos = sum(m['ingresos']['kilos_vendidos'] for m in meses_data)
-    total_ventas = sum(m['ingresos']['num_ventas'] for m in meses_data)
-    
-    utilidad_bruta_anual = sum(m['utilidad_bruta'] for m in meses_data)
-    utilidad_operacional_anual = sum(m['utilidad_operacional'] for m in meses_data)
-    utilidad_neta_anual = sum(m['utilidad_neta'] for m in meses_data)
-    
-    # Calcular márgenes anuales
-    if total_ingresos_neto > 0:
-        margen_bruto_anual = ((utilidad_bruta_anual / total_ingresos_neto) * Decimal('100')).quantize(Decimal('0.01'))
-        margen_operacional_anual = ((utilidad_operacional_anual / total_ingresos_neto) * Decimal('100')).quantize(Decimal('0.01'))
-        margen_neto_anual = ((utilidad_neta_anual / total_ingresos_neto) * Decimal('100')).quantize(Decimal('0.01'))
-    else:
-        margen_bruto_anual = Decimal('0.00')
-        margen_operacional_anual = Decimal('0.00')
-        margen_neto_anual = Decimal('0.00')
-    
-    # Promedios mensuales
-    ticket_promedio_anual = (total_ingresos / total_ventas).quantize(Decimal('0.01')) if total_ventas > 0 else Decimal('0.00')
-    
+    datos = _datos_meses(anio, range(1, 13))
+    meses_data = [_balance_mes(anio, mes, datos[mes]) for mes in range(1, 13)]
+
+    # Totales anuales en centavos
+    resultados = [_resultado(datos[mes]) for mes in range(1, 13)]
+    total = {k: sum(r[k] for r in resultados) for k in resultados[0]}
+    total_gastos = total['gastos_neto'] + total['gastos_iva']
+    total_kilos = sum((datos[mes]['kilos'] for mes in range(1, 13)), Decimal('0.00'))
+    total_ventas = sum(datos[mes]['num_ventas'] for mes in range(1, 13))
+
     totales = {
-        'ingresos_bruto': total_ingresos,
-        'ingresos_neto': total_ingresos_neto,
-        'cmv': total_cmv,
-        'gastos': total_gastos,
-        'gastos_neto': total_gastos_neto,
+        'ingresos_bruto': a_decimal(total['bruto']),
+        'ingresos_neto': a_decimal(total['neto']),
+        'cmv': a_decimal(total['cmv']),
+        'gastos': a_decimal(total_gastos),
+        'gastos_neto': a_decimal(total['gastos_neto']),
         'kilos_vendidos': total_kilos,
         'num_ventas': total_ventas,
-        'utilidad_bruta': utilidad_bruta_anual,
-        'utilidad_operacional': utilidad_operacional_anual,
-        'utilidad_neta': utilidad_neta_anual,
-        'margen_bruto_pct': margen_bruto_anual,
-        'margen_operacional_pct': margen_operacional_anual,
-        'margen_neto_pct': margen_neto_anual,
+        'utilidad_bruta': a_decimal(total['utilidad_bruta']),
+        'utilidad_operacional': a_decimal(total['utilidad_operacional']),
+        'utilidad_neta': a_decimal(total['utilidad_neta']),
+        'margen_bruto_pct': a_decimal(dinero.porcentaje(total['utilidad_bruta'], total['neto'])),
+        'margen_operacional_pct': a_decimal(dinero.porcentaje(total['utilidad_operacional'], total['neto'])),
+        'margen_neto_pct': a_decimal(dinero.porcentaje(total['utilidad_neta'], total['neto'])),
     }
     
     promedios = {
-        'ingresos_mensual': (total_ingresos / Decimal('12')).quantize(Decimal('0.01')),
-        'gastos_mensual': (total_gastos / Decimal('12')).quantize(Decimal('0.01')),
-        'utilidad_mensual': (utilidad_neta_anual / Decimal('12')).quantize(Decimal('0.01')),
-        'ticket_promedio': ticket_promedio_anual,
+        'ingresos_mensual': a_decimal(dinero.dividir(total['bruto'], 12)),
+        'gastos_mensual': a_decimal(dinero.dividir(total_gastos, 12)),
+        'utilidad_mensual': a_decimal(dinero.dividir(total['utilidad_neta'], 12)),
+        'ticket_promedio': a_decimal(dinero.dividir(total['bruto'], total_ventas) if total_ventas else 0),
         'ventas_mensuales': int(total_ventas / 12),
     }
     
@@ -289,20 +298,10 @@ def calcular_comparativa_anual(anios):
             anio_actual = anios_data[i]
             anio_anterior = anios_data[i-1]
             
-            crecimiento_ingresos = Decimal('0.00')
-            crecimiento_utilidad = Decimal('0.00')
-            
-            if anio_anterior['totales']['ingresos_bruto'] > 0:
-                crecimiento_ingresos = (
-                    ((anio_actual['totales']['ingresos_bruto'] - anio_anterior['totales']['ingresos_bruto']) / 
-                     anio_anterior['totales']['ingresos_bruto']) * Decimal('100')
-                ).quantize(Decimal('0.01'))
-            
-            if anio_anterior['totales']['utilidad_neta'] != 0:
-                crecimiento_utilidad = (
-                    ((anio_actual['totales']['utilidad_neta'] - anio_anterior['totales']['utilidad_neta']) / 
-                     abs(anio_anterior['totales']['utilidad_neta'])) * Decimal('100')
-                ).quantize(Decimal('0.01'))
+            ingresos = [dinero.a_centavos(a['totales']['ingresos_bruto']) for a in (anio_anterior, anio_actual)]
+            utilidad = [dinero.a_centavos(a['totales']['utilidad_neta']) for a in (anio_anterior, anio_actual)]
+            crecimiento_ingresos = a_decimal(dinero.porcentaje(ingresos[1] - ingresos[0], ingresos[0]))
+            crecimiento_utilidad = a_decimal(dinero.porcentaje(utilidad[1] - utilidad[0], abs(utilidad[0])))
             
             comparativa[f'{anio_anterior["anio"]}-{anio_actual["anio"]}'] = {
                 'crecimiento_ingresos_pct': crecimiento_ingresos,
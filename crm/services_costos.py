@@ -0,0 +1,162 @@
+# crm/services_costos.py
+"""
+Costo de ventas FIFO por lotes de importación.
+
+Cada venta consume sus kilos de las importaciones más antiguas con stock
+cuya fecha no es posterior a la venta, y queda registrado en ConsumoLote
+de qué lote salió cada kilo y a qué costo. Una nota de crédito devuelve
+sus kilos al último lote del que se sacó (kilos y costo negativos), que
+es el primero en volver a venderse. Venta.costo_fifo e
+Importacion.kilos_restantes quedan precalculados.
+
+Los kilos son los de los ítems, como en el libro de inventario
+(services_inventario): Importacion.kilos_restantes cuadra con el libro.
+Un kilos_total ingresado a mano que no cuadra con los ítems se detecta
+y corrige con `conciliar_totales_ventas --kilos`.
+
+Un cambio con fecha D (venta editada o retroactiva, importación nueva o
+corregida) sólo altera las asignaciones desde D: `reprocesar(desde)`
+borra los consumos de las ventas desde D, reconstruye lo disponible
+por lote con lo consumido antes de D y reasigna sólo esas ventas.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from . import services_inventario
+from .models import ConsumoLote, Importacion, Venta
+
+TAMANO_LOTE = 2000
+
+
+class _Lotes:
+    """Importaciones en orden FIFO con lo que les queda disponible"""
+
+    def __init__(self, consumido_antes):
+        self.lotes = []
+        for imp in Importacion.objects.order_by('fecha', 'id').values(
+            'id', 'fecha', 'kilos_ingresados', 'merma_kg', 'costo_por_kg'
+        ):
+            imp['neto'] = imp['kilos_ingresados'] - imp['merma_kg']
+            imp['disponible'] = imp['neto'] - consumido_antes.get(imp['id'], Decimal('0'))
+            self.lotes.append(imp)
+        self.actual = 0
+
+    def consumir(self, dia, kilos):
+        """[(importacion_id o None, kilos, costo)] para sacar `kilos` al día `dia`"""
+        partes = []
+        while kilos > 0:
+            while self.actual < len(self.lotes) and self.lotes[self.actual]['disponible'] <= 0:
+                self.actual += 1
+            if self.actual == len(self.lotes) or self.lotes[self.actual]['fecha'] > dia:
+                partes.append((None, kilos, Decimal('0.00')))
+                break
+            lote = self.lotes[self.actual]
+            sacado = min(kilos, lote['disponible'])
+            lote['disponible'] -= sacado
+            kilos -= sacado
+            partes.append((lote['id'], sacado, (sacado * lote['costo_por_kg']).quantize(Decimal('0.01'))))
+        return partes
+
+    def devolver(self, kilos):
+        """
+        [(importacion_id o None, -kilos, -costo)] para reingresar `kilos`
+        devueltos: vuelven a los lotes de los que se sacó lo último
+        """
+        partes = []
+        i = len(self.lotes) - 1
+        while kilos > 0 and i >= 0:
+            lote = self.lotes[i]
+            vuelto = min(kilos, lote['neto'] - lote['disponible'])
+            if vuelto > 0:
+                lote['disponible'] += vuelto
+                kilos -= vuelto
+                self.actual = min(self.actual, i)
+                partes.append((lote['id'], -vuelto, -(vuelto * lote['costo_por_kg']).quantize(Decimal('0.01'))))
+            i -= 1
+        if kilos > 0:
+            partes.append((None, -kilos, Decimal('0.00')))
+        return partes
+
+
+def reprocesar(desde=None):
+    """
+    Reasigna FIFO las ventas con fecha >= desde (todas si desde es None).
+
+    Returns:
+        int: ventas reasignadas
+    """
+    with transaction.atomic():
+        ventas = Venta.objects.all()
+        consumos = ConsumoLote.objects.all()
+        if desde is not None:
+            ventas = ventas.filter(fecha__gte=desde)
+            consumos = consumos.filter(Q(fecha__gte=desde) | Q(venta__fecha__gte=desde))
+        consumos.delete()
+        ventas.update(costo_fifo=Decimal('0.00'))
+
+        consumido_antes = dict(
+            ConsumoLote.objects.filter(importacion__isnull=False)
+            .values('importacion').annotate(s=Sum('kilos')).order_by()
+            .values_list('importacion', 's')
+        )
+        lotes = _Lotes(consumido_antes)
+
+        pendientes = (
+            ventas
+            .annotate(kilos=Sum('items__kilos'))
+            .filter(kilos__gt=0)
+            .order_by('fecha', 'id')
+            .values_list('id', 'fecha', 'tipo_documento', 'kilos')
+        )
+        nuevos, costeadas, n = [], [], 0
+        for venta_id, fecha, tipo_documento, kilos in pendientes.iterator(chunk_size=TAMANO_LOTE):
+            if tipo_documento == Venta.TipoDocumento.NOTA_CREDITO:
+                partes = lotes.devolver(kilos)
+            else:
+                partes = lotes.consumir(timezone.localtime(fecha).date(), kilos)
+            costo = Decimal('0.00')
+            for importacion_id, sacado, costo_parte in partes:
+                nuevos.append(ConsumoLote(
+                    venta_id=venta_id, importacion_id=importacion_id,
+                    fecha=fecha, kilos=sacado, costo=costo_parte,
+                ))
+                costo += costo_parte
+            costeadas.append(Venta(pk=venta_id, costo_fifo=costo))
+            n += 1
+            if len(costeadas) >= TAMANO_LOTE:
+                _guardar(nuevos, costeadas)
+                nuevos, costeadas = [], []
+        _guardar(nuevos, costeadas)
+
+        Importacion.objects.bulk_update(
+            [Importacion(pk=l['id'], kilos_restantes=max(l['disponible'], Decimal('0'))) for l in lotes.lotes],
+            ['kilos_restantes'],
+            batch_size=TAMANO_LOTE,
+        )
+    return n
+
+
+def _guardar(consumos, ventas):
+    ConsumoLote.objects.bulk_create(consumos, batch_size=TAMANO_LOTE)
+    Venta.objects.bulk_update(ventas, ['costo_fifo'], batch_size=500)
+
+
+def actualizar_por_importacion(importacion_id):
+    """
+    Tras guardar o borrar una importación: la registra en el libro de
+    inventario y reprocesa desde la primera fecha afectada, que es el
+    movimiento más antiguo que generó (alta, baja, cambio de kilos o de
+    fecha) o, si sólo cambió el costo, el primer consumo de ese lote.
+    """
+    movimientos = services_inventario.registrar_importaciones([importacion_id])
+    if movimientos:
+        desde = min(m.fecha for m in movimientos)
+    else:
+        primero = ConsumoLote.objects.filter(importacion_id=importacion_id).order_by('fecha').first()
+        if primero is None:
+            return 0
+        desde = primero.fecha
+    return reprocesar(desde)
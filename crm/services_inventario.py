@@ -1,109 +1,484 @@
 # crm/services_inventario.py
+import datetime
 from decimal import Decimal
-from django.db.models import Sum
+
+from django.db import transaction
+from django.db.models import (
+    Case, Exists, F, FilteredRelation, Min, OuterRef, Q, Sum, Value, When,
+)
+from django.db.models.functions import Coalesce, TruncDate
 from django.utils import timezone
 
-from .models import VentaItem, Venta
+from .models import (
+    ComposicionBolsa, CorteInventario, Importacion, MovimientoBolsa, MovimientoInventario,
+    StockDiario, VentaItem, Venta,
+)
+
+Mov = MovimientoInventario.Tipo
+
+# Ids por consulta al registrar movimientos (límite de parámetros de SQLite)
+TAMANO_LOTE = 500
 
 
-# inventario original las mermas se deben restar del original
-STOCK_INICIAL_8 = 1095-4
-STOCK_INICIAL_20 = 862-8
 # ---------------------------------------------------------
-# MAPA SKU -> (bolsas_8kg, bolsas_20kg)
-# AJUSTA las llaves para que calcen con tu Producto.sku real
+# BOLSAS DE EMPAQUE
+# Composición por producto en ComposicionBolsa; conteos, compras y
+# ajustes en MovimientoBolsa. El consumo sale de los ítems vendidos.
 # ---------------------------------------------------------
-SKU_BOLSAS_MAP = {
-    "1":  (1, 0),  # 1 bolsa de 8
-    "2":  (2, 0),  # 2 bolsas de 8
-    "3":  (0, 1),  # 1 bolsa de 20
-    "4":  (3, 0),  # 3 bolsas de 8
-    "5":  (1, 1),  # 1 bolsa de 8 + 1 de 20
-    "6":  (4, 0),  # 4 bolsas de 8
-    "7":  (0, 2),  # 2 bolsas de 20
-    "8":  (5, 0),  # 5 bolsas de 8
-}
+TIPOS_BOLSA = ComposicionBolsa.TipoBolsa
+
+
+def _bolsas_por_tipo(filtros=None):
+    """
+    Relaciones y sumas {tipo: Sum(...)} de las bolsas de cada tipo de los
+    VentaItem (negativas en notas de crédito). Cada tipo es un LEFT JOIN
+    a ComposicionBolsa (a lo más una fila por producto y tipo).
+
+    Args:
+        filtros: {tipo: Q} opcional para restringir la suma de ese tipo
+    """
+    filtros = filtros or {}
+    signo = Case(
+        When(venta__tipo_documento=Venta.TipoDocumento.NOTA_CREDITO, then=Value(-1)),
+        default=Value(1),
+    )
+    relaciones, bolsas = {}, {}
+    for tipo in TIPOS_BOLSA.values:
+        relaciones[f'composicion_{tipo}'] = FilteredRelation(
+            'producto__bolsas', condition=Q(producto__bolsas__tipo_bolsa=tipo),
+        )
+        bolsas[tipo] = Coalesce(
+            Sum(signo * F('cantidad') * F(f'composicion_{tipo}__cantidad'), filter=filtros.get(tipo)),
+            0,
+        )
+    return relaciones, bolsas
+
+
+def _items_entre(desde, hasta):
+    """Ítems de ventas con fecha local en [desde, hasta] (rango sobre el índice de fecha)"""
+    items = VentaItem.objects.all()
+    if desde is not None:
+        items = items.filter(venta__fecha__gte=_inicio_dia(desde))
+    if hasta is not None:
+        items = items.filter(venta__fecha__lt=_inicio_dia(hasta + datetime.timedelta(days=1)))
+    return items
+
+
+def stock_bolsas(hasta=None):
+    """
+    Bolsas en bodega al cierre de `hasta` (hoy por defecto): movimientos
+    del libro menos lo consumido por ventas desde el primer movimiento de
+    cada tipo. Dos consultas.
+
+    Returns:
+        dict: {tipo_bolsa: unidades}
+    """
+    if hasta is None:
+        hasta = timezone.localdate()
+    libro = {
+        r['tipo_bolsa']: r
+        for r in MovimientoBolsa.objects.filter(fecha__lte=hasta)
+        .values('tipo_bolsa').annotate(total=Sum('cantidad'), inicio=Min('fecha')).order_by()
+    }
+    stock = {tipo: 0 for tipo in TIPOS_BOLSA.values}
+    if not libro:
+        return stock
+
+    # Cada tipo cuenta su consumo desde su propio primer movimiento
+    relaciones, bolsas = _bolsas_por_tipo({
+        tipo: Q(venta__fecha__gte=_inicio_dia(r['inicio'])) for tipo, r in libro.items()
+    })
+    consumido = (
+        _items_entre(min(r['inicio'] for r in libro.values()), hasta)
+        .annotate(**relaciones)
+        .aggregate(**{f'b{tipo}': bolsas[tipo] for tipo in libro})
+    )
+    for tipo, r in libro.items():
+        stock[tipo] = r['total'] - consumido[f'b{tipo}']
+    return stock
+
 
 def consumo_bolsas(desde=None, hasta=None):
+    """
+    Bolsas consumidas por las ventas del período (notas de crédito restan),
+    con el detalle por SKU y tipo de documento, los SKU vendidos sin
+    composición y el stock al cierre del período.
+
+    El consumo es un JOIN + GROUP BY en la base de datos y los SKU sin
+    composición un anti-join (NOT EXISTS): el costo no depende de cuántas
+    filas tenga el período en Python.
+    """
     if desde is None:
         hoy = timezone.localdate()
         desde = hoy.replace(day=1) - timezone.timedelta(days=180)
     if hasta is None:
         hasta = timezone.localdate()
 
-    items_qs = (
-        VentaItem.objects
-        .select_related("producto", "venta")
-        .filter(venta__fecha__date__gte=desde, venta__fecha__date__lte=hasta)
-        .values(
-            "producto__sku",
-            "producto__nombre",
-            "venta__tipo_documento",
+    relaciones, bolsas = _bolsas_por_tipo()
+    items = _items_entre(desde, hasta)
+
+    filas = (
+        items.annotate(**relaciones)
+        .values('producto__sku', 'producto__nombre', 'venta__tipo_documento')
+        .annotate(
+            unidades=Sum('cantidad'),
+            **{f'bolsas_{tipo}': expr for tipo, expr in bolsas.items()},
         )
-        .annotate(unidades_sku=Sum("cantidad"))
+        .filter(Exists(ComposicionBolsa.objects.filter(producto_id=OuterRef('producto_id'))))
+        .order_by()
     )
-
-    total_8 = 0
-    total_20 = 0
     detalle = []
-    skus_sin_mapa = set()
-
-    for r in items_qs:
-        sku = (r["producto__sku"] or "").strip()
-        nombre = r["producto__nombre"] or ""
-        tipo_doc = r["venta__tipo_documento"]
-        unidades = int(r["unidades_sku"] or 0)
-
-        signo = -1 if tipo_doc == Venta.TipoDocumento.NOTA_CREDITO else 1
-
-        if sku not in SKU_BOLSAS_MAP:
-            if unidades:
-                skus_sin_mapa.add(sku)
-            continue
-
-        b8, b20 = SKU_BOLSAS_MAP[sku]
-        c8 = signo * unidades * b8
-        c20 = signo * unidades * b20
-
-        total_8 += c8
-        total_20 += c20
-
-        detalle.append({
-            "sku": sku,
-            "nombre": nombre,
-            "tipo_doc": tipo_doc,
-            "unidades_sku": unidades * signo,
-            "bolsas_8": c8,
-            "bolsas_20": c20,
-        })
-
-    detalle.sort(
-        key=lambda x: abs(x["bolsas_8"]) + abs(x["bolsas_20"]),
-        reverse=True
-    )
+    totales = {tipo: 0 for tipo in TIPOS_BOLSA.values}
+    for r in filas:
+        signo = -1 if r['venta__tipo_documento'] == Venta.TipoDocumento.NOTA_CREDITO else 1
+        fila = {
+            'sku': (r['producto__sku'] or '').strip(),
+            'nombre': r['producto__nombre'] or '',
+            'tipo_doc': r['venta__tipo_documento'],
+            'unidades_sku': signo * (r['unidades'] or 0),
+        }
+        for tipo in totales:
+            fila[f'bolsas_{tipo}'] = r[f'bolsas_{tipo}']
+            totales[tipo] += r[f'bolsas_{tipo}']
+        detalle.append(fila)
+    detalle.sort(key=lambda x: sum(abs(x[f'bolsas_{tipo}']) for tipo in totales), reverse=True)
 
-    inventario_8 = STOCK_INICIAL_8 - total_8
-    inventario_20 = STOCK_INICIAL_20 - total_20
+    sin_composicion = (
+        items.exclude(Exists(ComposicionBolsa.objects.filter(producto_id=OuterRef('producto_id'))))
+        .values_list('producto__sku', flat=True)
+        .distinct()
+        .order_by('producto__sku')
+    )
 
+    stock = stock_bolsas(hasta)
     return {
-        # consumo
-        "consumo_8": total_8,
-        "consumo_20": total_20,
+        'consumo_8': totales[TIPOS_BOLSA.KG8],
+        'consumo_20': totales[TIPOS_BOLSA.KG20],
+        'inventario_8': stock[TIPOS_BOLSA.KG8],
+        'inventario_20': stock[TIPOS_BOLSA.KG20],
+        'detalle': detalle,
+        'skus_sin_mapa': [s for s in sin_composicion if s and s.strip()],
+    }
+
+
+# ---------------------------------------------------------
+# LIBRO DE INVENTARIO (kilos)
+# ---------------------------------------------------------
+def _inicio_dia(dia):
+    """datetime local (aware) de las 00:00 de ese día"""
+    return timezone.make_aware(datetime.datetime.combine(dia, datetime.time.min))
 
-        # inventario
-        "stock_inicial_8": STOCK_INICIAL_8,
-        "stock_inicial_20": STOCK_INICIAL_20,
-        "inventario_8": STOCK_INICIAL_8 - total_8,
-        "inventario_20": STOCK_INICIAL_20 - total_20,
 
-        "detalle": detalle,
-        "skus_sin_mapa": sorted([s for s in skus_sin_mapa if s]),
+def _registrar(movimientos):
+    """
+    Agrega los movimientos al libro con su saldo acumulado (un solo
+    bulk_create) e invalida los cortes desde el día más antiguo tocado.
+    """
+    if not movimientos:
+        return []
+    movimientos.sort(key=lambda m: m.fecha)
+    with transaction.atomic():
+        saldo = (
+            MovimientoInventario.objects.select_for_update()
+            .order_by("-id").values_list("saldo", flat=True).first()
+        ) or Decimal("0")
+        for m in movimientos:
+            saldo += m.kilos
+            m.saldo = saldo
+        MovimientoInventario.objects.bulk_create(movimientos, batch_size=TAMANO_LOTE)
+        primer_dia = timezone.localtime(movimientos[0].fecha).date()
+        CorteInventario.objects.filter(dia__gte=primer_dia).delete()
+        invalidar_stock_diario(primer_dia)
+    return movimientos
+
+
+def _compensar(deseado, tipos, referencias):
+    """
+    Movimientos que llevan el libro de lo registrado a `deseado`
+    ({(referencia_id, tipo, fecha): kilos}) para esas referencias y tipos.
+    """
+    registrado = {}
+    existentes = (
+        MovimientoInventario.objects
+        .filter(referencia_id__in=referencias, tipo__in=tipos)
+        .values("referencia_id", "tipo", "fecha")
+        .annotate(s=Sum("kilos"))
+        .order_by()
+    )
+    for r in existentes:
+        registrado[(r["referencia_id"], r["tipo"], r["fecha"])] = r["s"] or Decimal("0")
+
+    movimientos = []
+    for clave in deseado.keys() | registrado.keys():
+        diferencia = deseado.get(clave, Decimal("0")) - registrado.get(clave, Decimal("0"))
+        if diferencia:
+            referencia_id, tipo, fecha = clave
+            movimientos.append(MovimientoInventario(
+                fecha=fecha, tipo=tipo, referencia_id=referencia_id, kilos=diferencia,
+            ))
+    return movimientos
+
+
+def _lotes(ids):
+    ids = sorted({i for i in ids if i is not None})
+    for i in range(0, len(ids), TAMANO_LOTE):
+        yield ids[i:i + TAMANO_LOTE]
+
+
+def registrar_ventas(venta_ids):
+    """
+    Lleva al libro los kilos actuales de esas ventas (salida; entrada si
+    es nota de crédito). Si una venta cambió de fecha o tipo, o se borró,
+    se reversa lo anterior.
+    """
+    movimientos = []
+    for lote in _lotes(venta_ids):
+        deseado = {}
+        ventas = (
+            Venta.objects.filter(pk__in=lote)
+            .annotate(kilos=Sum("items__kilos"))
+            .values("id", "fecha", "tipo_documento", "kilos")
+        )
+        for v in ventas:
+            if not v["kilos"]:
+                continue
+            if v["tipo_documento"] == Venta.TipoDocumento.NOTA_CREDITO:
+                deseado[(v["id"], Mov.NOTA_CREDITO, v["fecha"])] = v["kilos"]
+            else:
+                deseado[(v["id"], Mov.VENTA, v["fecha"])] = -v["kilos"]
+        movimientos += _compensar(deseado, [Mov.VENTA, Mov.NOTA_CREDITO], lote)
+    return _registrar(movimientos)
 
-        "inventario_8": inventario_8,
-        "inventario_20": inventario_20,
-        "stock_inicial_8": STOCK_INICIAL_8,
-        "stock_inicial_20": STOCK_INICIAL_20,
 
+def registrar_importaciones(importacion_ids):
+    """Entrada de kilos_ingresados y salida de la merma de esas importaciones"""
+    movimientos = []
+    for lote in _lotes(importacion_ids):
+        deseado = {}
+        for imp in Importacion.objects.filter(pk__in=lote).values("id", "fecha", "kilos_ingresados", "merma_kg"):
+            fecha = _inicio_dia(imp["fecha"])
+            deseado[(imp["id"], Mov.IMPORTACION, fecha)] = imp["kilos_ingresados"]
+            if imp["merma_kg"]:
+                deseado[(imp["id"], Mov.MERMA, fecha)] = -imp["merma_kg"]
+        movimientos += _compensar(deseado, [Mov.IMPORTACION, Mov.MERMA], lote)
+    return _registrar(movimientos)
 
 
+def stock_actual():
+    """Stock en kilos según el libro: una fila"""
+    return (
+        MovimientoInventario.objects.order_by("-id").values_list("saldo", flat=True).first()
+        or Decimal("0")
+    )
+
+
+def stock_al(dia):
+    """Stock al cierre de `dia`: último corte anterior + suma de los movimientos posteriores"""
+    corte = CorteInventario.objects.filter(dia__lte=dia).order_by("-dia").first()
+    movimientos = MovimientoInventario.objects.filter(fecha__lt=_inicio_dia(dia + datetime.timedelta(days=1)))
+    base = Decimal("0")
+    if corte is not None:
+        base = corte.saldo
+        movimientos = movimientos.filter(fecha__gte=_inicio_dia(corte.dia + datetime.timedelta(days=1)))
+    return base + (movimientos.aggregate(s=Sum("kilos"))["s"] or Decimal("0"))
+
+
+def kilos_vendidos(desde=None, hasta=None):
+    """Kilos vendidos netos de notas de crédito en [desde, hasta] (días locales)"""
+    qs = MovimientoInventario.objects.filter(tipo__in=[Mov.VENTA, Mov.NOTA_CREDITO])
+    if desde is not None:
+        qs = qs.filter(fecha__gte=_inicio_dia(desde))
+    if hasta is not None:
+        qs = qs.filter(fecha__lt=_inicio_dia(hasta + datetime.timedelta(days=1)))
+    return -(qs.aggregate(s=Sum("kilos"))["s"] or Decimal("0"))
+
+
+def crear_cortes(hasta=None):
+    """
+    Cortes diarios (días con movimientos) desde el último corte hasta
+    `hasta` (por defecto ayer). Pensado para correr periódicamente.
+
+    Returns:
+        int: cortes creados
+    """
+    hasta = hasta or timezone.localdate() - datetime.timedelta(days=1)
+    ultimo = CorteInventario.objects.filter(dia__lte=hasta).order_by("-dia").first()
+    saldo = ultimo.saldo if ultimo else Decimal("0")
+
+    movimientos = MovimientoInventario.objects.filter(fecha__lt=_inicio_dia(hasta + datetime.timedelta(days=1)))
+    if ultimo is not None:
+        movimientos = movimientos.filter(fecha__gte=_inicio_dia(ultimo.dia + datetime.timedelta(days=1)))
+    por_dia = (
+        movimientos.annotate(dia=TruncDate("fecha"))
+        .values("dia").annotate(s=Sum("kilos")).order_by("dia")
+    )
+
+    cortes = []
+    for r in por_dia:
+        saldo += r["s"] or Decimal("0")
+        cortes.append(CorteInventario(dia=r["dia"], saldo=saldo))
+    CorteInventario.objects.bulk_create(cortes)
+    return len(cortes)
+
+
+def reconstruir_libro():
+    """
+    Rehace el libro completo desde Importacion y Venta (en orden de
+    fecha) y sus cortes.
+
+    Returns:
+        int: movimientos creados
+    """
+    with transaction.atomic():
+        MovimientoInventario.objects.all().delete()
+        CorteInventario.objects.all().delete()
+        movimientos = _movimientos_completos()
+        _registrar(movimientos)
+        crear_cortes()
+    return len(movimientos)
+
+
+def _movimientos_completos():
+    movimientos = []
+    for lote in _lotes(Importacion.objects.values_list("id", flat=True)):
+        for imp in Importacion.objects.filter(pk__in=lote).values("id", "fecha", "kilos_ingresados", "merma_kg"):
+            fecha = _inicio_dia(imp["fecha"])
+            movimientos.append(MovimientoInventario(
+                fecha=fecha, tipo=Mov.IMPORTACION, referencia_id=imp["id"], kilos=imp["kilos_ingresados"],
+            ))
+            if imp["merma_kg"]:
+                movimientos.append(MovimientoInventario(
+                    fecha=fecha, tipo=Mov.MERMA, referencia_id=imp["id"], kilos=-imp["merma_kg"],
+                ))
+    ventas = (
+        Venta.objects.annotate(kilos=Sum("items__kilos"))
+        .filter(kilos__gt=0)
+        .values_list("id", "fecha", "tipo_documento", "kilos")
+        .iterator(chunk_size=2000)
+    )
+    for venta_id, fecha, tipo_documento, kilos in ventas:
+        nota = tipo_documento == Venta.TipoDocumento.NOTA_CREDITO
+        movimientos.append(MovimientoInventario(
+            fecha=fecha, tipo=Mov.NOTA_CREDITO if nota else Mov.VENTA,
+            referencia_id=venta_id, kilos=kilos if nota else -kilos,
+        ))
+    return movimientos
+
+
+# ---------------------------------------------------------
+# STOCK DIARIO (kilos y bolsas al cierre de cada día)
+# ---------------------------------------------------------
+CAMPO_BOLSA = {TIPOS_BOLSA.KG8: 'bolsas_8', TIPOS_BOLSA.KG20: 'bolsas_20'}
+
+
+def invalidar_stock_diario(desde=None):
+    """Borra StockDiario desde `desde` (todo si es None); se rellena al pedirlo"""
+    filas = StockDiario.objects.all()
+    if desde is not None:
+        filas = filas.filter(dia__gte=desde)
+    filas.delete()
+
+
+def _primer_dia():
+    candidatos = []
+    primero = MovimientoInventario.objects.order_by('fecha').values_list('fecha', flat=True).first()
+    if primero is not None:
+        candidatos.append(timezone.localtime(primero).date())
+    primero = MovimientoBolsa.objects.order_by('fecha').values_list('fecha', flat=True).first()
+    if primero is not None:
+        candidatos.append(primero)
+    return min(candidatos) if candidatos else None
+
+
+def _pasada_stock(desde, hasta, kilos, bolsas):
+    """
+    Filas de StockDiario de `desde` a `hasta` en una sola pasada por los
+    días, a partir del stock al cierre del día anterior (kilos, {tipo: bolsas}).
+    Tres consultas agrupadas por día: libro de kilos, libro de bolsas y
+    consumo de bolsas por ventas.
+    """
+    inicio, fin = _inicio_dia(desde), _inicio_dia(hasta + datetime.timedelta(days=1))
+    kilos_dia = dict(
+        MovimientoInventario.objects.filter(fecha__gte=inicio, fecha__lt=fin)
+        .annotate(dia=TruncDate('fecha')).values('dia').annotate(s=Sum('kilos'))
+        .order_by().values_list('dia', 's')
+    )
+    libro_dia = {
+        (r['fecha'], r['tipo_bolsa']): r['s']
+        for r in MovimientoBolsa.objects.filter(fecha__gte=desde, fecha__lte=hasta)
+        .values('fecha', 'tipo_bolsa').annotate(s=Sum('cantidad')).order_by()
     }
+    # Como en stock_bolsas: el consumo cuenta desde el primer movimiento de cada tipo
+    inicio_tipo = dict(
+        MovimientoBolsa.objects.values('tipo_bolsa').annotate(m=Min('fecha'))
+        .order_by().values_list('tipo_bolsa', 'm')
+    )
+    consumo_dia = {}
+    if inicio_tipo:
+        relaciones, sumas = _bolsas_por_tipo()
+        for r in (
+            _items_entre(desde, hasta).annotate(**relaciones)
+            .annotate(dia=TruncDate('venta__fecha')).values('dia')
+            .annotate(**{f'b{tipo}': expr for tipo, expr in sumas.items()})
+            .order_by()
+        ):
+            consumo_dia[r['dia']] = r
+
+    bolsas = dict(bolsas)
+    filas = []
+    dia = desde
+    while dia <= hasta:
+        kilos += kilos_dia.get(dia, Decimal('0'))
+        for tipo in CAMPO_BOLSA:
+            bolsas[tipo] += libro_dia.get((dia, tipo), 0)
+            if tipo in inicio_tipo and dia >= inicio_tipo[tipo] and dia in consumo_dia:
+                bolsas[tipo] -= consumo_dia[dia][f'b{tipo}']
+        filas.append(StockDiario(
+            dia=dia, kilos=kilos, **{campo: bolsas[tipo] for tipo, campo in CAMPO_BOLSA.items()}
+        ))
+        dia += datetime.timedelta(days=1)
+    return filas
+
+
+def rellenar_stock_diario(hasta=None):
+    """
+    Agrega los días que faltan en StockDiario hasta `hasta` (por defecto
+    ayer), continuando desde la última fila. Sin filas, arranca en el
+    primer movimiento (es la reconstrucción completa).
+
+    Returns:
+        int: filas creadas
+    """
+    hasta = hasta or timezone.localdate() - datetime.timedelta(days=1)
+    ultimo = StockDiario.objects.order_by('-dia').first()
+    if ultimo is not None:
+        desde = ultimo.dia + datetime.timedelta(days=1)
+        kilos = ultimo.kilos
+        bolsas = {tipo: getattr(ultimo, campo) for tipo, campo in CAMPO_BOLSA.items()}
+    else:
+        desde = _primer_dia()
+        kilos, bolsas = Decimal('0'), {tipo: 0 for tipo in CAMPO_BOLSA}
+    if desde is None or desde > hasta:
+        return 0
+    with transaction.atomic():
+        filas = StockDiario.objects.bulk_create(
+            _pasada_stock(desde, hasta, kilos, bolsas), batch_size=TAMANO_LOTE,
+        )
+    return len(filas)
+
+
+def reconstruir_stock_diario():
+    """Rehace StockDiario completo (una pasada ordenada). Returns: filas creadas"""
+    with transaction.atomic():
+        invalidar_stock_diario()
+        return rellenar_stock_diario()
+
+
+def historial_stock(desde, hasta=None):
+    """
+    StockDiario de [desde, hasta] (hasta: ayer por defecto), rellenando
+    antes lo que falte. Una fila por día, lectura directa.
+    """
+    hasta = hasta or timezone.localdate() - datetime.timedelta(days=1)
+    rellenar_stock_diario(hasta)
+    return list(StockDiario.objects.filter(dia__gte=desde, dia__lte=hasta).order_by('dia'))
@@ -0,0 +1,234 @@
+# crm/services_mantencion.py
+"""
+Mantención diferida de los agregados de ventas.
+
+Las señales de Venta / VentaItem no recalculan nada en el momento: sólo
+anotan qué quedó sucio (ventas cuyo monto_total cambia, días de
+VentaDiaria, clientes cuya primera compra puede cambiar). Al confirmar
+la transacción (transaction.on_commit) se procesa todo junto:
+
+1. monto_total de las ventas sucias, con un solo UPDATE por lote, sus
+   movimientos en el libro de inventario (un bulk_create) y el costo
+   FIFO desde la primera fecha afectada (services_costos)
+2. primera_compra de los clientes sucios (y los días que pierden o
+   ganan su primera compra)
+3. VentaDiaria de los días sucios (y StockDiario desde el más antiguo)
+
+Así, 50 ítems de una misma venta en una transacción recalculan esa
+venta una vez. Fuera de una transacción on_commit corre de inmediato
+(mismo comportamiento que antes, fila a fila).
+
+Para cargas masivas, `mantencion_suspendida()` ni siquiera programa el
+procesamiento: acumula lo sucio y lo reconcilia una vez al salir.
+"""
+import threading
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import (
+    Case, DecimalField, Exists, F, OuterRef, Q, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import Abs, Coalesce, TruncDate
+from django.utils import timezone
+
+from . import services_costos, services_inventario, services_ventas_diarias
+from .models import Cliente, Venta, VentaItem
+from .services import actualizar_primera_compra
+
+# Diferencia (en $ o kg) desde la que una venta se considera descuadrada
+TOLERANCIA = Decimal('0.005')
+
+# Ids por UPDATE / IN (...) (SQLite admite ~1000 parámetros por consulta)
+TAMANO_LOTE = 500
+
+_local = threading.local()
+
+
+def _pendientes():
+    pendientes = getattr(_local, 'pendientes', None)
+    if pendientes is None:
+        pendientes = _local.pendientes = {
+            'ventas': set(), 'movimientos': set(), 'dias': set(), 'clientes': set(),
+        }
+    return pendientes
+
+
+def suspendida():
+    return getattr(_local, 'suspension', 0) > 0
+
+
+def marcar(ventas=(), dias=(), clientes=(), movimientos=()):
+    """
+    Anota agregados sucios y programa su recálculo al confirmar la transacción.
+
+    Args:
+        ventas: ventas cuyos ítems cambiaron (monto_total e inventario)
+        movimientos: ventas cuyo movimiento de inventario cambia sin tocar
+            ítems (cambio de fecha o tipo de documento, borrado)
+    """
+    pendientes = _pendientes()
+    pendientes['ventas'].update(v for v in ventas if v is not None)
+    pendientes['movimientos'].update(v for v in movimientos if v is not None)
+    pendientes['dias'].update(d for d in dias if d is not None)
+    pendientes['clientes'].update(c for c in clientes if c is not None)
+    if not suspendida():
+        # Un callback por marca: si un savepoint se revierte se pierde el
+        # suyo, pero lo pendiente lo procesa el siguiente (los demás no hacen nada)
+        transaction.on_commit(procesar_pendientes)
+
+
+def dia_local(fecha):
+    if fecha is None:
+        return None
+    if timezone.is_naive(fecha):
+        fecha = timezone.make_aware(fecha)
+    return timezone.localtime(fecha).date()
+
+
+def _lotes(ids):
+    ids = sorted(ids)
+    for i in range(0, len(ids), TAMANO_LOTE):
+        yield ids[i:i + TAMANO_LOTE]
+
+
+def _items():
+    return VentaItem.objects.filter(venta_id=OuterRef('pk'))
+
+
+def _suma_items(campo):
+    """Subconsulta correlacionada: suma de `campo` de los ítems de la venta (0 sin ítems)"""
+    suma = (
+        _items()
+        .order_by()
+        .values('venta_id')
+        .annotate(s=Sum(campo))
+        .values('s')
+    )
+    return Coalesce(
+        Subquery(suma),
+        Value(Decimal('0.00')),
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+
+
+def recalcular_montos(venta_ids):
+    """monto_total = suma de subtotales de sus ítems, en un UPDATE por lote"""
+    for lote in _lotes(venta_ids):
+        Venta.objects.filter(pk__in=lote).update(monto_total=_suma_items('subtotal'))
+
+
+def _kilos_segun_items():
+    """kilos_total que corresponde a los ítems: las notas de crédito lo guardan en negativo"""
+    kilos = _suma_items('kilos')
+    return Case(
+        When(tipo_documento=Venta.TipoDocumento.NOTA_CREDITO, then=kilos * Value(-1)),
+        default=kilos,
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+
+
+def descuadres(kilos=False):
+    """
+    Ventas con ítems cuyo monto_total (y, con kilos=True, kilos_total) no
+    coincide con sus ítems. Una sola consulta, anotada con monto_items /
+    kilos_items (con el signo de kilos_total: negativo en notas de crédito).
+    """
+    qs = Venta.objects.annotate(
+        monto_items=_suma_items('subtotal'),
+        kilos_items=_kilos_segun_items(),
+        dif_monto=Abs(F('monto_total') - F('monto_items')),
+        dif_kilos=Abs(F('kilos_total') - F('kilos_items')),
+    )
+    condicion = Q(dif_monto__gt=TOLERANCIA)
+    if kilos:
+        condicion |= Q(dif_kilos__gt=TOLERANCIA)
+    # Ventas antiguas sin ítems tienen montos ingresados a mano: no se tocan
+    return qs.filter(Exists(_items())).filter(condicion)
+
+
+def corregir_descuadres(kilos=False):
+    """
+    Corrige los descuadres con un UPDATE correlacionado (y VentaDiaria de
+    los días afectados).
+
+    Returns:
+        int: ventas corregidas
+    """
+    qs = descuadres(kilos)
+    dias = set(qs.annotate(dia=TruncDate('fecha')).values_list('dia', flat=True).order_by())
+    campos = {'monto_total': _suma_items('subtotal')}
+    if kilos:
+        campos['kilos_total'] = _kilos_segun_items()
+    with transaction.atomic():
+        n = Venta.objects.filter(pk__in=qs.values('pk')).update(**campos)
+        services_ventas_diarias.recalcular_dias(dias)
+    return n
+
+
+def _dias_de_ventas(venta_ids):
+    dias = set()
+    for lote in _lotes(venta_ids):
+        dias.update(
+            Venta.objects.filter(pk__in=lote)
+            .annotate(dia=TruncDate('fecha'))
+            .values_list('dia', flat=True)
+        )
+    return dias
+
+
+def _dias_primera_compra(cliente_ids):
+    dias = set()
+    for lote in _lotes(cliente_ids):
+        dias.update(
+            dia_local(f)
+            for f in Cliente.objects.filter(pk__in=lote).values_list('primera_compra', flat=True)
+        )
+    return dias
+
+
+def procesar_pendientes():
+    """Recalcula todo lo anotado (ver docstring del módulo)"""
+    pendientes = getattr(_local, 'pendientes', None)
+    if not pendientes or not any(pendientes.values()):
+        return
+    _local.pendientes = None
+
+    ventas, dias, clientes = pendientes['ventas'], pendientes['dias'], pendientes['clientes']
+    if ventas:
+        recalcular_montos(ventas)
+        dias |= _dias_de_ventas(ventas)
+    if ventas or pendientes['movimientos']:
+        movimientos = services_inventario.registrar_ventas(ventas | pendientes['movimientos'])
+        if movimientos:
+            # FIFO desde la primera fecha tocada (no todo el historial)
+            services_costos.reprocesar(min(m.fecha for m in movimientos))
+    if clientes:
+        # primera_compra aún tiene el valor anterior: ese día también cambia
+        dias |= _dias_primera_compra(clientes)
+        actualizar_primera_compra(clientes)
+        dias |= _dias_primera_compra(clientes)
+    services_ventas_diarias.recalcular_dias(dias)
+    dias_ventas = {d for d in dias if d is not None}
+    if dias_ventas:
+        # Las bolsas pueden cambiar sin mover kilos (cambio de producto)
+        services_inventario.invalidar_stock_diario(min(dias_ventas))
+
+
+@contextmanager
+def mantencion_suspendida():
+    """
+    Suspende la mantención (p. ej. durante una carga masiva) y la
+    reconcilia una vez al salir, al confirmar la transacción en curso.
+
+        with mantencion_suspendida():
+            for fila in filas:
+                ...
+    """
+    _local.suspension = getattr(_local, 'suspension', 0) + 1
+    try:
+        yield
+    finally:
+        _local.suspension -= 1
+        if not _local.suspension:
+            transaction.on_commit(procesar_pendientes)
@@ -0,0 +1,211 @@
+# crm/services_pronostico.py
+"""
+Pronóstico de demanda (kilos por día) y plan de reposición.
+
+La serie diaria sale del libro de inventario (ventas menos notas de
+crédito, una consulta agrupada por día). Para cada ventana de VENTANAS
+se ajusta un suavizamiento exponencial (Holt-Winters aditivo con
+estacionalidad semanal y tendencia amortiguada; sin estacionalidad si la
+ventana es corta), eligiendo los parámetros por error de un paso. El
+resultado se guarda en PronosticoDemanda: la vista de inventario sólo
+lee esas filas y cruza el pronóstico con el stock actual.
+
+Pensado para correr una vez al día (comando calcular_pronostico).
+"""
+import datetime
+import itertools
+import logging
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import services_inventario
+from .models import MovimientoInventario, PronosticoDemanda
+
+logger = logging.getLogger(__name__)
+
+# Ventanas de historia (días) que se precalculan
+VENTANAS = (30, 60, 90, 180, 365)
+
+# Días que demora una importación en llegar desde que se ordena
+DIAS_IMPORTACION = 90
+
+# Días pronosticados (más allá, el stock se considera suficiente)
+HORIZONTE = 365
+
+TEMPORADA = 7
+AMORTIGUAMIENTO = 0.9
+ALFAS = (0.1, 0.2, 0.3, 0.5)
+BETAS = (0.0, 0.05)
+GAMAS = (0.0, 0.1, 0.3)
+
+Mov = MovimientoInventario.Tipo
+
+
+def serie_diaria(desde, hasta):
+    """Kilos vendidos netos por día local en [desde, hasta], con ceros en los días sin ventas"""
+    por_dia = dict(
+        MovimientoInventario.objects
+        .filter(
+            tipo__in=[Mov.VENTA, Mov.NOTA_CREDITO],
+            fecha__gte=services_inventario._inicio_dia(desde),
+            fecha__lt=services_inventario._inicio_dia(hasta + datetime.timedelta(days=1)),
+        )
+        .annotate(dia=TruncDate('fecha'))
+        .values('dia')
+        .annotate(s=Sum('kilos'))
+        .order_by()
+        .values_list('dia', 's')
+    )
+    dias = (hasta - desde).days + 1
+    return [
+        -float(por_dia.get(desde + datetime.timedelta(days=i), 0))
+        for i in range(dias)
+    ]
+
+
+def _holt_winters(serie, alfa, beta, gama, temporada):
+    """
+    Ajuste aditivo. Returns: (error cuadrático de un paso, estado final)
+    Con temporada=1 y gama=0 es Holt (tendencia amortiguada) sin estacionalidad.
+    """
+    m = temporada
+    nivel = sum(serie[:m]) / m
+    if len(serie) >= 2 * m:
+        tendencia = (sum(serie[m:2 * m]) - sum(serie[:m])) / (m * m)
+    else:
+        tendencia = 0.0
+    estacion = [y - nivel for y in serie[:m]] if m > 1 else [0.0]
+
+    error = 0.0
+    for t, y in enumerate(serie):
+        s = estacion[t % m]
+        previsto = nivel + AMORTIGUAMIENTO * tendencia + s
+        if t >= m:
+            error += (y - previsto) ** 2
+        nuevo_nivel = alfa * (y - s) + (1 - alfa) * (nivel + AMORTIGUAMIENTO * tendencia)
+        tendencia = beta * (nuevo_nivel - nivel) + (1 - beta) * AMORTIGUAMIENTO * tendencia
+        estacion[t % m] = gama * (y - nuevo_nivel) + (1 - gama) * s
+        nivel = nuevo_nivel
+    return error, (nivel, tendencia, estacion, len(serie))
+
+
+def _proyectar(estado, horizonte):
+    nivel, tendencia, estacion, n = estado
+    m = len(estacion)
+    salida, amortiguada, factor = [], 0.0, 1.0
+    for h in range(1, horizonte + 1):
+        factor *= AMORTIGUAMIENTO
+        amortiguada += factor
+        salida.append(max(0.0, nivel + amortiguada * tendencia + estacion[(n + h - 1) % m]))
+    return salida
+
+
+def pronosticar(serie, horizonte=HORIZONTE):
+    """
+    Returns:
+        dict: metodo, parametros, pronostico (kilos/día, `horizonte` valores)
+    """
+    if not any(serie):
+        return {'metodo': 'sin_ventas', 'parametros': {}, 'pronostico': [0.0] * horizonte}
+
+    temporada = TEMPORADA if len(serie) >= 2 * TEMPORADA else 1
+    gamas = GAMAS if temporada > 1 else (0.0,)
+    mejor = None
+    for alfa, beta, gama in itertools.product(ALFAS, BETAS, gamas):
+        error, estado = _holt_winters(serie, alfa, beta, gama, temporada)
+        if mejor is None or error < mejor[0]:
+            mejor = (error, estado, {'alfa': alfa, 'beta': beta, 'gama': gama})
+    _, estado, parametros = mejor
+    return {
+        'metodo': 'holt_winters_semanal' if temporada > 1 else 'holt',
+        'parametros': parametros,
+        'pronostico': [round(x, 3) for x in _proyectar(estado, horizonte)],
+    }
+
+
+def plan_reposicion(pronostico, stock_kg, dia_base, hoy, dias_importacion=DIAS_IMPORTACION):
+    """
+    Cruza un pronóstico (kilos/día desde dia_base + 1) con el stock de hoy.
+    Sin consultas: la vista lo usa con el stock actual sobre el pronóstico guardado.
+
+    Returns:
+        dict: consumo_diario, dias_stock, fecha_quiebre, fecha_orden,
+        dias_hasta_ordenar (None los que no aplican)
+    """
+    futuro = pronostico[max(0, (hoy - dia_base).days):]
+    proximos = futuro[:30]
+    consumo_diario = Decimal('0.00')
+    if proximos:
+        consumo_diario = Decimal(str(sum(proximos) / len(proximos))).quantize(Decimal('0.01'))
+
+    dias_stock = None
+    restante = max(0.0, float(stock_kg))
+    for i, kilos in enumerate(futuro):
+        if kilos >= restante:
+            dias_stock = Decimal(str(i + (restante / kilos if kilos else 0))).quantize(Decimal('0.1'))
+            break
+        restante -= kilos
+
+    plan = {
+        'consumo_diario': consumo_diario,
+        'dias_stock': dias_stock,
+        'fecha_quiebre': None,
+        'fecha_orden': None,
+        'dias_hasta_ordenar': None,
+    }
+    if dias_stock is not None:
+        plan['fecha_quiebre'] = hoy + datetime.timedelta(days=float(dias_stock))
+        plan['dias_hasta_ordenar'] = dias_stock - Decimal(dias_importacion)
+        plan['fecha_orden'] = max(hoy, plan['fecha_quiebre'] - datetime.timedelta(days=dias_importacion))
+    return plan
+
+
+def calcular(hoy=None, ventanas=VENTANAS, guardar=True):
+    """
+    Ajusta (y guarda, con guardar=True) un PronosticoDemanda por ventana
+    con una sola consulta de la serie (la de la ventana más larga). Se
+    usan días completos: la serie termina ayer.
+
+    Returns:
+        list[PronosticoDemanda]
+    """
+    hoy = hoy or timezone.localdate()
+    dia_base = hoy - datetime.timedelta(days=1)
+    larga = max(ventanas)
+    serie = serie_diaria(dia_base - datetime.timedelta(days=larga - 1), dia_base)
+    stock = services_inventario.stock_actual()
+    ahora = timezone.now()
+
+    filas = []
+    for ventana in sorted(ventanas):
+        tramo = serie[-ventana:]
+        ajuste = pronosticar(tramo)
+        plan = plan_reposicion(ajuste['pronostico'], stock, dia_base, hoy)
+        filas.append(PronosticoDemanda(
+            ventana_dias=ventana,
+            calculado_en=ahora,
+            dia_base=dia_base,
+            metodo=ajuste['metodo'],
+            parametros=ajuste['parametros'],
+            kilos_ventana=Decimal(str(sum(tramo))).quantize(Decimal('0.01')),
+            pronostico=ajuste['pronostico'],
+            consumo_diario=plan['consumo_diario'],
+            stock_kg=stock,
+            fecha_quiebre=plan['fecha_quiebre'],
+            fecha_orden=plan['fecha_orden'],
+        ))
+
+    if not guardar:
+        return filas
+    with transaction.atomic():
+        PronosticoDemanda.objects.filter(ventana_dias__in=ventanas).delete()
+        PronosticoDemanda.objects.bulk_create(filas)
+    logger.info(
+        "Pronóstico de demanda: "
+        + ", ".join(f"{f.ventana_dias}d {f.consumo_diario} kg/día" for f in filas)
+    )
+    return filas
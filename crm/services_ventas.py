@@ -0,0 +1,135 @@
+# crm/services_ventas.py
+"""
+Ingreso de una venta con todos sus ítems de una vez: una transacción,
+un INSERT de la venta (con monto y kilos ya sumados) y un bulk_create
+de los ítems. bulk_create no dispara las señales de VentaItem, así que
+los totales se calculan una sola vez aquí.
+"""
+from decimal import Decimal, InvalidOperation
+
+from django import forms
+from django.db import transaction
+
+from .models import Producto, VentaItem
+
+MAX_ITEMS_POR_VENTA = 200
+
+# Mismos límites que las columnas: precio, subtotal y kilos tienen
+# max_digits=12 y decimal_places=2; cantidad es un entero de 32 bits
+CAMPO_PRECIO = forms.DecimalField(max_digits=12, decimal_places=2, min_value=0)
+CAMPO_CANTIDAD = forms.IntegerField(min_value=1, max_value=2**31 - 1)
+MAXIMO_MONTO = Decimal('1E10')  # 10 dígitos enteros
+
+
+class VentaLoteError(Exception):
+    """Ítems inválidos; `errores` es {índice del ítem: [mensajes]}"""
+
+    def __init__(self, errores):
+        super().__init__('Ítems inválidos')
+        self.errores = errores
+
+
+def _entero_positivo(valor):
+    try:
+        numero = int(valor)
+    except (TypeError, ValueError):
+        return None
+    return numero if numero > 0 else None
+
+
+def _limpiar(campo, valor):
+    """Valor validado por el campo de formulario, o None si no es válido"""
+    try:
+        return campo.clean(valor)
+    except (forms.ValidationError, InvalidOperation, TypeError, ValueError):
+        return None
+
+
+def _precio(valor):
+    precio = _limpiar(CAMPO_PRECIO, None if valor is None else str(valor))
+    return None if precio is None else precio.quantize(Decimal('0.01'))
+
+
+def _cabe(valor):
+    return abs(valor) < MAXIMO_MONTO
+
+
+def preparar_items(items):
+    """
+    Valida los ítems ({producto, cantidad, precio_unitario}) con una sola
+    consulta de productos.
+
+    Returns:
+        lista de VentaItem sin guardar (sin venta), con kilos y subtotal calculados
+
+    Raises:
+        VentaLoteError
+    """
+    if not items:
+        raise VentaLoteError({'items': ['La venta debe tener al menos un ítem.']})
+    if len(items) > MAX_ITEMS_POR_VENTA:
+        raise VentaLoteError({'items': [f'Máximo {MAX_ITEMS_POR_VENTA} ítems por venta.']})
+
+    ids = {_entero_positivo(it.get('producto')) for it in items if isinstance(it, dict)}
+    productos = Producto.objects.filter(activo=True).in_bulk(ids - {None})
+
+    errores = {}
+    preparados = []
+    for i, it in enumerate(items):
+        if not isinstance(it, dict):
+            errores[i] = ['Ítem inválido.']
+            continue
+        producto = productos.get(_entero_positivo(it.get('producto')))
+        cantidad = _limpiar(CAMPO_CANTIDAD, it.get('cantidad', 1))
+        precio = _precio(it.get('precio_unitario'))
+
+        mensajes = []
+        if producto is None:
+            mensajes.append('Producto inexistente o inactivo.')
+        if cantidad is None:
+            mensajes.append('La cantidad debe ser un entero mayor que cero.')
+        if precio is None:
+            mensajes.append('Precio unitario inválido.')
+        if mensajes:
+            errores[i] = mensajes
+            continue
+
+        item = VentaItem(producto=producto, cantidad=cantidad, precio_unitario=precio)
+        item.calcular_totales()
+        if not _cabe(item.subtotal):
+            mensajes.append('El subtotal excede el máximo permitido.')
+        if not _cabe(item.kilos):
+            mensajes.append('Los kilos exceden el máximo permitido.')
+        if mensajes:
+            errores[i] = mensajes
+            continue
+        preparados.append(item)
+
+    if errores:
+        raise VentaLoteError(errores)
+    if not _cabe(sum(it.subtotal for it in preparados)) or not _cabe(sum(it.kilos for it in preparados)):
+        raise VentaLoteError({'items': ['El total de la venta excede el máximo permitido.']})
+    return preparados
+
+
+def crear_venta_con_items(venta, items, kilos_desde_items=True):
+    """
+    Guarda una venta nueva (sin guardar aún) junto con sus ítems ya
+    preparados (ver preparar_items).
+
+    Args:
+        kilos_desde_items: si True, kilos_total = suma de los kilos de los ítems
+
+    Returns:
+        la venta guardada
+    """
+    venta.monto_total = sum((it.subtotal for it in items), Decimal('0.00'))
+    if kilos_desde_items:
+        venta.kilos_total = sum((it.kilos for it in items), Decimal('0.00'))
+
+    with transaction.atomic():
+        venta.save()
+        for it in items:
+            it.venta = venta
+        VentaItem.objects.bulk_create(items)
+    return venta
@@ -0,0 +1,117 @@
+# crm/services_ventas_diarias.py
+"""
+Mantención de VentaDiaria (hechos diarios por día local, canal y tipo
+de documento). La unidad de recálculo es el día: recalcular un día cuesta
+lo que tengan sus ventas, no el historial completo. Qué días recalcular
+lo decide services_mantencion. Cada recálculo queda anotado para la
+analítica en memoria (services_analitica.registrar_cambio).
+"""
+import datetime
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+
+from . import services_analitica
+from .models import Venta, VentaDiaria
+
+ES_NOTA_CREDITO = Q(tipo_documento=Venta.TipoDocumento.NOTA_CREDITO)
+
+# Días por consulta al recalcular (límite de parámetros de SQLite)
+MAX_DIAS_POR_CONSULTA = 500
+
+# Campos de Venta que cambian el grupo o la primera compra del cliente
+CAMPOS_CLAVE = {'fecha', 'canal', 'tipo_documento', 'cliente', 'cliente_id'}
+
+
+def _filas(ventas):
+    """
+    Agrupa un queryset de Venta en filas de VentaDiaria (sin guardar).
+    La primera compra sale de Cliente.primera_compra / primera_venta.
+    """
+    agrupado = (
+        ventas
+        .annotate(
+            dia=TruncDate('fecha'),
+            dia_primera=TruncDate('cliente__primera_compra'),
+        )
+        .values('dia', 'canal', 'tipo_documento')
+        .annotate(
+            n=Count('id'),
+            suma_monto=Sum('monto_total'),
+            suma_kilos=Sum('kilos_total'),
+            n_primeras=Count('id', filter=Q(cliente__primera_venta_id=F('id'))),
+            suma_primeras=Sum('monto_total', filter=Q(dia=F('dia_primera')) & ~ES_NOTA_CREDITO),
+        )
+        .order_by()
+    )
+    return [
+        VentaDiaria(
+            dia=r['dia'],
+            canal=r['canal'],
+            tipo_documento=r['tipo_documento'],
+            cantidad=r['n'],
+            monto=r['suma_monto'] or Decimal('0'),
+            kilos=r['suma_kilos'] or Decimal('0'),
+            primeras_compras=r['n_primeras'],
+            monto_primeras=r['suma_primeras'] or Decimal('0'),
+        )
+        for r in agrupado
+    ]
+
+
+def recalcular_dias(dias):
+    """Reemplaza las filas de VentaDiaria de esos días con lo que hay en Venta"""
+    dias = sorted(d for d in dias if d is not None)
+    with transaction.atomic():
+        for i in range(0, len(dias), MAX_DIAS_POR_CONSULTA):
+            lote = dias[i:i + MAX_DIAS_POR_CONSULTA]
+            VentaDiaria.objects.filter(dia__in=lote).delete()
+            VentaDiaria.objects.bulk_create(_filas(Venta.objects.filter(fecha__date__in=lote)))
+        if dias:
+            services_analitica.registrar_cambio(dias[0])
+
+
+def reconstruir(desde=None, hasta=None):
+    """
+    Reconstruye VentaDiaria completa (o el rango de días indicado).
+
+    Returns:
+        cantidad de filas creadas
+    """
+    ventas = Venta.objects.all()
+    existentes = VentaDiaria.objects.all()
+    if desde is not None:
+        ventas = ventas.filter(fecha__date__gte=desde)
+        existentes = existentes.filter(dia__gte=desde)
+    if hasta is not None:
+        ventas = ventas.filter(fecha__date__lte=hasta)
+        existentes = existentes.filter(dia__lte=hasta)
+
+    with transaction.atomic():
+        existentes.delete()
+        filas = VentaDiaria.objects.bulk_create(_filas(ventas), batch_size=500)
+        services_analitica.registrar_cambio(desde or datetime.date.min)
+    return len(filas)
+
+
+def estado_anterior(venta, update_fields=None):
+    """
+    Antes de guardar: día y cliente con que la venta está hoy en la BD
+    (también cambian al editarla). None si el cambio sólo toca montos/kilos.
+    """
+    if update_fields is not None and not (set(update_fields) & CAMPOS_CLAVE):
+        return None
+    anterior = None
+    if venta.pk is not None:
+        anterior = (
+            Venta.objects
+            .filter(pk=venta.pk)
+            .annotate(dia=TruncDate('fecha'))
+            .values('dia', 'cliente_id')
+            .first()
+        )
+    if anterior is None:
+        return {'dias': set(), 'clientes': set()}
+    return {'dias': {anterior['dia']}, 'clientes': {anterior['cliente_id']}}
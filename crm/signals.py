@@ -1,13 +1,109 @@
-from django.db.models.signals import post_save, post_delete
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
-from .models import VentaItem
+from .models import ComposicionBolsa, Importacion, MovimientoBolsa, Producto, Venta, VentaItem
+from . import services_costos, services_inventario, services_mantencion
+from . import services_ventas_diarias
+from .services import recalcular_kilos_producto
 
 
+@receiver(pre_save, sender=VentaItem)
+def calcular_totales_item_cargado(sender, instance, raw=False, **kwargs):
+    # save() calcula kilos y subtotal; loaddata (raw) guarda sin pasar por save()
+    if raw:
+        instance.calcular_totales()
+
+
+# --- Agregados de ventas: se anotan como sucios y se recalculan al
+# confirmar la transacción (ver services_mantencion) ---
+
 @receiver(post_save, sender=VentaItem)
-def actualizar_monto_venta_al_guardar_item(sender, instance, **kwargs):
-    instance.venta.recalcular_monto_total()
+def actualizar_monto_venta_al_guardar_item(sender, instance, raw=False, **kwargs):
+    # loaddata trae monto_total en la venta: no se recalcula desde los ítems
+    if raw:
+        return
+    services_mantencion.marcar(ventas=[instance.venta_id])
 
 
 @receiver(post_delete, sender=VentaItem)
 def actualizar_monto_venta_al_borrar_item(sender, instance, **kwargs):
-    instance.venta.recalcular_monto_total()
+    services_mantencion.marcar(ventas=[instance.venta_id])
+
+
+@receiver(pre_save, sender=Venta)
+def recordar_estado_venta(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    instance._estado_anterior = services_ventas_diarias.estado_anterior(instance, update_fields)
+
+
+@receiver(post_save, sender=Venta)
+def marcar_venta_al_guardar(sender, instance, raw=False, **kwargs):
+    dias = {services_mantencion.dia_local(instance.fecha)}
+    clientes = {instance.cliente_id} if raw else set()
+    anterior = None if raw else getattr(instance, '_estado_anterior', None)
+    movimientos = [instance.pk] if raw else []
+    if anterior is not None:
+        # Cambió fecha, cliente, canal o tipo: también su movimiento de inventario
+        dias |= anterior['dias']
+        clientes = anterior['clientes'] | {instance.cliente_id}
+        movimientos = [instance.pk]
+    services_mantencion.marcar(dias=dias, clientes=clientes, movimientos=movimientos)
+
+
+@receiver(post_delete, sender=Venta)
+def marcar_venta_al_borrar(sender, instance, **kwargs):
+    services_mantencion.marcar(
+        movimientos=[instance.pk],
+        dias=[services_mantencion.dia_local(instance.fecha)],
+        clientes=[instance.cliente_id],
+    )
+
+
+@receiver(pre_save, sender=Producto)
+def recordar_peso_producto(sender, instance, raw=False, **kwargs):
+    if raw or instance.pk is None:
+        return
+    instance._peso_anterior = (
+        Producto.objects.filter(pk=instance.pk).values_list('peso_kg', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=Producto)
+def actualizar_kilos_items_al_cambiar_peso(sender, instance, created, raw=False, **kwargs):
+    if raw or created:
+        return
+    if getattr(instance, '_peso_anterior', instance.peso_kg) != instance.peso_kg:
+        recalcular_kilos_producto(instance)
+
+
+@receiver(post_save, sender=Importacion)
+@receiver(post_delete, sender=Importacion)
+def registrar_importacion_en_libro(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    importacion_id = instance.pk  # al borrar, Django lo deja en None después de la señal
+    transaction.on_commit(lambda: services_costos.actualizar_por_importacion(importacion_id))
+
+
+# --- Stock diario de bolsas: se invalida desde el día que cambia ---
+
+@receiver(pre_save, sender=MovimientoBolsa)
+def recordar_fecha_movimiento_bolsa(sender, instance, **kwargs):
+    instance._fecha_anterior = (
+        MovimientoBolsa.objects.filter(pk=instance.pk).values_list('fecha', flat=True).first()
+        if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=MovimientoBolsa)
+@receiver(post_delete, sender=MovimientoBolsa)
+def invalidar_stock_diario_por_bolsas(sender, instance, **kwargs):
+    fechas = [instance.fecha, getattr(instance, '_fecha_anterior', None)]
+    services_inventario.invalidar_stock_diario(min(f for f in fechas if f is not None))
+
+
+@receiver(post_save, sender=ComposicionBolsa)
+@receiver(post_delete, sender=ComposicionBolsa)
+def invalidar_stock_diario_por_composicion(sender, instance, **kwargs):
+    services_inventario.invalidar_stock_diario()
@@ -21,6 +21,7 @@ urlpatterns = [
     path("ventas/<int:venta_id>/", views.venta_detalle, name="venta_detalle"),
     path("ventas/<int:venta_id>/items/agregar/", views.venta_item_agregar, name="venta_item_agregar"),
     path("ventas/items/<int:item_id>/borrar/", views.venta_item_borrar, name="venta_item_borrar"),
+    path("api/ventas/", views.api_venta_crear, name="api_venta_crear"),
 
     # Buscadores
     path("buscar-telefono/", views.buscar_cliente_telefono, name="buscar_cliente_telefono"),
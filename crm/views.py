@@ -9,17 +9,22 @@ from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.db.models import (
-    Sum, Count, Max, Min, Value, DecimalField, Q, DateField, F,
-    ExpressionWrapper, Prefetch, OuterRef, Subquery,
+    Sum, Count, Max, Value, DecimalField, Q, DateField, Prefetch,
 )
-from django.db.models.functions import Coalesce, TruncMonth, TruncDate
+from django.db.models.functions import Coalesce, TruncMonth
+from django.http import JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.utils import timezone
 from django.utils.dateparse import parse_date
 from django.views.decorators.http import require_POST
 
-from .models import Cliente, Venta, VentaItem, Producto, Importacion, GastoOperacional
+from .models import (
+    Cliente, Venta, VentaItem, Producto, Importacion, GastoOperacional, PronosticoDemanda,
+)
 from .forms import ClienteForm, VentaForm, VentaItemForm
+from .services_ventas import VentaLoteError, crear_venta_con_items, preparar_items
+from . import services_analitica, services_inventario, services_pronostico
+from .dinero import a_decimal
 
 logger = logging.getLogger(__name__)
 
@@ -346,6 +351,74 @@ def venta_item_borrar(request, item_id):
     return redirect("crm:venta_detalle", venta_id=venta_id)
 
 
+# -------------------------
+# API: VENTA CON TODOS SUS ÍTEMS
+# -------------------------
+def _venta_json(venta, items):
+    return {
+        "id": venta.id,
+        "cliente": venta.cliente_id,
+        "fecha": timezone.localtime(venta.fecha).isoformat(),
+        "canal": venta.canal,
+        "tipo_documento": venta.tipo_documento,
+        "numero_documento": venta.numero_documento,
+        "monto_total": str(venta.monto_total),
+        "kilos_total": str(venta.kilos_total),
+        "items": [
+            {
+                "id": it.id,
+                "producto": it.producto_id,
+                "cantidad": it.cantidad,
+                "precio_unitario": str(it.precio_unitario),
+                "kilos": str(it.kilos),
+                "subtotal": str(it.subtotal),
+            }
+            for it in items
+        ],
+    }
+
+
+@login_required
+@require_POST
+def api_venta_crear(request):
+    """
+    Crea una venta con todos sus ítems en una transacción.
+
+    Body JSON: {"venta": {cliente, fecha?, canal, tipo_documento, numero_documento,
+    kilos_total?, ...}, "items": [{producto, cantidad, precio_unitario}, ...]}.
+    Sin kilos_total, se usa la suma de los kilos de los ítems.
+    """
+    try:
+        datos = json.loads(request.body or b"{}")
+    except ValueError:
+        return JsonResponse({"error": "JSON inválido"}, status=400)
+    if not isinstance(datos, dict) or not isinstance(datos.get("venta"), dict):
+        return JsonResponse({"error": "Falta el objeto 'venta'"}, status=400)
+    if not isinstance(datos.get("items"), list):
+        return JsonResponse({"error": "Falta la lista 'items'"}, status=400)
+
+    datos_venta = dict(datos["venta"])
+    kilos_desde_items = datos_venta.get("kilos_total") in (None, "")
+    if kilos_desde_items:
+        datos_venta["kilos_total"] = "0"
+    datos_venta.setdefault("fecha", timezone.localtime().strftime("%Y-%m-%d %H:%M:%S"))
+
+    form = VentaForm(datos_venta)
+    if not form.is_valid():
+        return JsonResponse({"error": "Venta inválida", "errores": form.errors}, status=400)
+    try:
+        items = preparar_items(datos["items"])
+    except VentaLoteError as e:
+        return JsonResponse({"error": "Ítems inválidos", "errores": e.errores}, status=400)
+
+    venta = crear_venta_con_items(form.save(commit=False), items, kilos_desde_items)
+    logger.info(
+        f"Venta #{venta.id} creada por API por {request.user.username} - "
+        f"{len(items)} ítems, Monto: ${venta.monto_total}"
+    )
+    return JsonResponse(_venta_json(venta, items), status=201)
+
+
 # -------------------------
 # BUSCADORES
 # -------------------------
@@ -406,71 +479,74 @@ def dashboard(request):
 
     # ============================================
     # CONSULTAS CON EL PERÍODO FILTRADO
+    # (resumen por mes, canal y tipo de documento desde VentaDiaria o,
+    # con CRM_ANALITICA_EN_MEMORIA, desde las columnas en memoria)
     # ============================================
-    ventas = Venta.objects.filter(fecha__date__gte=desde, fecha__date__lte=hasta)
-    ventas_normales = ventas.exclude(tipo_documento=Venta.TipoDocumento.NOTA_CREDITO)
+    cortes = services_analitica.cortes_mensuales(desde, hasta)
+    resumen = services_analitica.resumen(cortes)
+    todo_mes = services_analitica.agrupar(resumen, lambda k, canal, tipo: k)
+    sin_nc_mes = services_analitica.agrupar(resumen, lambda k, canal, tipo: k, sin_nc=True)
+    todo_canal = services_analitica.agrupar(resumen, lambda k, canal, tipo: canal)
+    sin_nc_canal = services_analitica.agrupar(resumen, lambda k, canal, tipo: canal, sin_nc=True)
 
-    ingresos = ventas_normales.aggregate(s=Sum("monto_total"))["s"] or Decimal("0")
-    kilos = ventas.aggregate(s=Sum("kilos_total"))["s"] or Decimal("0")
-    n_ventas = ventas_normales.count()
+    ingresos = a_decimal(sum(t.monto for t in sin_nc_mes.values()))
+    kilos = a_decimal(sum(t.kilos for t in todo_mes.values()))
+    n_ventas = sum(t.cantidad for t in sin_nc_mes.values())
 
     ticket_prom = Decimal("0")
     if n_ventas > 0:
         ticket_prom = (ingresos / Decimal(n_ventas)).quantize(Decimal("1"))
 
-    # Serie mensual
-    serie_qs = (
-        ventas.annotate(mes=TruncMonth("fecha"))
-        .values("mes")
-        .annotate(
-            ventas=Count("id"),
-            kilos=Sum("kilos_total"),
-            ingresos=Sum(
-                "monto_total",
-                filter=~Q(tipo_documento=Venta.TipoDocumento.NOTA_CREDITO),
-            ),
-        )
-        .order_by("mes")
-    )
+    # Serie mensual (ingresos sin notas de crédito; None si el mes sólo tiene notas)
+    serie = [
+        {
+            "mes": cortes[k].replace(day=1),
+            "ventas": t.cantidad,
+            "kilos": a_decimal(t.kilos),
+            "ingresos": a_decimal(sin_nc_mes[k].monto) if k in sin_nc_mes else None,
+        }
+        for k, t in sorted(todo_mes.items())
+    ]
 
     labels_mes, ingresos_mes, kilos_mes, ventas_mes = [], [], [], []
-    for r in serie_qs:
-        m = r["mes"]
-        labels_mes.append(m.strftime("%m-%Y") if m else "")
+    for r in serie:
+        labels_mes.append(r["mes"].strftime("%m-%Y"))
         ingresos_mes.append(float(r["ingresos"] or 0))
-        kilos_mes.append(float(r["kilos"] or 0))
-        ventas_mes.append(int(r["ventas"] or 0))
-
-    # Por canal
-    por_canal_qs = (
-        ventas.values("canal")
-        .annotate(
-            ventas=Count("id"),
-            ingresos=Sum(
-                "monto_total",
-                filter=~Q(tipo_documento=Venta.TipoDocumento.NOTA_CREDITO),
-            ),
-        )
-        .order_by("-ingresos")
-    )
-    canal_labels = [c["canal"] for c in por_canal_qs]
-    canal_ingresos = [float(c["ingresos"] or 0) for c in por_canal_qs]
-
-    # Top productos
-    kilos_expr = ExpressionWrapper(
-        F("cantidad") * F("producto__peso_kg"),
-        output_field=DecimalField(max_digits=12, decimal_places=2),
-    )
+        kilos_mes.append(float(r["kilos"]))
+        ventas_mes.append(r["ventas"])
 
-    top_productos_qs = (
+    # Por canal, de más a menos ingresos
+    por_canal = [
+        {
+            "canal": canal,
+            "ventas": t.cantidad,
+            "ingresos": a_decimal(sin_nc_canal[canal].monto) if canal in sin_nc_canal else None,
+        }
+        for canal, t in todo_canal.items()
+    ]
+    por_canal.sort(key=lambda c: (c["ingresos"] is None, -(c["ingresos"] or 0), c["canal"]))
+    canal_labels = [c["canal"] for c in por_canal]
+    canal_ingresos = [float(c["ingresos"] or 0) for c in por_canal]
+
+    # Top productos (VentaItem.kilos ya viene calculado; el nombre se
+    # busca sólo para los 10 productos del resultado)
+    top_productos_qs = list(
         VentaItem.objects
         .filter(venta__fecha__date__gte=desde, venta__fecha__date__lte=hasta)
         .exclude(venta__tipo_documento=Venta.TipoDocumento.NOTA_CREDITO)
-        .select_related('producto')
-        .values("producto__nombre")
-        .annotate(kilos=Sum(kilos_expr))
+        .values("producto_id")
+        .annotate(kilos=Sum("kilos"))
         .order_by("-kilos")[:10]
     )
+    nombres = dict(
+        Producto.objects
+        .filter(id__in=[p["producto_id"] for p in top_productos_qs])
+        .values_list("id", "nombre")
+    )
+    for p in top_productos_qs:
+        p["producto__nombre"] = nombres.get(p["producto_id"], "")
+
+    top_clientes = services_analitica.top_clientes(desde, hasta)
 
     prod_labels = [p["producto__nombre"] for p in top_productos_qs]
     prod_kilos = [float(p["kilos"] or 0) for p in top_productos_qs]
@@ -493,34 +569,25 @@ def dashboard(request):
     _, num_dias_mes = monthrange(mes_seleccionado.year, mes_seleccionado.month)
     fin_mes_seleccionado = mes_seleccionado.replace(day=num_dias_mes)
 
-    # --------- (ACTUAL) ventas diarias ----------
-    ventas_diarias = (
-        Venta.objects
-        .filter(
-            fecha__date__gte=inicio_mes_seleccionado,
-            fecha__date__lte=fin_mes_seleccionado
-        )
-        .exclude(tipo_documento=Venta.TipoDocumento.NOTA_CREDITO)
-        .annotate(dia=TruncDate('fecha'))
-        .values('dia')
-        .annotate(
-            cantidad=Count('id'),
-            valor_total=Coalesce(
-                Sum('monto_total'),
-                Value(Decimal("0.00")),
-                output_field=DecimalField(max_digits=12, decimal_places=2)
-            )
-        )
-        .order_by('dia')
+    # --------- (ACTUAL) ventas diarias y primeras compras ----------
+    diario = services_analitica.agrupar(
+        services_analitica.resumen(services_analitica.cortes_diarios(inicio_mes_seleccionado, fin_mes_seleccionado)),
+        lambda k, canal, tipo: k + 1,
+        sin_nc=True,
     )
 
     ventas_map = {}
-    for v in ventas_diarias:
-        dia_num = v['dia'].day
+    first_map = {}
+    for dia_num, t in diario.items():
         ventas_map[dia_num] = {
-            'cantidad': v['cantidad'],
-            'valor': float(v['valor_total'] or 0)
+            'cantidad': t.cantidad,
+            'valor': float(a_decimal(t.monto))
         }
+        if t.primeras:
+            first_map[dia_num] = {
+                "cantidad": t.primeras,
+                "valor": float(a_decimal(t.monto_primeras)),
+            }
 
     dias_labels = []
     cantidad_por_dia = []
@@ -542,49 +609,6 @@ def dashboard(request):
     # ================================================
     # ✅ NUEVO: PRIMERAS COMPRAS (CLIENTES NUEVOS) DEL MES SELECCIONADO
     # ================================================
-    base_mes = (
-        Venta.objects
-        .filter(
-            fecha__date__gte=inicio_mes_seleccionado,
-            fecha__date__lte=fin_mes_seleccionado
-        )
-        .exclude(tipo_documento=Venta.TipoDocumento.NOTA_CREDITO)
-    )
-
-    primera_fecha_subq = (
-        Venta.objects
-        .exclude(tipo_documento=Venta.TipoDocumento.NOTA_CREDITO)
-        .filter(cliente_id=OuterRef("cliente_id"))
-        .values("cliente_id")
-        .annotate(p=Min("fecha"))
-        .values("p")[:1]
-    )
-
-    ventas_first_time = (
-        base_mes
-        .annotate(primera_fecha=Subquery(primera_fecha_subq))
-        .annotate(dia=TruncDate("fecha"), dia_primera=TruncDate("primera_fecha"))
-        .filter(dia=F("dia_primera"))
-        .values("dia")
-        .annotate(
-            cantidad=Count("cliente_id", distinct=True),
-            valor_total=Coalesce(
-                Sum("monto_total"),
-                Value(Decimal("0.00")),
-                output_field=DecimalField(max_digits=12, decimal_places=2)
-            )
-        )
-        .order_by("dia")
-    )
-
-    first_map = {}
-    for v in ventas_first_time:
-        dia_num = v["dia"].day
-        first_map[dia_num] = {
-            "cantidad": v["cantidad"],
-            "valor": float(v["valor_total"] or 0),
-        }
-
     cantidad_first_por_dia = []
     valor_first_por_dia = []
     for dia in range(1, num_dias_mes + 1):
@@ -617,9 +641,10 @@ def dashboard(request):
         "kpi_n_ventas": n_ventas,
         "kpi_ticket": ticket_prom,
 
-        "serie": list(serie_qs),
-        "por_canal": list(por_canal_qs),
+        "serie": serie,
+        "por_canal": por_canal,
         "top_productos": list(top_productos_qs),
+        "top_clientes": top_clientes,
 
         "labels_mes_json": json.dumps(labels_mes),
         "ingresos_mes_json": json.dumps(ingresos_mes),
@@ -779,6 +804,9 @@ def resumen_mensual(request):
 # -------------------------
 # INVENTARIO
 # -------------------------
+DIAS_HISTORIAL_STOCK = 180
+
+
 @login_required
 def inventario(request):
     try:
@@ -791,11 +819,10 @@ def inventario(request):
         except Exception:
             dias = 30
 
-        dias_importacion = 90
+        dias_importacion = services_pronostico.DIAS_IMPORTACION
 
         desde_consumo = hoy - timezone.timedelta(days=dias)
 
-        # ✅ NUEVO: Usar kilos_restantes que ya descuenta la merma automáticamente
         importaciones_stats = Importacion.objects.aggregate(
             ingresados_bruto=Coalesce(
                 Sum("kilos_ingresados"),
@@ -807,69 +834,50 @@ def inventario(request):
                 Value(0),
                 output_field=DecimalField(max_digits=12, decimal_places=2),
             ),
-            disponibles=Coalesce(
-                Sum("kilos_restantes"),  # ✅ Este campo ya tiene merma descontada
-                Value(0),
-                output_field=DecimalField(max_digits=12, decimal_places=2),
-            )
         )
 
         kilos_ingresados_bruto = importaciones_stats["ingresados_bruto"] or Decimal("0")
         merma_total = importaciones_stats["merma_total"] or Decimal("0")
-        kilos_ingresados_neto = importaciones_stats["disponibles"] or Decimal("0")
-
-        kilos_expr = ExpressionWrapper(
-            F("cantidad") * F("producto__peso_kg"),
-            output_field=DecimalField(max_digits=12, decimal_places=2),
-        )
-
-        kilos_vendidos_total = (
-            VentaItem.objects.exclude(venta__tipo_documento=Venta.TipoDocumento.NOTA_CREDITO)
-            .aggregate(
-                s=Coalesce(
-                    Sum(kilos_expr),
-                    Value(0),
-                    output_field=DecimalField(max_digits=12, decimal_places=2),
-                )
-            )["s"]
-            or Decimal("0")
-        )
-
-        # ✅ Stock = Kilos netos disponibles - Kilos vendidos
-        stock_kg = (kilos_ingresados_neto - kilos_vendidos_total).quantize(Decimal("0.01"))
-
-        kilos_vendidos_ventana = (
-            VentaItem.objects.filter(venta__fecha__date__gte=desde_consumo)
-            .exclude(venta__tipo_documento=Venta.TipoDocumento.NOTA_CREDITO)
-            .aggregate(
-                s=Coalesce(
-                    Sum(kilos_expr),
-                    Value(0),
-                    output_field=DecimalField(max_digits=12, decimal_places=2),
-                )
-            )["s"]
-            or Decimal("0")
-        )
-
-        consumo_diario = Decimal("0.00")
-        if dias > 0:
-            consumo_diario = (kilos_vendidos_ventana / Decimal(dias)).quantize(Decimal("0.01"))
-
-        dias_stock = None
-        fecha_reorden_estimada = None
-        fecha_orden_sugerida = None
-        dias_hasta_ordenar = None
-
-        if consumo_diario > 0:
-            dias_stock = (stock_kg / consumo_diario).quantize(Decimal("0.1"))
-            fecha_reorden_estimada = hoy + timezone.timedelta(days=float(dias_stock))
-
-            dias_hasta_ordenar = dias_stock - Decimal(str(dias_importacion))
-
-            if dias_hasta_ordenar > 0:
-                fecha_orden_sugerida = hoy + timezone.timedelta(days=float(dias_hasta_ordenar))
-            else:
-                fecha_orden_sugerida = hoy
+        # kilos_restantes ahora lo descuenta el FIFO (services_costos): el
+        # neto ingresado es bruto - merma
+        kilos_ingresados_neto = kilos_ingresados_bruto - merma_total
+
+        # ✅ Stock desde el libro de inventario (última fila); lo vendido es
+        # neto de notas de crédito
+        stock_kg = services_inventario.stock_actual().quantize(Decimal("0.01"))
+        kilos_vendidos_total = kilos_ingresados_neto - stock_kg
+
+        # ✅ Pronóstico precalculado (services_pronostico, una fila por
+        # ventana; lo guarda el comando calcular_pronostico) cruzado con el
+        # stock actual. Una ventana que no esté precalculada se ajusta en
+        # el momento sin guardarla: la vista no escribe
+        pronosticos = {p.ventana_dias: p for p in PronosticoDemanda.objects.all()}
+        if dias not in pronosticos:
+            pronosticos[dias] = services_pronostico.calcular(hoy, ventanas=[dias], guardar=False)[0]
+
+        ventanas = []
+        for ventana, pronostico in sorted(pronosticos.items()):
+            plan = services_pronostico.plan_reposicion(
+                pronostico.pronostico, stock_kg, pronostico.dia_base, hoy, dias_importacion,
+            )
+            ventanas.append({"dias": ventana, "pronostico": pronostico, **plan})
+        seleccion = next(v for v in ventanas if v["dias"] == dias)
+
+        kilos_vendidos_ventana = seleccion["pronostico"].kilos_ventana
+        consumo_diario = seleccion["consumo_diario"]
+        dias_stock = seleccion["dias_stock"]
+        fecha_reorden_estimada = seleccion["fecha_quiebre"]
+        fecha_orden_sugerida = seleccion["fecha_orden"]
+        dias_hasta_ordenar = seleccion["dias_hasta_ordenar"]
+
+        # ✅ Historial de stock: una fila precalculada por día (StockDiario)
+        # más el punto de hoy con el stock actual
+        historial = services_inventario.historial_stock(hoy - timezone.timedelta(days=DIAS_HISTORIAL_STOCK))
+        bolsas_hoy = services_inventario.stock_bolsas(hoy)
+        historial_labels = [f.dia.strftime("%d-%m") for f in historial] + [hoy.strftime("%d-%m")]
+        historial_kilos = [float(f.kilos) for f in historial] + [float(stock_kg)]
+        historial_bolsas_8 = [f.bolsas_8 for f in historial] + [bolsas_hoy["8"]]
+        historial_bolsas_20 = [f.bolsas_20 for f in historial] + [bolsas_hoy["20"]]
 
         umbral_reorden_dias = dias_importacion
         alerta_reorden = (dias_stock is not None) and (dias_stock <= Decimal(str(umbral_reorden_dias)))
@@ -892,6 +900,12 @@ def inventario(request):
             "dias_hasta_ordenar": dias_hasta_ordenar,
             "umbral_reorden_dias": umbral_reorden_dias,
             "alerta_reorden": alerta_reorden,
+            "ventanas": ventanas,
+            "pronostico": seleccion["pronostico"],
+            "historial_labels_json": json.dumps(historial_labels),
+            "historial_kilos_json": json.dumps(historial_kilos),
+            "historial_bolsas_8_json": json.dumps(historial_bolsas_8),
+            "historial_bolsas_20_json": json.dumps(historial_bolsas_20),
         }
         return render(request, "crm/inventario.html", context)
 
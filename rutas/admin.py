@@ -1,3 +1,28 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import PlanRutas, RutaOptimizada
+
+
+@admin.register(RutaOptimizada)
+class RutaOptimizadaAdmin(admin.ModelAdmin):
+    list_display = ("id", "creada_en", "direccion_origen", "distancia_km", "tiempo_total_ms", "solver")
+    date_hierarchy = "creada_en"
+    readonly_fields = ("telemetria",)
+
+    @admin.display(description="Tiempo total (ms)")
+    def tiempo_total_ms(self, obj):
+        return (obj.telemetria or {}).get("total_ms")
+
+    @admin.display(description="Solver")
+    def solver(self, obj):
+        return ((obj.telemetria or {}).get("solver") or {}).get("estrategia")
+
+
+@admin.register(PlanRutas)
+class PlanRutasAdmin(admin.ModelAdmin):
+    list_display = ("id", "creado_en", "fecha_inicio", "dias", "vehiculos", "distancia_km", "cantidad_sin_asignar")
+    date_hierarchy = "creado_en"
+
+    @admin.display(description="Sin asignar")
+    def cantidad_sin_asignar(self, obj):
+        return len(obj.sin_asignar)
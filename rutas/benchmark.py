@@ -0,0 +1,191 @@
+# rutas/benchmark.py
+"""
+Benchmark del optimizador sobre instancias sintéticas reproducibles
+alrededor de Concepción. Lo usa el comando `benchmark_optimizer`.
+"""
+import json
+import random
+import time
+import tracemalloc
+
+from . import geohash
+from . import optimizer
+from .services_cercania import listas_vecinos
+
+CENTRO = (-36.827, -73.050)  # Concepción (depósito = índice 0)
+TAMANOS = [5, 9, 15, 50, 200, 1000]
+TIPOS = ['aleatoria', 'agrupada']
+
+# Factor de desvío de calles sobre la distancia en línea recta
+FACTOR_CALLES = 1.3
+VELOCIDAD_KMH = 30
+K_VECINOS = 10
+
+# Tamaño máximo por estrategia (por encima no termina en tiempo razonable)
+ESTRATEGIAS = {
+    'fuerza_bruta': 9,
+    'heuristica': 200,
+    'heuristica_vecinos': 1000,
+    'ventanas': 1000,
+}
+
+# tracemalloc hace el 2-opt ~20× más lento; sobre este tamaño no se mide memoria
+MAX_N_MEMORIA = 200
+
+# Tolerancias al comparar contra la línea base
+TOLERANCIA_LARGO = 1e-6      # las instancias son deterministas: el largo no debería subir
+FACTOR_TIEMPO = 1.5          # más lento que 1.5× la línea base = regresión
+HOLGURA_TIEMPO_S = 0.05      # ...salvo diferencias absolutas menores a esto (ruido)
+
+
+def generar_instancia(n, tipo='aleatoria', semilla=0):
+    """
+    n puntos de entrega + depósito en CENTRO.
+
+    - aleatoria: uniforme en ~±9 km
+    - agrupada: 1 a 8 barrios con puntos concentrados (~900 m)
+
+    Returns:
+        lista de (lat, lng); el índice 0 es el depósito
+    """
+    rnd = random.Random(f"{tipo}-{n}-{semilla}")
+    lat0, lng0 = CENTRO
+    coords = [CENTRO]
+
+    if tipo == 'aleatoria':
+        coords.extend(
+            (lat0 + rnd.uniform(-0.08, 0.08), lng0 + rnd.uniform(-0.08, 0.08))
+            for _ in range(n)
+        )
+    elif tipo == 'agrupada':
+        centros = [
+            (lat0 + rnd.uniform(-0.08, 0.08), lng0 + rnd.uniform(-0.08, 0.08))
+            for _ in range(max(1, min(8, n // 10)))
+        ]
+        for _ in range(n):
+            c_lat, c_lng = rnd.choice(centros)
+            coords.append((rnd.gauss(c_lat, 0.008), rnd.gauss(c_lng, 0.008)))
+    else:
+        raise ValueError(f"Tipo de instancia desconocido: {tipo}")
+
+    return coords
+
+
+def matrices(coords):
+    """(distancias_km, duraciones_s) simétricas a partir de coordenadas"""
+    distancias = [
+        [geohash.distancia_m(*a, *b) / 1000 * FACTOR_CALLES for b in coords]
+        for a in coords
+    ]
+    duraciones = [[d / VELOCIDAD_KMH * 3600 for d in fila] for fila in distancias]
+    return distancias, duraciones
+
+
+def resolver(estrategia, coords, distancias, duraciones):
+    """Corre una estrategia y devuelve (ruta, distancia)"""
+    n = len(coords) - 1
+    entregas = list(range(1, n + 1))
+
+    if estrategia == 'fuerza_bruta':
+        return optimizer._solve_tsp_bruteforce(distancias, entregas, 0, None)
+    if estrategia == 'heuristica':
+        return optimizer._solve_tsp_heuristic(distancias, entregas, 0, None)
+    if estrategia == 'heuristica_vecinos':
+        vecinos = listas_vecinos(coords, K_VECINOS)
+        return optimizer._solve_tsp_heuristic(distancias, entregas, 0, None, vecinos=vecinos)
+    if estrategia == 'ventanas':
+        ruta, distancia, _, _ = optimizer.solve_tsp_ventanas(distancias, duraciones, n)
+        return ruta, distancia
+    raise ValueError(f"Estrategia desconocida: {estrategia}")
+
+
+def medir(estrategia, coords, repeticiones=1, memoria=True):
+    """
+    Tiempo (mejor de `repeticiones`), memoria pico (tracemalloc, en una
+    corrida aparte para no inflar el tiempo; None sobre MAX_N_MEMORIA)
+    y largo de la ruta.
+    """
+    distancias, duraciones = matrices(coords)
+
+    tiempos = []
+    for _ in range(max(1, repeticiones)):
+        inicio = time.perf_counter()
+        ruta, distancia = resolver(estrategia, coords, distancias, duraciones)
+        tiempos.append(time.perf_counter() - inicio)
+
+    pico_kb = None
+    if memoria and len(coords) - 1 <= MAX_N_MEMORIA:
+        tracemalloc.start()
+        try:
+            resolver(estrategia, coords, distancias, duraciones)
+            pico_kb = tracemalloc.get_traced_memory()[1] / 1024
+        finally:
+            tracemalloc.stop()
+
+    if sorted(ruta[1:-1]) != list(range(1, len(coords))):
+        raise AssertionError(f"{estrategia}: la ruta no visita todos los puntos una vez")
+
+    return {
+        'tiempo_s': round(min(tiempos), 6),
+        'memoria_kb': None if pico_kb is None else round(pico_kb, 1),
+        'largo_km': round(distancia, 6),
+    }
+
+
+def ejecutar(tamanos=None, tipos=None, estrategias=None, semilla=0, repeticiones=1,
+             memoria=True, al_medir=None):
+    """
+    Corre la matriz completa tamaño × tipo × estrategia.
+
+    Returns:
+        dict "estrategia/tipo/n" -> métricas
+    """
+    resultados = {}
+    for n in tamanos or TAMANOS:
+        for tipo in tipos or TIPOS:
+            coords = generar_instancia(n, tipo, semilla)
+            for estrategia in estrategias or ESTRATEGIAS:
+                if n > ESTRATEGIAS[estrategia]:
+                    continue
+                clave = f"{estrategia}/{tipo}/{n}"
+                resultados[clave] = medir(estrategia, coords, repeticiones, memoria)
+                if al_medir is not None:
+                    al_medir(clave, resultados[clave])
+    return resultados
+
+
+def comparar(resultados, base, factor_tiempo=FACTOR_TIEMPO):
+    """
+    Regresiones respecto a la línea base: ruta más larga o más lenta.
+
+    Returns:
+        lista de textos (vacía = sin regresiones)
+    """
+    regresiones = []
+    for clave, actual in resultados.items():
+        anterior = base.get(clave)
+        if anterior is None:
+            continue
+        if actual['largo_km'] > anterior['largo_km'] * (1 + TOLERANCIA_LARGO):
+            regresiones.append(
+                f"{clave}: largo {anterior['largo_km']:.3f} -> {actual['largo_km']:.3f} km"
+            )
+        if (actual['tiempo_s'] > anterior['tiempo_s'] * factor_tiempo
+                and actual['tiempo_s'] - anterior['tiempo_s'] > HOLGURA_TIEMPO_S):
+            regresiones.append(
+                f"{clave}: tiempo {anterior['tiempo_s']:.3f} -> {actual['tiempo_s']:.3f} s"
+            )
+    return regresiones
+
+
+def leer_base(ruta):
+    """Returns: (semilla, resultados)"""
+    with open(ruta, encoding='utf-8') as f:
+        datos = json.load(f)
+    return datos['semilla'], datos['resultados']
+
+
+def guardar_base(ruta, resultados, semilla):
+    with open(ruta, 'w', encoding='utf-8') as f:
+        json.dump({'semilla': semilla, 'resultados': resultados}, f, indent=2, sort_keys=True)
+        f.write('\n')
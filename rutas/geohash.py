@@ -0,0 +1,118 @@
+# rutas/geohash.py
+"""
+Geohash: codifica (lat, lng) en un texto base32 donde los prefijos
+comunes significan celdas cercanas. Se guarda en PuntoEntrega.geohash
+(columna con índice B-tree) para agrupar y filtrar por zona en SQL.
+"""
+import math
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_DECODIFICAR = {c: i for i, c in enumerate(BASE32)}
+
+# Precisión guardada en la base (~4.8 m × 4.8 m)
+PRECISION = 9
+
+RADIO_TIERRA_M = 6371000.0
+METROS_POR_GRADO = math.pi * RADIO_TIERRA_M / 180
+
+
+def codificar(lat, lng, precision=PRECISION):
+    """(lat, lng) -> geohash de `precision` caracteres"""
+    lat, lng = float(lat), float(lng)
+    lat_rango = [-90.0, 90.0]
+    lng_rango = [-180.0, 180.0]
+
+    resultado = []
+    bits = valor = 0
+    par = True  # los bits pares son longitud
+    while len(resultado) < precision:
+        rango, coordenada = (lng_rango, lng) if par else (lat_rango, lat)
+        medio = (rango[0] + rango[1]) / 2
+        if coordenada >= medio:
+            valor = (valor << 1) | 1
+            rango[0] = medio
+        else:
+            valor <<= 1
+            rango[1] = medio
+        par = not par
+        bits += 1
+        if bits == 5:
+            resultado.append(BASE32[valor])
+            bits = valor = 0
+
+    return "".join(resultado)
+
+
+def limites(geohash):
+    """
+    Celda del geohash.
+
+    Returns:
+        (lat_min, lng_min, lat_max, lng_max)
+    """
+    lat_rango = [-90.0, 90.0]
+    lng_rango = [-180.0, 180.0]
+    par = True
+    for caracter in geohash:
+        valor = _DECODIFICAR[caracter]
+        for bit in (16, 8, 4, 2, 1):
+            rango = lng_rango if par else lat_rango
+            medio = (rango[0] + rango[1]) / 2
+            if valor & bit:
+                rango[0] = medio
+            else:
+                rango[1] = medio
+            par = not par
+
+    return lat_rango[0], lng_rango[0], lat_rango[1], lng_rango[1]
+
+
+def centro(geohash):
+    """Centro (lat, lng) de la celda"""
+    lat_min, lng_min, lat_max, lng_max = limites(geohash)
+    return (lat_min + lat_max) / 2, (lng_min + lng_max) / 2
+
+
+def tamano_celda_m(precision, lat=0.0):
+    """
+    (alto, ancho) aproximado en metros de una celda de `precision`
+    caracteres a la latitud dada.
+    """
+    bits = 5 * precision
+    alto_grados = 180.0 / (2 ** (bits // 2))
+    ancho_grados = 360.0 / (2 ** (bits - bits // 2))
+    return (
+        alto_grados * METROS_POR_GRADO,
+        ancho_grados * METROS_POR_GRADO * max(math.cos(math.radians(float(lat))), 0.01),
+    )
+
+
+def celdas_alrededor(geohash):
+    """La celda y sus 8 vecinas (sin repetir; en los polos pueden ser menos)"""
+    lat_min, lng_min, lat_max, lng_max = limites(geohash)
+    alto = lat_max - lat_min
+    ancho = lng_max - lng_min
+    lat_c = (lat_min + lat_max) / 2
+    lng_c = (lng_min + lng_max) / 2
+
+    celdas = []
+    for dlat in (-1, 0, 1):
+        lat = lat_c + dlat * alto
+        if not -90 <= lat <= 90:
+            continue
+        for dlng in (-1, 0, 1):
+            lng = (lng_c + dlng * ancho + 180) % 360 - 180
+            celda = codificar(lat, lng, len(geohash))
+            if celda not in celdas:
+                celdas.append(celda)
+    return celdas
+
+
+def distancia_m(lat1, lng1, lat2, lng2):
+    """Distancia haversine en metros"""
+    lat1, lng1, lat2, lng2 = (math.radians(float(v)) for v in (lat1, lng1, lat2, lng2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * RADIO_TIERRA_M * math.asin(min(1.0, math.sqrt(a)))
@@ -0,0 +1,121 @@
+# rutas/management/commands/benchmark_optimizer.py
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rutas import benchmark
+
+BASE_POR_DEFECTO = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    'benchmarks', 'baseline.json',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide tiempo, memoria pico y largo de ruta de cada estrategia de solve_tsp '
+        'sobre instancias sintéticas (aleatorias y agrupadas) alrededor de Concepción, '
+        'y compara contra una línea base JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tamanos',
+            type=int,
+            nargs='+',
+            default=benchmark.TAMANOS,
+            help='Cantidad de puntos de entrega por instancia'
+        )
+        parser.add_argument(
+            '--tipos',
+            nargs='+',
+            choices=benchmark.TIPOS,
+            default=benchmark.TIPOS,
+        )
+        parser.add_argument(
+            '--estrategias',
+            nargs='+',
+            choices=list(benchmark.ESTRATEGIAS),
+            default=list(benchmark.ESTRATEGIAS),
+        )
+        parser.add_argument('--semilla', type=int, default=0)
+        parser.add_argument(
+            '--repeticiones',
+            type=int,
+            default=1,
+            help='Se informa el mejor tiempo de N corridas'
+        )
+        parser.add_argument(
+            '--sin-memoria',
+            action='store_true',
+            help='No medir memoria pico (evita la corrida extra con tracemalloc)'
+        )
+        parser.add_argument(
+            '--base',
+            default=BASE_POR_DEFECTO,
+            help='Archivo JSON de línea base'
+        )
+        parser.add_argument(
+            '--guardar-base',
+            action='store_true',
+            help='Guarda los resultados en la línea base (no compara)'
+        )
+        parser.add_argument(
+            '--factor-tiempo',
+            type=float,
+            default=benchmark.FACTOR_TIEMPO,
+            help='Regresión si el tiempo supera N veces el de la línea base'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'instancia':<36} {'tiempo (s)':>11} {'memoria (KB)':>13} {'largo (km)':>12}"
+        )
+
+        def mostrar(clave, r):
+            memoria = '-' if r['memoria_kb'] is None else f"{r['memoria_kb']:.1f}"
+            self.stdout.write(
+                f"{clave:<36} {r['tiempo_s']:>11.4f} {memoria:>13} {r['largo_km']:>12.3f}"
+            )
+
+        resultados = benchmark.ejecutar(
+            tamanos=options['tamanos'],
+            tipos=options['tipos'],
+            estrategias=options['estrategias'],
+            semilla=options['semilla'],
+            repeticiones=options['repeticiones'],
+            memoria=not options['sin_memoria'],
+            al_medir=mostrar,
+        )
+
+        ruta_base = options['base']
+        if options['guardar_base']:
+            # Corridas parciales (p. ej. --tamanos 50) sólo reemplazan sus claves
+            if os.path.exists(ruta_base):
+                semilla_base, base = benchmark.leer_base(ruta_base)
+                if semilla_base == options['semilla']:
+                    resultados = {**base, **resultados}
+            os.makedirs(os.path.dirname(ruta_base), exist_ok=True)
+            benchmark.guardar_base(ruta_base, resultados, options['semilla'])
+            self.stdout.write(self.style.SUCCESS(f"Línea base guardada en {ruta_base}"))
+            return
+
+        if not os.path.exists(ruta_base):
+            self.stdout.write(self.style.WARNING(
+                f"No existe {ruta_base}; usa --guardar-base para crearla."
+            ))
+            return
+
+        semilla_base, base = benchmark.leer_base(ruta_base)
+        if semilla_base != options['semilla']:
+            raise CommandError(
+                f"La línea base usa semilla {semilla_base}; corre con --semilla {semilla_base}."
+            )
+
+        regresiones = benchmark.comparar(resultados, base, factor_tiempo=options['factor_tiempo'])
+        if regresiones:
+            for texto in regresiones:
+                self.stderr.write(texto)
+            raise CommandError(f"{len(regresiones)} regresión(es) respecto a la línea base")
+
+        self.stdout.write(self.style.SUCCESS('Sin regresiones respecto a la línea base.'))
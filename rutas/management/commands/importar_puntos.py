@@ -0,0 +1,36 @@
+# rutas/management/commands/importar_puntos.py
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from rutas.services_carga import leer_filas, importar_puntos
+from rutas.services_geocoding import MAX_WORKERS_GEOCODING
+
+
+class Command(BaseCommand):
+    help = 'Importa puntos de entrega desde un archivo CSV/XLSX (geocodificación en paralelo)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', type=str, help='Ruta al archivo .csv o .xlsx')
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=MAX_WORKERS_GEOCODING,
+            help='Solicitudes de geocodificación simultáneas'
+        )
+
+    def handle(self, *args, **options):
+        ruta = options['archivo']
+        try:
+            with open(ruta, 'rb') as archivo:
+                filas = leer_filas(archivo, ruta)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        reporte = importar_puntos(filas, settings.GOOGLE_MAPS_API_KEY, max_workers=options['workers'])
+
+        for error in reporte['errores']:
+            self.stdout.write(self.style.WARNING(f"Fila {error['fila']}: {error['error']}"))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {reporte['creados']} de {reporte['total']} puntos creados."
+        ))
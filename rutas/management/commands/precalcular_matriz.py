@@ -0,0 +1,131 @@
+# rutas/management/commands/precalcular_matriz.py
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from rutas.models import PuntoEntrega, RutaOptimizada
+from rutas import services_matriz
+from rutas.services_matriz import clave_coordenada
+
+
+class Command(BaseCommand):
+    help = (
+        'Precalcula (de noche) la matriz completa de distancias/duraciones entre '
+        'bodegas y puntos de entrega conocidos. Se puede interrumpir y reanudar.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--deposito',
+            action='append',
+            default=[],
+            help='Coordenada "lat,lng" de una bodega/depósito (se puede repetir)'
+        )
+        parser.add_argument(
+            '--pausa',
+            type=float,
+            default=0.5,
+            help='Segundos de espera entre solicitudes a Google'
+        )
+        parser.add_argument(
+            '--max-elementos',
+            type=int,
+            default=20000,
+            help='Máximo de elementos (origen×destino) a consultar en esta corrida'
+        )
+        parser.add_argument(
+            '--reintentos',
+            type=int,
+            default=3,
+            help='Reintentos por bloque ante error o límite de cuota'
+        )
+        parser.add_argument(
+            '--refrescar-dias',
+            type=int,
+            help='Vuelve a consultar celdas más antiguas que N días'
+        )
+
+    def handle(self, *args, **options):
+        api_key = settings.GOOGLE_MAPS_API_KEY
+        if not api_key:
+            raise CommandError('GOOGLE_MAPS_API_KEY no está configurada.')
+
+        claves = self.claves_conocidas(options['deposito'])
+        if len(claves) < 2:
+            self.stdout.write('No hay suficientes puntos para precalcular.')
+            return
+
+        desde = None
+        if options['refrescar_dias']:
+            desde = timezone.now() - timedelta(days=options['refrescar_dias'])
+
+        celdas = services_matriz.leer_tramos(claves, actualizados_desde=desde)
+        bloques = services_matriz.agrupar_faltantes(
+            services_matriz.celdas_faltantes(claves, celdas)
+        )
+        total_elementos = sum(len(o) * len(d) for o, d in bloques)
+
+        self.stdout.write(
+            f'{len(claves)} coordenadas, {len(celdas)} celdas vigentes, '
+            f'{total_elementos} elementos pendientes en {len(bloques)} bloque(s).'
+        )
+
+        consultados = 0
+        for n_bloque, (origenes, destinos) in enumerate(bloques, start=1):
+            elementos = len(origenes) * len(destinos)
+            if consultados + elementos > options['max_elementos']:
+                self.stdout.write(self.style.WARNING(
+                    f'Se alcanzó el máximo de {options["max_elementos"]} elementos; '
+                    f'vuelve a ejecutar el comando para continuar.'
+                ))
+                break
+
+            self.descargar_con_reintentos(origenes, destinos, api_key, options['reintentos'])
+            consultados += elementos
+
+            if n_bloque % 50 == 0:
+                self.stdout.write(f'  {n_bloque}/{len(bloques)} bloques ({consultados} elementos)')
+
+            time.sleep(options['pausa'])
+
+        self.stdout.write(self.style.SUCCESS(f'✅ {consultados} elementos consultados y guardados.'))
+
+    def claves_conocidas(self, depositos):
+        """Puntos de entrega + depósitos explícitos + orígenes/destinos de rutas pasadas"""
+        claves = set()
+
+        for lat, lng in PuntoEntrega.objects.values_list('latitud', 'longitud'):
+            claves.add(clave_coordenada(lat, lng))
+
+        for texto in depositos:
+            try:
+                lat, lng = (float(x) for x in texto.split(','))
+            except ValueError:
+                raise CommandError(f'Depósito inválido: "{texto}" (usa "lat,lng")')
+            claves.add(clave_coordenada(lat, lng))
+
+        for o_lat, o_lng, d_lat, d_lng in RutaOptimizada.objects.values_list(
+            'origen_lat', 'origen_lng', 'destino_lat', 'destino_lng'
+        ).distinct():
+            claves.add(clave_coordenada(o_lat, o_lng))
+            if d_lat is not None and d_lng is not None:
+                claves.add(clave_coordenada(d_lat, d_lng))
+
+        return sorted(claves)
+
+    def descargar_con_reintentos(self, origenes, destinos, api_key, reintentos):
+        espera = 2.0
+        for intento in range(reintentos + 1):
+            if services_matriz.descargar_bloque(origenes, destinos, api_key) is not None:
+                return
+            if intento < reintentos:
+                self.stdout.write(self.style.WARNING(f'  Bloque falló, reintentando en {espera:.0f}s...'))
+                time.sleep(espera)
+                espera *= 2
+        raise CommandError(
+            'Google Maps no respondió tras varios reintentos. '
+            'Lo descargado quedó guardado; vuelve a ejecutar para reanudar.'
+        )
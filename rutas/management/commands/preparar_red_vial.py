@@ -0,0 +1,44 @@
+# rutas/management/commands/preparar_red_vial.py
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rutas import red_vial
+
+
+class Command(BaseCommand):
+    help = (
+        'Lee un extracto OSM de la región (.osm/.xml o .osm.pbf), lo preprocesa '
+        'con Contraction Hierarchies y guarda la red para RUTAS_RED_VIAL.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Extracto OSM (.osm, .xml o .osm.pbf)')
+        parser.add_argument('salida', help='Archivo de salida de la red preprocesada')
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        try:
+            coords, vias = red_vial.leer_osm(options['archivo'])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        if not vias:
+            raise CommandError('El extracto no tiene vías transitables en auto.')
+
+        red = red_vial.construir_red(coords, vias)
+        self.stdout.write(
+            f"{len(vias)} vías, {red.n} nodos, {len(red.hasta)} aristas "
+            f"({time.perf_counter() - inicio:.1f} s)"
+        )
+
+        red.contraer()
+        atajos = len(red.arriba[1]) + len(red.abajo[1]) - len(red.hasta)
+        self.stdout.write(
+            f"Contraction Hierarchies: {atajos} atajos "
+            f"({time.perf_counter() - inicio:.1f} s)"
+        )
+
+        red.guardar(options['salida'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Red guardada en {options['salida']}; configura RUTAS_RED_VIAL={options['salida']}"
+        ))
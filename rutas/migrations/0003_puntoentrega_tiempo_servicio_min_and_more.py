@@ -0,0 +1,28 @@
+# Generated by Django 4.2.27 on 2026-10-19 14:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rutas', '0002_alter_puntoentrega_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='puntoentrega',
+            name='tiempo_servicio_min',
+            field=models.PositiveIntegerField(default=0, help_text='Minutos de atención en el punto (descarga, cobro, etc.)'),
+        ),
+        migrations.AddField(
+            model_name='puntoentrega',
+            name='ventana_fin',
+            field=models.TimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='puntoentrega',
+            name='ventana_inicio',
+            field=models.TimeField(blank=True, null=True),
+        ),
+    ]
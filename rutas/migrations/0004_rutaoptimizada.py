@@ -0,0 +1,36 @@
+# Generated by Django 4.2.27 on 2026-10-19 14:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rutas', '0003_puntoentrega_tiempo_servicio_min_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RutaOptimizada',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('creada_en', models.DateTimeField(auto_now_add=True)),
+                ('direccion_origen', models.CharField(blank=True, max_length=255)),
+                ('direccion_destino', models.CharField(blank=True, max_length=255)),
+                ('origen_lat', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('origen_lng', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('destino_lat', models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True)),
+                ('destino_lng', models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True)),
+                ('puntos', models.JSONField(default=list)),
+                ('distancia_km', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('etas', models.JSONField(blank=True, default=dict)),
+                ('polyline', models.TextField(blank=True)),
+            ],
+            options={
+                'verbose_name': 'Ruta Optimizada',
+                'verbose_name_plural': 'Rutas Optimizadas',
+                'ordering': ['-creada_en'],
+                'indexes': [models.Index(fields=['-creada_en'], name='rutas_rutao_creada__9ea1c3_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.27 on 2026-10-19 14:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rutas', '0004_rutaoptimizada'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TramoMatriz',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('origen', models.CharField(max_length=32)),
+                ('destino', models.CharField(max_length=32)),
+                ('distancia_m', models.PositiveIntegerField(blank=True, null=True)),
+                ('duracion_s', models.PositiveIntegerField(blank=True, null=True)),
+                ('actualizado_en', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Tramo de Matriz',
+                'verbose_name_plural': 'Tramos de Matriz',
+                'indexes': [models.Index(fields=['actualizado_en'], name='rutas_tramo_actuali_54e2a1_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='tramomatriz',
+            constraint=models.UniqueConstraint(fields=('origen', 'destino'), name='uniq_tramo_origen_destino'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.27 on 2026-10-19 14:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rutas', '0005_tramomatriz_tramomatriz_uniq_tramo_origen_destino'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodificacionCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('direccion', models.CharField(max_length=255, unique=True)),
+                ('latitud', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('longitud', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Geocodificación en caché',
+                'verbose_name_plural': 'Geocodificaciones en caché',
+            },
+        ),
+    ]
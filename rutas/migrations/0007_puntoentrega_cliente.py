@@ -0,0 +1,20 @@
+# Generated by Django 4.2.27 on 2026-10-19 14:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0013_venta_entregada_venta_fecha_entrega_and_more'),
+        ('rutas', '0006_geocodificacioncache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='puntoentrega',
+            name='cliente',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='puntos_entrega', to='crm.cliente'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.27 on 2026-10-19 14:29
+
+from django.db import migrations, models
+
+from rutas import geohash
+
+
+def calcular_geohash(apps, schema_editor):
+    PuntoEntrega = apps.get_model('rutas', 'PuntoEntrega')
+    puntos = list(PuntoEntrega.objects.only('id', 'latitud', 'longitud'))
+    for punto in puntos:
+        punto.geohash = geohash.codificar(punto.latitud, punto.longitud)
+    PuntoEntrega.objects.bulk_update(puntos, ['geohash'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rutas', '0007_puntoentrega_cliente'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='puntoentrega',
+            name='actualizado_en',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='puntoentrega',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, max_length=12),
+        ),
+        migrations.AddIndex(
+            model_name='puntoentrega',
+            index=models.Index(fields=['latitud', 'longitud'], name='rutas_punto_latitud_17ac56_idx'),
+        ),
+        migrations.RunPython(calcular_geohash, migrations.RunPython.noop),
+    ]
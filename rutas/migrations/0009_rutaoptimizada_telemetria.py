@@ -0,0 +1,18 @@
+# Generated by Django 4.2.27 on 2026-10-19 14:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rutas', '0008_puntoentrega_actualizado_en_puntoentrega_geohash_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rutaoptimizada',
+            name='telemetria',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.27 on 2026-10-19 15:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rutas', '0009_rutaoptimizada_telemetria'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SolucionRuta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=64, unique=True)),
+                ('distancia_km', models.FloatField()),
+                ('tramos_s', models.JSONField(default=list)),
+                ('factible', models.BooleanField(default=True)),
+                ('creada_en', models.DateTimeField(auto_now_add=True)),
+                ('ruta', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='soluciones', to='rutas.rutaoptimizada')),
+            ],
+            options={
+                'verbose_name': 'Solución de Ruta (caché)',
+                'verbose_name_plural': 'Soluciones de Ruta (caché)',
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.27 on 2026-10-19 15:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rutas', '0010_solucionruta'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlanRutas',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('fecha_inicio', models.DateField()),
+                ('dias', models.PositiveSmallIntegerField()),
+                ('vehiculos', models.PositiveSmallIntegerField(default=1)),
+                ('max_horas', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('max_km', models.DecimalField(blank=True, decimal_places=2, max_digits=8, null=True)),
+                ('distancia_km', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('sin_asignar', models.JSONField(blank=True, default=list)),
+            ],
+            options={
+                'verbose_name': 'Plan de Rutas',
+                'verbose_name_plural': 'Planes de Rutas',
+                'ordering': ['-creado_en'],
+            },
+        ),
+        migrations.AddField(
+            model_name='rutaoptimizada',
+            name='fecha',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='rutaoptimizada',
+            name='vehiculo',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='rutaoptimizada',
+            name='plan',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='rutas', to='rutas.planrutas'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.27 on 2026-10-19 16:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rutas', '0011_planrutas'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='puntoentrega',
+            name='actualizado_en',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+    ]
@@ -1,6 +1,8 @@
 # rutas/models.py
 from django.db import models
 
+from . import geohash
+
 
 class PuntoEntrega(models.Model):
     nombre = models.CharField(max_length=255)
@@ -9,6 +11,28 @@ class PuntoEntrega(models.Model):
     longitud = models.DecimalField(max_digits=9, decimal_places=6)
     orden_optimo = models.IntegerField(null=True, blank=True)
 
+    # Ventana horaria de entrega (opcional) y tiempo de atención en el punto
+    ventana_inicio = models.TimeField(null=True, blank=True)
+    ventana_fin = models.TimeField(null=True, blank=True)
+    tiempo_servicio_min = models.PositiveIntegerField(
+        default=0,
+        help_text="Minutos de atención en el punto (descarga, cobro, etc.)"
+    )
+
+    # Cliente del CRM al que corresponde el punto (si se generó desde ventas)
+    cliente = models.ForeignKey(
+        'crm.Cliente',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='puntos_entrega',
+    )
+
+    # Celda geohash de (latitud, longitud): agrupación y búsqueda por zona
+    geohash = models.CharField(max_length=12, blank=True, db_index=True)
+    # Vacío en filas cargadas con loaddata (no pasan por save)
+    actualizado_en = models.DateTimeField(auto_now=True, null=True)
+
     # ✅ NUEVO: Meta con índices
     class Meta:
         verbose_name = "Punto de Entrega"
@@ -16,7 +40,187 @@ class PuntoEntrega(models.Model):
         indexes = [
             models.Index(fields=['orden_optimo']),
             models.Index(fields=['nombre']),
+            models.Index(fields=['latitud', 'longitud']),
+        ]
+
+    def __str__(self):
+        return self.nombre
+
+    def actualizar_geohash(self):
+        """Recalcula la celda; usar antes de bulk_create / bulk_update (no pasan por save)"""
+        self.geohash = geohash.codificar(self.latitud, self.longitud)
+
+    def save(self, *args, **kwargs):
+        self.actualizar_geohash()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitud', 'longitud'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'geohash'}
+        super().save(*args, **kwargs)
+
+    @property
+    def tiene_ventana(self):
+        return bool(self.ventana_inicio or self.ventana_fin or self.tiempo_servicio_min)
+
+
+class PlanRutas(models.Model):
+    """
+    Plan de varios días: un backlog de puntos repartido en rutas diarias
+    (una RutaOptimizada por día y vehículo; ver rutas.planificador).
+    """
+    creado_en = models.DateTimeField(auto_now_add=True)
+
+    fecha_inicio = models.DateField()
+    dias = models.PositiveSmallIntegerField()
+    vehiculos = models.PositiveSmallIntegerField(default=1)
+
+    # Presupuesto por jornada (vacío = sin límite)
+    max_horas = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    max_km = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True)
+
+    distancia_km = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    # IDs de PuntoEntrega que no cupieron en ninguna jornada
+    sin_asignar = models.JSONField(default=list, blank=True)
+
+    class Meta:
+        verbose_name = "Plan de Rutas"
+        verbose_name_plural = "Planes de Rutas"
+        ordering = ["-creado_en"]
+
+    def __str__(self):
+        return f"Plan #{self.id} desde {self.fecha_inicio} ({self.dias} días × {self.vehiculos})"
+
+
+class RutaOptimizada(models.Model):
+    """
+    Resultado persistido de una optimización: orden de visita, métricas
+    y polyline codificada del recorrido (se pide a Google una sola vez).
+    """
+    creada_en = models.DateTimeField(auto_now_add=True)
+
+    direccion_origen = models.CharField(max_length=255, blank=True)
+    direccion_destino = models.CharField(max_length=255, blank=True)
+    origen_lat = models.DecimalField(max_digits=9, decimal_places=6)
+    origen_lng = models.DecimalField(max_digits=9, decimal_places=6)
+    destino_lat = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    destino_lng = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+
+    # IDs de PuntoEntrega en orden de visita
+    puntos = models.JSONField(default=list)
+    distancia_km = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    etas = models.JSONField(default=dict, blank=True)
+
+    # Polyline codificada (formato Google) de todo el recorrido
+    polyline = models.TextField(blank=True)
+
+    # Telemetría de la optimización (fases, caché, llamadas a Google, solver)
+    telemetria = models.JSONField(default=dict, blank=True)
+
+    # Jornada de un plan de varios días (vacío = optimización individual)
+    plan = models.ForeignKey(
+        PlanRutas,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='rutas',
+    )
+    fecha = models.DateField(null=True, blank=True)
+    vehiculo = models.PositiveSmallIntegerField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Ruta Optimizada"
+        verbose_name_plural = "Rutas Optimizadas"
+        ordering = ["-creada_en"]
+        indexes = [
+            models.Index(fields=['-creada_en']),
         ]
 
     def __str__(self):
-        return self.nombre
\ No newline at end of file
+        return f"Ruta #{self.id} ({len(self.puntos)} puntos, {self.distancia_km} km)"
+
+    def coordenadas(self):
+        """Lista [(lat, lng), ...] origen -> puntos en orden -> destino"""
+        por_id = {
+            p.id: p for p in PuntoEntrega.objects.filter(id__in=self.puntos)
+        }
+        coords = [(float(self.origen_lat), float(self.origen_lng))]
+        for pid in self.puntos:
+            p = por_id.get(pid)
+            if p is not None:
+                coords.append((float(p.latitud), float(p.longitud)))
+        if self.destino_lat is not None and self.destino_lng is not None:
+            coords.append((float(self.destino_lat), float(self.destino_lng)))
+        else:
+            coords.append(coords[0])
+        return coords
+
+
+class SolucionRuta(models.Model):
+    """
+    Solución cacheada de una optimización (ver services_solucion): si se
+    repite la misma selección con la misma matriz y configuración del
+    solver, se reutiliza la ruta sin pedir la matriz ni correr el solver.
+    """
+    # sha256 de (puntos, origen, destino, versión de matriz, config. del solver)
+    clave = models.CharField(max_length=64, unique=True)
+    ruta = models.ForeignKey(RutaOptimizada, on_delete=models.CASCADE, related_name='soluciones')
+
+    distancia_km = models.FloatField()
+    # Duración (s) de cada tramo de la ruta, para recalcular ETAs con otra hora de salida
+    tramos_s = models.JSONField(default=list)
+    factible = models.BooleanField(default=True)
+
+    creada_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Solución de Ruta (caché)"
+        verbose_name_plural = "Soluciones de Ruta (caché)"
+
+    def __str__(self):
+        return f"{self.clave[:12]} -> Ruta #{self.ruta_id}"
+
+
+class TramoMatriz(models.Model):
+    """
+    Celda persistida de la matriz de distancias/duraciones entre dos
+    coordenadas (clave "lat,lng" con 6 decimales). Se llena de noche
+    con `precalcular_matriz` y de día sólo se piden las celdas nuevas.
+    """
+    origen = models.CharField(max_length=32)
+    destino = models.CharField(max_length=32)
+
+    # None = Google no encontró ruta entre ambos puntos
+    distancia_m = models.PositiveIntegerField(null=True, blank=True)
+    duracion_s = models.PositiveIntegerField(null=True, blank=True)
+
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Tramo de Matriz"
+        verbose_name_plural = "Tramos de Matriz"
+        constraints = [
+            models.UniqueConstraint(fields=["origen", "destino"], name="uniq_tramo_origen_destino"),
+        ]
+        indexes = [
+            models.Index(fields=['actualizado_en']),
+        ]
+
+    def __str__(self):
+        return f"{self.origen} -> {self.destino}"
+
+
+class GeocodificacionCache(models.Model):
+    """
+    Resultado de geocodificación por dirección normalizada, para no
+    volver a consultar Google por direcciones ya conocidas.
+    """
+    direccion = models.CharField(max_length=255, unique=True)
+    latitud = models.DecimalField(max_digits=9, decimal_places=6)
+    longitud = models.DecimalField(max_digits=9, decimal_places=6)
+    creado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Geocodificación en caché"
+        verbose_name_plural = "Geocodificaciones en caché"
+
+    def __str__(self):
+        return f"{self.direccion} ({self.latitud}, {self.longitud})"
@@ -1,21 +1,61 @@
 # rutas/optimizer.py
 import requests
 import json
+import logging
 from django.conf import settings
 import itertools
 import time
 
+from . import telemetria
+
+logger = logging.getLogger(__name__)
+
 
 # --- PARTE 1: Obtener Distancias/Tiempos de Google Maps ---
+# LÍMITE DE GOOGLE MAPS: 100 elementos por solicitud
+# Con origins×destinations, si tenemos N puntos:
+# Para no exceder 100, dividimos en bloques de máx 10×10 = 100
+MAX_LOCATIONS_PER_CALL = 10
+PAUSA_ENTRE_SOLICITUDES = 0.2
+
+# Reintentos ante timeout / error de conexión / límite de cuota (espera exponencial)
+MAX_REINTENTOS_BLOQUE = 2
+ESPERA_REINTENTO = 1.0
+ESTADOS_REINTENTABLES = ('OVER_QUERY_LIMIT', 'UNKNOWN_ERROR')
+DISTANCE_MATRIX_URL = "https://maps.googleapis.com/maps/api/distancematrix/json"
+
+# Bajo esta diferencia (km) el delta O(1) de un movimiento 2-opt no decide:
+# se compara la ruta completa, como antes, para aceptar los mismos movimientos
+EPSILON_MEJORA = 1e-9
+
+
 def get_distance_matrix(points, origin_coords, api_key, dest_coords=None):
     """
-    Obtiene la matriz de distancias entre:
+    Obtiene la matriz de distancias (km) entre:
+    - origen
+    - todos los puntos de entrega
+    - (opcional) destino
+
+    Alias de get_distance_duration_matrix que descarta las duraciones.
+    """
+    matrices = get_distance_duration_matrix(points, origin_coords, api_key, dest_coords=dest_coords)
+    if matrices is None:
+        return None
+    return matrices[0]
+
+
+def get_distance_duration_matrix(points, origin_coords, api_key, dest_coords=None):
+    """
+    Obtiene las matrices de distancias (km) y duraciones (segundos) entre:
     - origen
     - todos los puntos de entrega
     - (opcional) destino
     
     CORREGIDO: Divide la solicitud en bloques para no exceder 
     el límite de 100 elementos de Google Maps API
+
+    Returns:
+        (distance_matrix, duration_matrix) o None si falla la API
     """
     all_points_coords = [f"{origin_coords['latitud']},{origin_coords['longitud']}"]
 
@@ -27,81 +67,123 @@ def get_distance_matrix(points, origin_coords, api_key, dest_coords=None):
 
     n = len(all_points_coords)
     
-    # Inicializar matriz con infinitos
+    # Inicializar matrices con infinitos
     distance_matrix = [[float('inf')] * n for _ in range(n)]
+    duration_matrix = [[float('inf')] * n for _ in range(n)]
     
     # Diagonal = 0 (distancia a sí mismo)
     for i in range(n):
         distance_matrix[i][i] = 0.0
-    
-    # LÍMITE DE GOOGLE MAPS: 100 elementos por solicitud
-    # Con origins×destinations, si tenemos N puntos:
-    # Para no exceder 100, dividimos en bloques de máx 10×10 = 100
-    MAX_LOCATIONS_PER_CALL = 10
-    
-    url = "https://maps.googleapis.com/maps/api/distancematrix/json"
+        duration_matrix[i][i] = 0.0
     
     # Dividir en bloques
     for i in range(0, n, MAX_LOCATIONS_PER_CALL):
         for j in range(0, n, MAX_LOCATIONS_PER_CALL):
-            # Bloque de orígenes
-            origins_block = all_points_coords[i:i + MAX_LOCATIONS_PER_CALL]
-            # Bloque de destinos
-            destinations_block = all_points_coords[j:j + MAX_LOCATIONS_PER_CALL]
-            
-            origins_str = "|".join(origins_block)
-            destinations_str = "|".join(destinations_block)
-            
-            params = {
-                "origins": origins_str,
-                "destinations": destinations_str,
-                "mode": "driving",
-                "key": api_key
-            }
-            
-            try:
-                response = requests.get(url, params=params, timeout=30)
-                response.raise_for_status()
-                data = response.json()
-                
-                if data['status'] == 'OK':
-                    # Procesar resultados del bloque
-                    for row_idx, row_data in enumerate(data['rows']):
-                        origin_global_idx = i + row_idx
-                        for col_idx, element in enumerate(row_data['elements']):
-                            dest_global_idx = j + col_idx
-                            
-                            if element['status'] == 'OK':
-                                # Convertir metros a kilómetros
-                                distance_km = element['distance']['value'] / 1000.0
-                                distance_matrix[origin_global_idx][dest_global_idx] = distance_km
-                            else:
-                                print(f"⚠️ Error en elemento [{origin_global_idx}][{dest_global_idx}]: {element['status']}")
-                                distance_matrix[origin_global_idx][dest_global_idx] = float('inf')
-                else:
-                    error_msg = data.get('error_message', 'Sin mensaje de error')
-                    print(f"❌ Error en Distance Matrix API: {data['status']} - {error_msg}")
-                    return None
-                
-                # Pausa entre solicitudes para evitar rate limiting
-                time.sleep(0.2)
-                
-            except requests.exceptions.Timeout:
-                print(f"⏱️ Timeout en solicitud de bloque [{i}:{i+MAX_LOCATIONS_PER_CALL}] x [{j}:{j+MAX_LOCATIONS_PER_CALL}]")
-                return None
-            except requests.exceptions.RequestException as e:
-                print(f"❌ Error de conexión con Google Maps API: {e}")
-                return None
-            except json.JSONDecodeError as e:
-                print(f"❌ Error al decodificar JSON: {e}")
+            filas = consultar_bloque(
+                all_points_coords[i:i + MAX_LOCATIONS_PER_CALL],
+                all_points_coords[j:j + MAX_LOCATIONS_PER_CALL],
+                api_key,
+            )
+            if filas is None:
                 return None
+
+            for row_idx, fila in enumerate(filas):
+                for col_idx, (distance_km, duration_s) in enumerate(fila):
+                    if i + row_idx != j + col_idx:
+                        distance_matrix[i + row_idx][j + col_idx] = distance_km
+                        duration_matrix[i + row_idx][j + col_idx] = duration_s
+
+            # Pausa entre solicitudes para evitar rate limiting
+            time.sleep(PAUSA_ENTRE_SOLICITUDES)
     
-    return distance_matrix
+    return distance_matrix, duration_matrix
+
+
+def consultar_bloque(origins_block, destinations_block, api_key):
+    """
+    Consulta un bloque (máx 10×10) de Distance Matrix API, reintentando
+    los errores transitorios. Registra latencia e intentos en la telemetría.
+
+    Args:
+        origins_block / destinations_block: listas de "lat,lng"
+
+    Returns:
+        filas[origen][destino] = (distancia_km, duracion_s), con inf si no hay ruta,
+        o None si la API o la conexión fallan.
+    """
+    params = {
+        "origins": "|".join(origins_block),
+        "destinations": "|".join(destinations_block),
+        "mode": "driving",
+        "key": api_key
+    }
+    tamano = f"{len(origins_block)}x{len(destinations_block)}"
+
+    inicio = time.perf_counter()
+    espera = ESPERA_REINTENTO
+    data = None
+    for intento in range(1, MAX_REINTENTOS_BLOQUE + 2):
+        reintentable = False
+        try:
+            response = requests.get(DISTANCE_MATRIX_URL, params=params, timeout=30)
+            response.raise_for_status()
+            data = response.json()
+        except requests.exceptions.Timeout:
+            logger.warning(f"Timeout en solicitud de bloque {tamano} (intento {intento})")
+            data, reintentable = None, True
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Error de conexión con Google Maps API (intento {intento}): {e}")
+            data, reintentable = None, True
+        except json.JSONDecodeError as e:
+            logger.error(f"Error al decodificar JSON de Distance Matrix: {e}")
+            data = None
+
+        if data is not None and data.get('status') in ESTADOS_REINTENTABLES:
+            logger.warning(f"Distance Matrix respondió {data['status']} (intento {intento})")
+            reintentable = True
+
+        if not reintentable or intento > MAX_REINTENTOS_BLOQUE:
+            break
+        time.sleep(espera)
+        espera *= 2
+
+    ok = data is not None and data.get('status') == 'OK'
+    tel = telemetria.actual()
+    if tel is not None:
+        tel.registrar_bloque(
+            len(origins_block) * len(destinations_block),
+            time.perf_counter() - inicio, intento, ok,
+        )
+
+    if data is None:
+        return None
+
+    if not ok:
+        error_msg = data.get('error_message', 'Sin mensaje de error')
+        logger.error(f"Error en Distance Matrix API: {data.get('status')} - {error_msg}")
+        return None
+
+    filas = []
+    for row_idx, row_data in enumerate(data['rows']):
+        fila = []
+        for col_idx, element in enumerate(row_data['elements']):
+            if element['status'] == 'OK':
+                # Metros -> kilómetros; duración en segundos
+                fila.append((
+                    element['distance']['value'] / 1000.0,
+                    float(element['duration']['value']),
+                ))
+            else:
+                logger.warning(f"Elemento [{row_idx}][{col_idx}] sin ruta: {element['status']}")
+                fila.append((float('inf'), float('inf')))
+        filas.append(fila)
+
+    return filas
 
 
 # --- PARTE 2: TSP Solver con Nearest Neighbor + 2-opt ---
 
-def solve_tsp(distance_matrix, num_points_entrega, start_index=0, end_index=None):
+def solve_tsp(distance_matrix, num_points_entrega, start_index=0, end_index=None, vecinos=None):
     """
     Resuelve el TSP con algoritmo híbrido:
     - Fuerza bruta para <= 9 puntos (rápido y óptimo)
@@ -112,6 +194,8 @@ def solve_tsp(distance_matrix, num_points_entrega, start_index=0, end_index=None
         num_points_entrega: cantidad de puntos de entrega
         start_index: índice del origen
         end_index: índice del destino (None = ciclo cerrado)
+        vecinos: listas de vecinos por índice (opcional); el 2-opt sólo
+                 prueba cambios que conectan un punto con sus vecinos
     
     Returns:
         (ruta_optima, distancia_total)
@@ -123,13 +207,15 @@ def solve_tsp(distance_matrix, num_points_entrega, start_index=0, end_index=None
 
     # ✅ Fuerza bruta para <= 9 puntos (óptimo garantizado)
     if num_points_entrega <= 9:
+        telemetria.registrar_solver('fuerza_bruta')
         return _solve_tsp_bruteforce(
             distance_matrix, delivery_indices, start_index, end_index
         )
     
     # ✅ Nearest Neighbor + 2-opt para >= 10 puntos (heurística)
+    telemetria.registrar_solver('heuristica' if vecinos is None else 'heuristica_vecinos')
     return _solve_tsp_heuristic(
-        distance_matrix, delivery_indices, start_index, end_index
+        distance_matrix, delivery_indices, start_index, end_index, vecinos=vecinos
     )
 
 
@@ -158,11 +244,12 @@ def _solve_tsp_bruteforce(distance_matrix, delivery_indices, start_index, end_in
         if current_distance < min_distance:
             min_distance = current_distance
             best_route = current_route_indices
+            telemetria.registrar_mejora(min_distance)
 
     return best_route, min_distance
 
 
-def _solve_tsp_heuristic(distance_matrix, delivery_indices, start_index, end_index):
+def _solve_tsp_heuristic(distance_matrix, delivery_indices, start_index, end_index, vecinos=None):
     """
     Nearest Neighbor + 2-opt - O(n²) mucho más rápido para n grande
     """
@@ -187,7 +274,8 @@ def _solve_tsp_heuristic(distance_matrix, delivery_indices, start_index, end_ind
         route.append(end_index)
 
     # 2) Mejorar con 2-opt
-    route = _two_opt(distance_matrix, route)
+    telemetria.registrar_mejora(_route_distance(distance_matrix, route))
+    route = _two_opt(distance_matrix, route, vecinos=vecinos)
 
     # 3) Calcular distancia total
     total_distance = 0.0
@@ -200,7 +288,23 @@ def _solve_tsp_heuristic(distance_matrix, delivery_indices, start_index, end_ind
     return route, total_distance
 
 
-def _two_opt(distance_matrix, route):
+def _candidatos_two_opt(route, i, vecinos, posicion):
+    """
+    Posiciones j a probar para invertir route[i:j]. Con listas de vecinos
+    sólo las que crean la arista route[i-1] -> vecino (O(k) en vez de O(n)).
+    """
+    if vecinos is None:
+        return range(i + 2, len(route))
+
+    candidatos = []
+    for vecino in vecinos[route[i - 1]]:
+        j = posicion.get(vecino, -1) + 1
+        if i + 2 <= j < len(route):
+            candidatos.append(j)
+    return sorted(candidatos)
+
+
+def _two_opt(distance_matrix, route, vecinos=None):
     """
     Optimización local 2-opt: invierte segmentos de la ruta
     para reducir cruces y mejorar la distancia total.
@@ -210,22 +314,40 @@ def _two_opt(distance_matrix, route):
 
     while improved:
         improved = False
+        # Nodos repetidos (origen = destino) quedan con su última posición
+        posicion = {nodo: idx for idx, nodo in enumerate(best_route)}
+        adelante, atras = _prefijos_ruta(distance_matrix, best_route)
+        exacto = adelante[-1] != float('inf')
         for i in range(1, len(best_route) - 2):
-            for j in range(i + 1, len(best_route)):
+            for j in _candidatos_two_opt(best_route, i, vecinos, posicion):
                 if j - i == 1:
                     continue
 
-                new_route = best_route[:]
-                # Invertir segmento [i:j]
-                new_route[i:j] = reversed(best_route[i:j])
-
-                # Calcular distancia
-                old_dist = _route_distance(distance_matrix, best_route)
-                new_dist = _route_distance(distance_matrix, new_route)
-
-                if new_dist < old_dist:
-                    best_route = new_route
+                delta = None
+                if exacto:
+                    # Invertir [i:j] cambia los arcos de los extremos y el sentido
+                    # del tramo interno (la matriz puede ser asimétrica): O(1)
+                    a, b = best_route[i - 1], best_route[i]
+                    c, e = best_route[j - 1], best_route[j]
+                    delta = (
+                        distance_matrix[a][c] + distance_matrix[b][e]
+                        - distance_matrix[a][b] - distance_matrix[c][e]
+                        + (atras[j - 1] - atras[i]) - (adelante[j - 1] - adelante[i])
+                    )
+                if delta is not None and abs(delta) > EPSILON_MEJORA:
+                    mejora = delta < 0
+                else:
+                    # Con tramos sin ruta (inf) o un delta ~0 se compara la
+                    # distancia completa
+                    new_route = best_route[:]
+                    new_route[i:j] = reversed(best_route[i:j])
+                    mejora = (_route_distance(distance_matrix, new_route)
+                              < _route_distance(distance_matrix, best_route))
+
+                if mejora:
+                    best_route[i:j] = reversed(best_route[i:j])
                     improved = True
+                    telemetria.registrar_mejora(_route_distance(distance_matrix, best_route))
                     break
             if improved:
                 break
@@ -233,6 +355,20 @@ def _two_opt(distance_matrix, route):
     return best_route
 
 
+def _prefijos_ruta(distance_matrix, route):
+    """
+    Sumas acumuladas de la ruta recorrida hacia adelante y hacia atrás:
+    adelante[k] = distancia de route[0] a route[k]; atras[k] = lo mismo
+    con cada arco en sentido contrario.
+    """
+    adelante = [0.0]
+    atras = [0.0]
+    for a, b in zip(route, route[1:]):
+        adelante.append(adelante[-1] + distance_matrix[a][b])
+        atras.append(atras[-1] + distance_matrix[b][a])
+    return adelante, atras
+
+
 def _route_distance(distance_matrix, route):
     """Calcula distancia total de una ruta"""
     total = 0.0
@@ -244,6 +380,237 @@ def _route_distance(distance_matrix, route):
     return total
 
 
+# --- PARTE 2b: TSP con ventanas horarias ---
+#
+# Los tiempos se manejan en segundos desde medianoche.
+# ventanas[k] = (inicio, fin) para el índice k de la matriz; None = sin restricción.
+# tiempos_servicio[k] = segundos de atención en el punto k.
+
+SIN_LIMITE = float('inf')
+MAX_PASADAS_VENTANAS = 50
+MAX_LARGO_SEGMENTO = 3
+
+
+def solve_tsp_ventanas(distance_matrix, duration_matrix, num_points_entrega,
+                       ventanas=None, tiempos_servicio=None, hora_salida=0,
+                       start_index=0, end_index=None):
+    """
+    Resuelve el TSP respetando ventanas horarias de entrega:
+    - Inserción más barata factible (puntos con ventana más estrecha primero)
+    - Búsqueda local or-opt (mover segmentos de 1 a 3 puntos)
+
+    La factibilidad de cada inserción se verifica en O(1) usando
+    la hora de llegada más temprana (propagación hacia adelante) y
+    la hora de inicio más tardía permitida (propagación hacia atrás).
+
+    Returns:
+        (ruta_optima, distancia_total, etas, factible)
+        etas: dict índice_matriz -> segundo de llegada (inicio de atención)
+    """
+    if not distance_matrix or num_points_entrega == 0:
+        return [], 0.0, {}, True
+
+    n = len(distance_matrix)
+    inicio, fin = _limites_ventanas(ventanas, n, hora_salida, start_index)
+    servicio = list(tiempos_servicio) if tiempos_servicio else [0] * n
+    fin_ruta = start_index if end_index is None else end_index
+
+    # 1) Construcción: ventanas más estrechas primero
+    pendientes = sorted(range(1, num_points_entrega + 1), key=lambda k: (fin[k], inicio[k]))
+    route = [start_index, fin_ruta]
+    factible = True
+
+    for u in pendientes:
+        llegadas, limites = _programar(route, duration_matrix, inicio, fin, servicio)
+        pos, _ = _mejor_insercion(
+            route, [u], llegadas, limites, distance_matrix, duration_matrix, inicio, fin, servicio
+        )
+        if pos is None:
+            factible = False
+            pos = _insercion_menor_atraso(route, u, distance_matrix, duration_matrix, inicio, fin, servicio)
+        route.insert(pos, u)
+
+    # 2) Mejora local or-opt (sólo si la ruta es factible)
+    telemetria.registrar_solver('ventanas')
+    telemetria.registrar_mejora(_route_distance(distance_matrix, route))
+    if factible:
+        route = _or_opt_ventanas(route, distance_matrix, duration_matrix, inicio, fin, servicio)
+
+    llegadas, _ = _programar(route, duration_matrix, inicio, fin, servicio)
+    etas = {route[k]: llegadas[k] for k in range(1, len(route) - 1)}
+    factible = all(llegadas[k] <= fin[route[k]] for k in range(len(route)))
+
+    return route, _route_distance(distance_matrix, route), etas, factible
+
+
+def hora_a_segundos(hora):
+    """time -> segundos desde medianoche (None se mantiene)"""
+    if hora is None:
+        return None
+    return hora.hour * 3600 + hora.minute * 60 + hora.second
+
+
+def formatear_hora(segundos):
+    """Segundos desde medianoche -> 'HH:MM' (marca +1d si pasa de medianoche)"""
+    if segundos is None or segundos == float('inf'):
+        return None
+    segundos = int(round(segundos))
+    dias, resto = divmod(segundos, 86400)
+    texto = f"{resto // 3600:02d}:{(resto % 3600) // 60:02d}"
+    return f"{texto} (+{dias}d)" if dias else texto
+
+
+def calcular_etas(route, duration_matrix, ventanas=None, tiempos_servicio=None, hora_salida=0):
+    """
+    Calcula la hora de llegada (segundos desde medianoche) a cada punto
+    de una ruta ya resuelta, esperando si se llega antes de la ventana.
+    """
+    if not route:
+        return {}
+    n = len(duration_matrix)
+    inicio, fin = _limites_ventanas(ventanas, n, hora_salida, route[0])
+    servicio = list(tiempos_servicio) if tiempos_servicio else [0] * n
+    llegadas, _ = _programar(route, duration_matrix, inicio, fin, servicio)
+    return {route[k]: llegadas[k] for k in range(1, len(route) - 1)}
+
+
+def _limites_ventanas(ventanas, n, hora_salida, start_index):
+    """Normaliza las ventanas a dos listas (inicio, fin) por índice de matriz"""
+    inicio = [0.0] * n
+    fin = [SIN_LIMITE] * n
+    for k, ventana in enumerate(ventanas or []):
+        if ventana is None:
+            continue
+        v_inicio, v_fin = ventana
+        if v_inicio is not None:
+            inicio[k] = float(v_inicio)
+        if v_fin is not None:
+            fin[k] = float(v_fin)
+    inicio[start_index] = float(hora_salida)
+    return inicio, fin
+
+
+def _programar(route, duration_matrix, inicio, fin, servicio):
+    """
+    Propagación hacia adelante y hacia atrás sobre la ruta:
+    - llegadas[k]: inicio de atención más temprano en la posición k
+    - limites[k]: inicio de atención más tardío en k que mantiene factible el resto
+    """
+    m = len(route)
+    llegadas = [0.0] * m
+    llegadas[0] = inicio[route[0]]
+    for k in range(1, m):
+        prev, cur = route[k - 1], route[k]
+        llegadas[k] = max(inicio[cur], llegadas[k - 1] + servicio[prev] + duration_matrix[prev][cur])
+
+    limites = [0.0] * m
+    limites[-1] = fin[route[-1]]
+    for k in range(m - 2, -1, -1):
+        cur, nxt = route[k], route[k + 1]
+        limites[k] = min(fin[cur], limites[k + 1] - servicio[cur] - duration_matrix[cur][nxt])
+
+    return llegadas, limites
+
+
+def _mejor_insercion(route, segmento, llegadas, limites, distance_matrix, duration_matrix,
+                     inicio, fin, servicio):
+    """
+    Busca la posición más barata donde insertar el segmento manteniendo
+    todas las ventanas. Cada verificación es O(largo del segmento).
+
+    Returns:
+        (posición, delta_distancia) o (None, inf) si no hay inserción factible
+    """
+    primero, ultimo = segmento[0], segmento[-1]
+    largo_interno = 0.0
+    for a, b in zip(segmento, segmento[1:]):
+        largo_interno += distance_matrix[a][b]
+
+    mejor_pos, mejor_delta = None, SIN_LIMITE
+    for k in range(len(route) - 1):
+        prev, nxt = route[k], route[k + 1]
+        delta = (
+            distance_matrix[prev][primero] + largo_interno
+            + distance_matrix[ultimo][nxt] - distance_matrix[prev][nxt]
+        )
+        if not delta < mejor_delta:
+            continue
+
+        # Propagar la hora a través del segmento
+        t = llegadas[k]
+        anterior = prev
+        ok = True
+        for u in segmento:
+            t = max(inicio[u], t + servicio[anterior] + duration_matrix[anterior][u])
+            if t > fin[u]:
+                ok = False
+                break
+            anterior = u
+        if not ok:
+            continue
+
+        llegada_siguiente = max(inicio[nxt], t + servicio[ultimo] + duration_matrix[ultimo][nxt])
+        if llegada_siguiente <= limites[k + 1]:
+            mejor_pos, mejor_delta = k + 1, delta
+
+    return mejor_pos, mejor_delta
+
+
+def _insercion_menor_atraso(route, u, distance_matrix, duration_matrix, inicio, fin, servicio):
+    """Sin inserción factible: elige la posición que minimiza el atraso total"""
+    mejor_pos, mejor_clave = 1, (SIN_LIMITE, SIN_LIMITE)
+    for pos in range(1, len(route)):
+        candidata = route[:pos] + [u] + route[pos:]
+        llegadas, _ = _programar(candidata, duration_matrix, inicio, fin, servicio)
+        atraso = sum(max(0.0, llegadas[k] - fin[candidata[k]]) for k in range(len(candidata)))
+        clave = (atraso, _route_distance(distance_matrix, candidata))
+        if clave < mejor_clave:
+            mejor_pos, mejor_clave = pos, clave
+    return mejor_pos
+
+
+def _or_opt_ventanas(route, distance_matrix, duration_matrix, inicio, fin, servicio):
+    """
+    Or-opt con ventanas: saca segmentos de 1..3 puntos y los reinserta
+    en la posición factible más barata mientras haya mejora.
+    """
+    best_route = route[:]
+    for _ in range(MAX_PASADAS_VENTANAS):
+        improved = False
+        for largo in range(1, MAX_LARGO_SEGMENTO + 1):
+            i = 1
+            while i + largo <= len(best_route) - 1:
+                segmento = best_route[i:i + largo]
+                resto = best_route[:i] + best_route[i + largo:]
+
+                ahorro = (
+                    distance_matrix[best_route[i - 1]][segmento[0]]
+                    + distance_matrix[segmento[-1]][best_route[i + largo]]
+                    - distance_matrix[best_route[i - 1]][best_route[i + largo]]
+                )
+
+                llegadas, limites = _programar(resto, duration_matrix, inicio, fin, servicio)
+                if any(llegada > limite for llegada, limite in zip(llegadas, limites)):
+                    i += 1
+                    continue
+
+                pos, delta = _mejor_insercion(
+                    resto, segmento, llegadas, limites,
+                    distance_matrix, duration_matrix, inicio, fin, servicio
+                )
+
+                if pos is not None and delta < ahorro - 1e-9:
+                    best_route = resto[:pos] + segmento + resto[pos:]
+                    improved = True
+                    if telemetria.actual() is not None:
+                        telemetria.registrar_mejora(_route_distance(distance_matrix, best_route))
+                i += 1
+        if not improved:
+            break
+
+    return best_route
+
+
 # --- PARTE 3: Cálculos de Consumo ---
 AUTO_RENDIMIENTO_KM_POR_LITRO = 12  # valor por defecto
 
@@ -0,0 +1,237 @@
+# rutas/planificador.py
+"""
+Planificación de varios días: reparte un backlog de puntos en jornadas
+(día × vehículo) con un presupuesto de tiempo y/o distancia por jornada,
+minimizando la distancia total.
+
+Cluster-first / route-second:
+1. Barrido angular alrededor del depósito: cada punto entra a la jornada
+   actual por inserción más barata hasta llenar su presupuesto (se prueban
+   varios ángulos de inicio y se queda con el mejor)
+2. Reubicación: mueve puntos a la jornada de sus vecinos más cercanos
+   si baja la distancia total y cabe en el presupuesto
+3. Cada jornada se mejora con el 2-opt del optimizador sobre su submatriz
+
+No considera ventanas horarias: cada día se puede re-optimizar luego
+con sus ventanas.
+"""
+import math
+
+from . import optimizer
+from .services_cercania import listas_vecinos
+
+# Ángulos de inicio del barrido que se prueban
+INTENTOS_BARRIDO = 8
+MAX_PASADAS_REUBICACION = 3
+K_VECINOS = 10
+
+# Mejora mínima (km) para mover un punto de jornada
+EPSILON_KM = 1e-9
+
+
+class Jornada:
+    """Ruta en construcción: índices de matriz, con el depósito (0) en ambos extremos"""
+
+    def __init__(self):
+        self.ruta = [0, 0]
+        self.distancia = 0.0
+        self.duracion = 0.0  # viaje + atención, en segundos
+
+    @property
+    def paradas(self):
+        return self.ruta[1:-1]
+
+
+class _Presupuesto:
+    def __init__(self, distancias, duraciones, servicio, max_duracion_s, max_distancia_km):
+        self.distancias = distancias
+        self.duraciones = duraciones
+        self.servicio = servicio
+        self.max_duracion_s = max_duracion_s
+        self.max_distancia_km = max_distancia_km
+
+    def insercion(self, ruta, k):
+        """Posición más barata para insertar k: (posición, Δkm, Δsegundos)"""
+        d, t = self.distancias, self.duraciones
+        mejor = (None, math.inf, math.inf)
+        for pos in range(1, len(ruta)):
+            a, b = ruta[pos - 1], ruta[pos]
+            delta = d[a][k] + d[k][b] - d[a][b]
+            if delta < mejor[1]:
+                mejor = (pos, delta, t[a][k] + t[k][b] - t[a][b] + self.servicio[k])
+        return mejor
+
+    def remocion(self, ruta, pos):
+        """(Δkm, Δsegundos) que se ahorran al sacar ruta[pos]"""
+        d, t = self.distancias, self.duraciones
+        a, k, b = ruta[pos - 1], ruta[pos], ruta[pos + 1]
+        return (
+            d[a][k] + d[k][b] - d[a][b],
+            t[a][k] + t[k][b] - t[a][b] + self.servicio[k],
+        )
+
+    def cabe(self, jornada, delta_km, delta_s):
+        return (
+            (self.max_duracion_s is None or jornada.duracion + delta_s <= self.max_duracion_s)
+            and (self.max_distancia_km is None or jornada.distancia + delta_km <= self.max_distancia_km)
+        )
+
+    def medir(self, ruta):
+        """(km, segundos) de una ruta completa"""
+        km = sum(self.distancias[a][b] for a, b in zip(ruta, ruta[1:]))
+        segundos = sum(self.duraciones[a][b] for a, b in zip(ruta, ruta[1:]))
+        return km, segundos + sum(self.servicio[k] for k in ruta[1:-1])
+
+
+def _insertar(jornada, k, pos, delta_km, delta_s):
+    jornada.ruta.insert(pos, k)
+    jornada.distancia += delta_km
+    jornada.duracion += delta_s
+
+
+def _orden_angular(coords):
+    """Índices 1..n ordenados por ángulo alrededor del depósito (coords[0])"""
+    lat0, lng0 = coords[0]
+    escala = math.cos(math.radians(lat0))
+    return sorted(
+        range(1, len(coords)),
+        key=lambda k: math.atan2(coords[k][0] - lat0, (coords[k][1] - lng0) * escala),
+    )
+
+
+def _barrido(orden, n_jornadas, presupuesto):
+    jornadas = []
+    pendientes = []
+    actual = None
+    for k in orden:
+        if actual is not None:
+            pos, delta_km, delta_s = presupuesto.insercion(actual.ruta, k)
+            if presupuesto.cabe(actual, delta_km, delta_s):
+                _insertar(actual, k, pos, delta_km, delta_s)
+                continue
+        if len(jornadas) < n_jornadas:
+            actual = Jornada()
+            jornadas.append(actual)
+            pos, delta_km, delta_s = presupuesto.insercion(actual.ruta, k)
+            if presupuesto.cabe(actual, delta_km, delta_s):
+                _insertar(actual, k, pos, delta_km, delta_s)
+                continue
+        pendientes.append(k)
+
+    # Lo que sobró puede caber en una jornada anterior con holgura
+    sin_asignar = []
+    for k in pendientes:
+        opciones = [(j, *presupuesto.insercion(j.ruta, k)) for j in jornadas]
+        opciones = [o for o in opciones if presupuesto.cabe(o[0], o[2], o[3])]
+        if opciones:
+            jornada, pos, delta_km, delta_s = min(opciones, key=lambda o: o[2])
+            _insertar(jornada, k, pos, delta_km, delta_s)
+        else:
+            sin_asignar.append(k)
+
+    return jornadas, sin_asignar
+
+
+def _reubicar(jornadas, vecinos, presupuesto):
+    """
+    Mueve cada punto a la jornada de alguno de sus vecinos cercanos
+    cuando la inserción allá cuesta menos de lo que se ahorra al sacarlo.
+    """
+    for _ in range(MAX_PASADAS_REUBICACION):
+        jornada_de = {k: j for j in jornadas for k in j.paradas}
+        movidos = 0
+        for k in list(jornada_de):
+            origen = jornada_de[k]
+            pos_actual = origen.ruta.index(k)
+            ahorro_km, ahorro_s = presupuesto.remocion(origen.ruta, pos_actual)
+
+            mejor = None
+            for destino in {jornada_de[v] for v in vecinos[k] if v in jornada_de} - {origen}:
+                pos, delta_km, delta_s = presupuesto.insercion(destino.ruta, k)
+                if (delta_km < ahorro_km - EPSILON_KM
+                        and presupuesto.cabe(destino, delta_km, delta_s)
+                        and (mejor is None or delta_km < mejor[2])):
+                    mejor = (destino, pos, delta_km, delta_s)
+
+            if mejor is not None:
+                origen.ruta.pop(pos_actual)
+                origen.distancia -= ahorro_km
+                origen.duracion -= ahorro_s
+                destino, pos, delta_km, delta_s = mejor
+                _insertar(destino, k, pos, delta_km, delta_s)
+                jornada_de[k] = destino
+                movidos += 1
+        if not movidos:
+            break
+
+
+def _rutear(jornada, coords, presupuesto):
+    """Re-optimiza la jornada si acorta la ruta sin salirse del presupuesto"""
+    indices = [0] + jornada.paradas
+    m = len(indices) - 1
+    if m < 3:
+        return
+    sub = [[presupuesto.distancias[a][b] for b in indices] for a in indices]
+    if m <= 9:
+        ruta_sub, _ = optimizer.solve_tsp(sub, m, start_index=0, end_index=None)
+    else:
+        # 2-opt acotado a vecinos partiendo de la ruta por inserción (ya buena:
+        # converge en pocas mejoras, a diferencia de partir de vecino más cercano)
+        vecinos = listas_vecinos([coords[i] for i in indices], K_VECINOS)
+        ruta_sub = optimizer._two_opt(sub, list(range(m + 1)) + [0], vecinos=vecinos)
+    ruta = [indices[i] for i in ruta_sub]
+
+    km, segundos = presupuesto.medir(ruta)
+    if km < jornada.distancia - EPSILON_KM and presupuesto.cabe(
+        jornada, km - jornada.distancia, segundos - jornada.duracion
+    ):
+        jornada.ruta, jornada.distancia, jornada.duracion = ruta, km, segundos
+
+
+def planificar(distancias, duraciones, coords, n_jornadas, max_duracion_s=None,
+               max_distancia_km=None, tiempos_servicio=None):
+    """
+    Args:
+        distancias / duraciones: matrices (km / s) con el depósito en el índice 0
+        coords: (lat, lng) por índice de matriz (para el barrido y los vecinos)
+        n_jornadas: días × vehículos disponibles
+        max_duracion_s / max_distancia_km: presupuesto por jornada (None = sin límite)
+        tiempos_servicio: segundos de atención por índice
+
+    Returns:
+        dict con:
+        - jornadas: lista de {ruta, distancia_km, duracion_s} en orden de barrido
+        - sin_asignar: índices que no cupieron en ninguna jornada
+        - distancia_km: total
+    """
+    n = len(distancias)
+    presupuesto = _Presupuesto(
+        distancias, duraciones, list(tiempos_servicio) if tiempos_servicio else [0] * n,
+        max_duracion_s, max_distancia_km,
+    )
+    if n <= 1 or n_jornadas <= 0:
+        return {'jornadas': [], 'sin_asignar': list(range(1, n)), 'distancia_km': 0.0}
+
+    orden = _orden_angular(coords)
+    mejor = None
+    for intento in range(min(INTENTOS_BARRIDO, len(orden))):
+        inicio = intento * len(orden) // INTENTOS_BARRIDO
+        jornadas, sin_asignar = _barrido(orden[inicio:] + orden[:inicio], n_jornadas, presupuesto)
+        costo = (len(sin_asignar), sum(j.distancia for j in jornadas))
+        if mejor is None or costo < mejor[0]:
+            mejor = (costo, jornadas, sin_asignar)
+    _, jornadas, sin_asignar = mejor
+
+    _reubicar(jornadas, listas_vecinos(coords, K_VECINOS), presupuesto)
+    for jornada in jornadas:
+        _rutear(jornada, coords, presupuesto)
+
+    jornadas = [j for j in jornadas if j.paradas]
+    return {
+        'jornadas': [
+            {'ruta': j.ruta, 'distancia_km': j.distancia, 'duracion_s': j.duracion}
+            for j in jornadas
+        ],
+        'sin_asignar': sin_asignar,
+        'distancia_km': sum(j.distancia for j in jornadas),
+    }
@@ -0,0 +1,445 @@
+# rutas/red_vial.py
+"""
+Ruteo local sobre un extracto OSM de la región (sin Google).
+
+- Lectura de OSM XML (o PBF si está instalado pyosmium)
+- Grafo dirigido en arreglos CSR compactos (`array`)
+- Preproceso con Contraction Hierarchies (CH)
+- Consultas muchos-a-muchos con búsquedas ascendentes + "buckets":
+  con n paradas son 2·n búsquedas que visitan unos cientos de nodos cada una
+"""
+import heapq
+import pickle
+import xml.etree.ElementTree as ET
+from array import array
+
+from . import geohash
+
+INF = float('inf')
+VERSION_FORMATO = 1
+
+# Velocidad (km/h) por tipo de vía cuando no trae maxspeed.
+# Las vías que no están aquí (peatonales, ciclovías, etc.) se ignoran.
+VELOCIDADES_KMH = {
+    'motorway': 100, 'motorway_link': 60,
+    'trunk': 80, 'trunk_link': 50,
+    'primary': 60, 'primary_link': 40,
+    'secondary': 50, 'secondary_link': 40,
+    'tertiary': 40, 'tertiary_link': 30,
+    'unclassified': 30, 'residential': 30, 'road': 30,
+    'living_street': 10, 'service': 15,
+}
+
+# Búsqueda de "testigos" al contraer: límite de nodos visitados
+# (si no encuentra un camino alternativo agrega el atajo; nunca es incorrecto)
+MAX_NODOS_TESTIGO = 60
+
+# Precisión geohash inicial para asociar coordenadas al nodo más cercano
+PRECISION_INICIAL_NODOS = 7
+
+
+# --- Lectura de OSM ---
+
+def _sentido(tags):
+    """1 = sólo en el sentido de la vía, -1 = sólo contrario, 0 = doble sentido"""
+    oneway = tags.get('oneway', '').lower()
+    if oneway in ('yes', 'true', '1'):
+        return 1
+    if oneway == '-1':
+        return -1
+    if oneway == 'no':
+        return 0
+    if tags.get('junction') in ('roundabout', 'circular') or tags.get('highway') == 'motorway':
+        return 1
+    return 0
+
+
+def _velocidad(tags):
+    try:
+        return float(tags.get('maxspeed', '').split()[0])
+    except (ValueError, IndexError):
+        return VELOCIDADES_KMH[tags['highway']]
+
+
+def leer_osm_xml(archivo):
+    """
+    Lee un extracto OSM XML en dos pasadas (vías primero y luego sólo
+    las coordenadas de los nodos que usan, para no cargar todo el extracto).
+
+    Returns:
+        (coords: dict id_osm -> (lat, lng), vias: lista de (refs, sentido, km/h))
+    """
+    vias = []
+    usados = set()
+    for _, elem in ET.iterparse(archivo, events=('end',)):
+        if elem.tag == 'way':
+            tags = {t.get('k'): t.get('v') for t in elem.iter('tag')}
+            if tags.get('highway') in VELOCIDADES_KMH and tags.get('access') not in ('no', 'private'):
+                refs = [int(nd.get('ref')) for nd in elem.iter('nd')]
+                if len(refs) >= 2:
+                    vias.append((refs, _sentido(tags), _velocidad(tags)))
+                    usados.update(refs)
+            elem.clear()
+        elif elem.tag in ('node', 'relation'):
+            elem.clear()
+
+    if hasattr(archivo, 'seek'):
+        archivo.seek(0)
+
+    coords = {}
+    for _, elem in ET.iterparse(archivo, events=('end',)):
+        if elem.tag == 'node':
+            id_osm = int(elem.get('id'))
+            if id_osm in usados:
+                coords[id_osm] = (float(elem.get('lat')), float(elem.get('lon')))
+        elem.clear()
+
+    return coords, vias
+
+
+def leer_osm_pbf(ruta):
+    """
+    Igual que leer_osm_xml para archivos .osm.pbf.
+
+    Raises:
+        ValueError si pyosmium no está instalado
+    """
+    try:
+        import osmium
+    except ImportError:
+        raise ValueError('Para leer archivos .pbf instala pyosmium (pip install osmium).')
+
+    coords = {}
+    vias = []
+
+    class _Lector(osmium.SimpleHandler):
+        def way(self, w):
+            tags = {t.k: t.v for t in w.tags}
+            if tags.get('highway') not in VELOCIDADES_KMH or tags.get('access') in ('no', 'private'):
+                return
+            refs = []
+            for nodo in w.nodes:
+                if nodo.location.valid():
+                    coords[nodo.ref] = (nodo.location.lat, nodo.location.lon)
+                    refs.append(nodo.ref)
+            if len(refs) >= 2:
+                vias.append((refs, _sentido(tags), _velocidad(tags)))
+
+    _Lector().apply_file(ruta, locations=True)
+    return coords, vias
+
+
+def leer_osm(ruta):
+    """Elige el lector según la extensión (.osm / .xml o .pbf)"""
+    if ruta.lower().endswith('.pbf'):
+        return leer_osm_pbf(ruta)
+    if ruta.lower().endswith(('.osm', '.xml')):
+        with open(ruta, 'rb') as archivo:
+            return leer_osm_xml(archivo)
+    raise ValueError('Formato no soportado: usa un extracto .osm, .xml o .osm.pbf')
+
+
+# --- Grafo CSR ---
+
+def _csr(n, aristas):
+    """
+    aristas: lista de (desde, hasta, segundos, metros) -> arreglos CSR.
+    Entre dos nodos queda sólo la arista más rápida.
+    """
+    mejores = {}
+    for u, v, t, d in aristas:
+        if u != v and ((u, v) not in mejores or t < mejores[(u, v)][0]):
+            mejores[(u, v)] = (t, d)
+
+    inicio = array('l', [0] * (n + 1))
+    for (u, _) in mejores:
+        inicio[u + 1] += 1
+    for i in range(n):
+        inicio[i + 1] += inicio[i]
+
+    hasta = array('l', [0] * len(mejores))
+    segundos = array('d', [0.0] * len(mejores))
+    metros = array('d', [0.0] * len(mejores))
+    siguiente = array('l', inicio[:n])
+    for (u, v), (t, d) in mejores.items():
+        k = siguiente[u]
+        hasta[k], segundos[k], metros[k] = v, t, d
+        siguiente[u] += 1
+
+    return inicio, hasta, segundos, metros
+
+
+class RedVial:
+    """
+    Grafo dirigido en CSR: las aristas que salen de u son
+    hasta[inicio[u]:inicio[u+1]] (con sus segundos y metros).
+    Tras `contraer()` tiene además los grafos ascendentes de la CH.
+    """
+
+    def __init__(self, lat, lng, csr):
+        self.lat = lat
+        self.lng = lng
+        self.inicio, self.hasta, self.segundos, self.metros = csr
+        self.rango = None
+        self.arriba = None   # CSR: aristas u -> w con rango[w] > rango[u]
+        self.abajo = None    # CSR invertido: en w, aristas u -> w con rango[u] > rango[w]
+        self._grilla = {}
+
+    @property
+    def n(self):
+        return len(self.lat)
+
+    def vecinos(self, u):
+        for k in range(self.inicio[u], self.inicio[u + 1]):
+            yield self.hasta[k], self.segundos[k], self.metros[k]
+
+    # --- Nodo más cercano a una coordenada ---
+
+    def _celdas(self, precision):
+        if precision not in self._grilla:
+            grilla = {}
+            for idx in range(self.n):
+                celda = geohash.codificar(self.lat[idx], self.lng[idx], precision)
+                grilla.setdefault(celda, []).append(idx)
+            self._grilla[precision] = grilla
+        return self._grilla[precision]
+
+    def nodo_mas_cercano(self, lat, lng):
+        """Índice del nodo de la red más cercano a (lat, lng)"""
+        def distancia(idx):
+            return geohash.distancia_m(lat, lng, self.lat[idx], self.lng[idx])
+
+        for precision in range(PRECISION_INICIAL_NODOS, 0, -1):
+            grilla = self._celdas(precision)
+            candidatos = [
+                idx
+                for celda in geohash.celdas_alrededor(geohash.codificar(lat, lng, precision))
+                for idx in grilla.get(celda, ())
+            ]
+            if candidatos:
+                mejor = min(candidatos, key=distancia)
+                if distancia(mejor) <= min(geohash.tamano_celda_m(precision, lat)):
+                    return mejor
+        return min(range(self.n), key=distancia)
+
+    # --- Dijkstra simple (referencia y redes sin preprocesar) ---
+
+    def dijkstra(self, origen):
+        """dict nodo -> (segundos, metros) del camino más rápido desde `origen`"""
+        return _dijkstra_csr((self.inicio, self.hasta, self.segundos, self.metros), origen)
+
+    # --- Contraction Hierarchies ---
+
+    def contraer(self):
+        """
+        Preproceso CH: contrae los nodos de menor "diferencia de aristas"
+        primero, agregando atajos cuando no hay camino testigo más corto.
+        """
+        n = self.n
+        salida = [dict() for _ in range(n)]
+        entrada = [dict() for _ in range(n)]
+        for u in range(n):
+            for v, t, d in self.vecinos(u):
+                salida[u][v] = (t, d)
+                entrada[v][u] = (t, d)
+
+        contraido = bytearray(n)
+        vecinos_contraidos = [0] * n
+        rango = array('l', [0] * n)
+        aristas_arriba = []
+        aristas_abajo = []
+
+        def atajos(v):
+            nuevos = []
+            for u, (t_uv, d_uv) in entrada[v].items():
+                if not salida[v]:
+                    break
+                objetivos = {
+                    w: (t_uv + t_vw, d_uv + d_vw)
+                    for w, (t_vw, d_vw) in salida[v].items() if w != u
+                }
+                if not objetivos:
+                    continue
+                limite = max(t for t, _ in objetivos.values())
+                testigos = _testigos(salida, u, v, set(objetivos), limite)
+                for w, (t, d) in objetivos.items():
+                    if testigos.get(w, INF) > t:
+                        nuevos.append((u, w, t, d))
+            return nuevos
+
+        def prioridad(v, nuevos):
+            return len(nuevos) - len(entrada[v]) - len(salida[v]) + vecinos_contraidos[v]
+
+        cola = [(prioridad(v, atajos(v)), v) for v in range(n)]
+        heapq.heapify(cola)
+        orden = 0
+        while cola:
+            _, v = heapq.heappop(cola)
+            if contraido[v]:
+                continue
+            # Actualización perezosa: si empeoró, vuelve a la cola
+            nuevos = atajos(v)
+            actual = prioridad(v, nuevos)
+            if cola and actual > cola[0][0]:
+                heapq.heappush(cola, (actual, v))
+                continue
+
+            for u, w, t, d in nuevos:
+                if w not in salida[u] or t < salida[u][w][0]:
+                    salida[u][w] = (t, d)
+                    entrada[w][u] = (t, d)
+
+            for w, (t, d) in salida[v].items():
+                aristas_arriba.append((v, w, t, d))
+                del entrada[w][v]
+                vecinos_contraidos[w] += 1
+            for u, (t, d) in entrada[v].items():
+                aristas_abajo.append((v, u, t, d))
+                del salida[u][v]
+                vecinos_contraidos[u] += 1
+            salida[v] = {}
+            entrada[v] = {}
+
+            contraido[v] = 1
+            rango[v] = orden
+            orden += 1
+
+        self.rango = rango
+        self.arriba = _csr(n, aristas_arriba)
+        self.abajo = _csr(n, aristas_abajo)
+
+    def matriz(self, origenes, destinos):
+        """
+        Muchos-a-muchos sobre la CH.
+
+        Args:
+            origenes / destinos: índices de nodo
+
+        Returns:
+            (segundos, metros): matrices len(origenes) × len(destinos), inf sin camino
+        """
+        if self.arriba is None:
+            raise ValueError('La red no está preprocesada: llama a contraer() primero.')
+
+        buckets = {}
+        for j, destino in enumerate(destinos):
+            for nodo, (t, d) in _dijkstra_csr(self.abajo, destino).items():
+                buckets.setdefault(nodo, []).append((j, t, d))
+
+        segundos = [[INF] * len(destinos) for _ in origenes]
+        metros = [[INF] * len(destinos) for _ in origenes]
+        for i, origen in enumerate(origenes):
+            fila_t, fila_d = segundos[i], metros[i]
+            for nodo, (t, d) in _dijkstra_csr(self.arriba, origen).items():
+                for j, t2, d2 in buckets.get(nodo, ()):
+                    if t + t2 < fila_t[j]:
+                        fila_t[j] = t + t2
+                        fila_d[j] = d + d2
+        return segundos, metros
+
+    # --- Persistencia ---
+
+    def guardar(self, ruta):
+        datos = {
+            'version': VERSION_FORMATO,
+            'lat': self.lat, 'lng': self.lng,
+            'csr': (self.inicio, self.hasta, self.segundos, self.metros),
+            'rango': self.rango, 'arriba': self.arriba, 'abajo': self.abajo,
+        }
+        with open(ruta, 'wb') as f:
+            pickle.dump(datos, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def cargar(ruta):
+    """Carga una red guardada con RedVial.guardar (sólo archivos propios: usa pickle)"""
+    with open(ruta, 'rb') as f:
+        try:
+            datos = pickle.load(f)
+        except (pickle.UnpicklingError, EOFError) as e:
+            raise ValueError(f"Archivo de red vial inválido: {e}")
+    if datos.get('version') != VERSION_FORMATO:
+        raise ValueError(f"Formato de red vial no soportado: {datos.get('version')}")
+    red = RedVial(datos['lat'], datos['lng'], datos['csr'])
+    red.rango, red.arriba, red.abajo = datos['rango'], datos['arriba'], datos['abajo']
+    return red
+
+
+def construir_red(coords, vias):
+    """
+    Arma la RedVial a partir de lo leído del OSM: los ids OSM se
+    renumeran 0..n-1 y cada tramo entre nodos consecutivos es una arista.
+    """
+    indices = {}
+    lat = array('d')
+    lng = array('d')
+    aristas = []
+
+    def indice(id_osm):
+        if id_osm not in indices:
+            indices[id_osm] = len(lat)
+            lat.append(coords[id_osm][0])
+            lng.append(coords[id_osm][1])
+        return indices[id_osm]
+
+    for refs, sentido, kmh in vias:
+        refs = [r for r in refs if r in coords]
+        metros_por_segundo = max(kmh, 1) / 3.6
+        for a, b in zip(refs, refs[1:]):
+            u, v = indice(a), indice(b)
+            d = geohash.distancia_m(lat[u], lng[u], lat[v], lng[v])
+            t = d / metros_por_segundo
+            if sentido >= 0:
+                aristas.append((u, v, t, d))
+            if sentido <= 0:
+                aristas.append((v, u, t, d))
+
+    return RedVial(lat, lng, _csr(len(lat), aristas))
+
+
+# --- Auxiliares ---
+
+def _dijkstra_csr(csr, origen):
+    inicio, hasta, segundos, metros = csr
+    mejor = {origen: (0.0, 0.0)}
+    cola = [(0.0, 0.0, origen)]
+    cerrados = set()
+    while cola:
+        t, d, u = heapq.heappop(cola)
+        if u in cerrados:
+            continue
+        cerrados.add(u)
+        for k in range(inicio[u], inicio[u + 1]):
+            v = hasta[k]
+            nt = t + segundos[k]
+            if v not in mejor or nt < mejor[v][0]:
+                mejor[v] = (nt, d + metros[k])
+                heapq.heappush(cola, (nt, d + metros[k], v))
+    return mejor
+
+
+def _testigos(salida, origen, excluido, objetivos, limite):
+    """
+    Dijkstra acotado desde `origen` sin pasar por `excluido`:
+    segundos hasta los objetivos alcanzados dentro del límite.
+    """
+    mejor = {origen: 0.0}
+    cola = [(0.0, origen)]
+    encontrados = {}
+    visitados = 0
+    while cola and visitados < MAX_NODOS_TESTIGO:
+        t, u = heapq.heappop(cola)
+        if t > mejor.get(u, INF) or t > limite:
+            continue
+        visitados += 1
+        if u in objetivos:
+            encontrados[u] = t
+            if len(encontrados) == len(objetivos):
+                break
+        for v, (tv, _) in salida[u].items():
+            if v == excluido:
+                continue
+            nt = t + tv
+            if nt < mejor.get(v, INF):
+                mejor[v] = nt
+                heapq.heappush(cola, (nt, v))
+    return encontrados
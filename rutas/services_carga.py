@@ -0,0 +1,165 @@
+# rutas/services_carga.py
+import csv
+import io
+import logging
+
+from django.db import transaction
+from django.utils.dateparse import parse_time
+
+from .models import PuntoEntrega
+from .services_geocoding import GeocodificacionError, geocodificar_lote, MAX_WORKERS_GEOCODING
+
+logger = logging.getLogger(__name__)
+
+
+def leer_filas(archivo, nombre_archivo):
+    """
+    Lee un CSV o XLSX con encabezados y devuelve una lista de dicts
+    (claves en minúscula). La primera fila de datos es la fila 2.
+
+    Columnas: nombre, direccion, latitud, longitud (opcionales),
+    ventana_inicio, ventana_fin, tiempo_servicio_min (opcionales).
+
+    Raises:
+        ValueError si el formato no es soportado
+    """
+    nombre = (nombre_archivo or '').lower()
+
+    if nombre.endswith('.xlsx'):
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise ValueError('Para cargar archivos .xlsx instala openpyxl (pip install openpyxl).')
+
+        libro = load_workbook(archivo, read_only=True, data_only=True)
+        filas = libro.active.iter_rows(values_only=True)
+        encabezado = [str(c or '').strip().lower() for c in next(filas, [])]
+        return [
+            {encabezado[i]: ('' if v is None else str(v)).strip() for i, v in enumerate(fila) if i < len(encabezado)}
+            for fila in filas
+        ]
+
+    if nombre.endswith('.csv') or nombre.endswith('.txt'):
+        contenido = archivo.read()
+        if isinstance(contenido, bytes):
+            contenido = contenido.decode('utf-8-sig')
+        try:
+            dialecto = csv.Sniffer().sniff(contenido[:2048], delimiters=',;\t')
+        except csv.Error:
+            dialecto = csv.excel
+        lector = csv.DictReader(io.StringIO(contenido), dialect=dialecto)
+        return [
+            {k.strip().lower(): (v or '').strip() for k, v in fila.items() if k is not None}
+            for fila in lector
+        ]
+
+    raise ValueError('Formato no soportado: usa un archivo .csv o .xlsx')
+
+
+def importar_puntos(filas, api_key, max_workers=MAX_WORKERS_GEOCODING):
+    """
+    Crea PuntoEntrega en lote desde filas ya leídas.
+
+    - Las filas con latitud/longitud no se geocodifican
+    - El resto se geocodifica en paralelo reutilizando la caché
+    - Todos los puntos válidos se crean con un solo bulk_create
+    - Los errores se informan por fila sin abortar la carga
+
+    Returns:
+        {'total': int, 'creados': int, 'errores': [{'fila': int, 'error': str}]}
+    """
+    errores = []
+    validas = []
+    total = 0
+
+    for n_fila, fila in enumerate(filas, start=2):
+        if not any(fila.values()):
+            continue
+        total += 1
+        try:
+            validas.append((n_fila, _validar_fila(fila)))
+        except ValueError as e:
+            errores.append({'fila': n_fila, 'error': str(e)})
+
+    por_geocodificar = {datos['direccion'] for _, datos in validas if datos['latitud'] is None}
+    coordenadas = geocodificar_lote(por_geocodificar, api_key, max_workers=max_workers) if por_geocodificar else {}
+
+    nuevos = []
+    for n_fila, datos in validas:
+        if datos['latitud'] is None:
+            resultado = coordenadas.get(datos['direccion'])
+            if isinstance(resultado, GeocodificacionError) or resultado is None:
+                errores.append({'fila': n_fila, 'error': str(resultado or 'Sin resultado de geocodificación')})
+                continue
+            datos['latitud'], datos['longitud'] = resultado
+        punto = PuntoEntrega(**datos)
+        punto.actualizar_geohash()
+        nuevos.append(punto)
+
+    with transaction.atomic():
+        PuntoEntrega.objects.bulk_create(nuevos, batch_size=500)
+
+    errores.sort(key=lambda e: e['fila'])
+    logger.info(f"Carga masiva: {len(nuevos)} puntos creados, {len(errores)} filas con error")
+
+    return {
+        'total': total,
+        'creados': len(nuevos),
+        'errores': errores,
+    }
+
+
+def _validar_fila(fila):
+    """Convierte una fila del archivo en kwargs de PuntoEntrega (lat/lng pueden quedar en None)"""
+    nombre = fila.get('nombre', '')
+    direccion = fila.get('direccion', '') or fila.get('dirección', '')
+
+    if not nombre or not direccion:
+        raise ValueError('Nombre y dirección son obligatorios.')
+    if len(nombre) > 255 or len(direccion) > 255:
+        raise ValueError('Nombre o dirección exceden 255 caracteres.')
+
+    latitud = fila.get('latitud', '')
+    longitud = fila.get('longitud', '')
+    if latitud and longitud:
+        try:
+            latitud = float(latitud.replace(',', '.'))
+            longitud = float(longitud.replace(',', '.'))
+        except ValueError:
+            raise ValueError('Latitud o Longitud con formato incorrecto.')
+        if not (-90 <= latitud <= 90 and -180 <= longitud <= 180):
+            raise ValueError('Latitud o Longitud fuera de rango.')
+    else:
+        latitud = longitud = None
+
+    try:
+        ventana_inicio = _hora(fila.get('ventana_inicio', ''))
+        ventana_fin = _hora(fila.get('ventana_fin', ''))
+        tiempo_servicio_min = int(float(fila.get('tiempo_servicio_min') or 0))
+    except ValueError:
+        raise ValueError('Ventana horaria o tiempo de atención con formato incorrecto.')
+
+    if ventana_inicio and ventana_fin and ventana_inicio >= ventana_fin:
+        raise ValueError('El inicio de la ventana debe ser anterior al fin.')
+    if tiempo_servicio_min < 0:
+        raise ValueError('El tiempo de atención no puede ser negativo.')
+
+    return {
+        'nombre': nombre,
+        'direccion': direccion,
+        'latitud': latitud,
+        'longitud': longitud,
+        'ventana_inicio': ventana_inicio,
+        'ventana_fin': ventana_fin,
+        'tiempo_servicio_min': tiempo_servicio_min,
+    }
+
+
+def _hora(texto):
+    """'HH:MM' -> time; vacío -> None; formato inválido -> ValueError"""
+    if not texto:
+        return None
+    hora = parse_time(texto)
+    if hora is None:
+        raise ValueError(texto)
+    return hora
@@ -0,0 +1,148 @@
+# rutas/services_cercania.py
+"""
+Consultas por cercanía sobre PuntoEntrega usando la columna indexada
+`geohash`: se leen sólo las celdas alrededor del punto (rangos sobre el
+índice B-tree) y la distancia exacta se calcula en Python.
+"""
+from django.db.models import Q
+
+from . import geohash
+from .models import PuntoEntrega
+
+# Dos puntos a menos de esto se consideran la misma parada
+RADIO_DUPLICADO_M = 30
+
+# Celda inicial de la búsqueda k-NN (~150 m); se agranda si faltan vecinos
+PRECISION_INICIAL_KNN = 7
+
+
+def precision_para_radio(radio_m, lat):
+    """
+    Mayor precisión cuya celda cubre el radio (así basta con la celda
+    y sus 8 vecinas). 0 = hay que recorrer toda la tabla.
+    """
+    for precision in range(geohash.PRECISION, 0, -1):
+        if min(geohash.tamano_celda_m(precision, lat)) >= radio_m:
+            return precision
+    return 0
+
+
+def _filtro_celdas(celdas):
+    # Rango [celda, celda~) en vez de LIKE: SQLite usa el índice
+    filtro = Q()
+    for celda in celdas:
+        filtro |= Q(geohash__gte=celda, geohash__lt=celda + '~')
+    return filtro
+
+
+def _candidatos(lat, lng, precision, qs):
+    if precision == 0:
+        return qs
+    celdas = geohash.celdas_alrededor(geohash.codificar(lat, lng, precision))
+    return qs.filter(_filtro_celdas(celdas))
+
+
+def _ordenar_por_distancia(puntos, lat, lng):
+    return sorted(
+        ((p, geohash.distancia_m(lat, lng, p.latitud, p.longitud)) for p in puntos),
+        key=lambda x: x[1],
+    )
+
+
+def puntos_en_radio(lat, lng, radio_m, qs=None):
+    """
+    Puntos a menos de `radio_m` metros, del más cercano al más lejano.
+
+    Returns:
+        lista de (PuntoEntrega, distancia_m)
+    """
+    qs = PuntoEntrega.objects.all() if qs is None else qs
+    candidatos = _candidatos(lat, lng, precision_para_radio(radio_m, lat), qs)
+    return [(p, d) for p, d in _ordenar_por_distancia(candidatos, lat, lng) if d <= radio_m]
+
+
+def k_mas_cercanos(lat, lng, k, qs=None):
+    """
+    Los k puntos más cercanos. Parte con celdas chicas y las agranda hasta
+    que el k-ésimo queda más cerca que el borde del bloque de 3×3 celdas
+    (entonces ningún punto fuera del bloque puede ganarle).
+
+    Returns:
+        lista de (PuntoEntrega, distancia_m)
+    """
+    qs = PuntoEntrega.objects.all() if qs is None else qs
+    if k <= 0:
+        return []
+
+    for precision in range(PRECISION_INICIAL_KNN, 0, -1):
+        candidatos = list(_candidatos(lat, lng, precision, qs))
+        if len(candidatos) < k:
+            continue
+        ordenados = _ordenar_por_distancia(candidatos, lat, lng)
+        if ordenados[k - 1][1] <= min(geohash.tamano_celda_m(precision, lat)):
+            return ordenados[:k]
+
+    return _ordenar_por_distancia(qs, lat, lng)[:k]
+
+
+def punto_duplicado(lat, lng, radio_m=RADIO_DUPLICADO_M, excluir_id=None):
+    """Punto existente más cercano dentro del radio, o None"""
+    qs = PuntoEntrega.objects.all()
+    if excluir_id is not None:
+        qs = qs.exclude(id=excluir_id)
+    cercanos = puntos_en_radio(lat, lng, radio_m, qs)
+    return cercanos[0] if cercanos else None
+
+
+def listas_vecinos(coords, k):
+    """
+    Listas de vecinos para el optimizador (en memoria, sin base de datos):
+    para cada coordenada, los índices de sus k más cercanas.
+    Mismo criterio que k_mas_cercanos, con las celdas agrupadas en dicts.
+
+    Args:
+        coords: lista de (lat, lng) en el orden de la matriz de distancias
+    """
+    n = len(coords)
+    k = min(k, n - 1)
+    if k <= 0:
+        return [[] for _ in coords]
+
+    coords = [(float(lat), float(lng)) for lat, lng in coords]
+    hashes = [geohash.codificar(lat, lng) for lat, lng in coords]
+    cubetas = {}
+
+    def cubeta(precision):
+        if precision not in cubetas:
+            grupos = {}
+            for idx, h in enumerate(hashes):
+                grupos.setdefault(h[:precision], []).append(idx)
+            cubetas[precision] = grupos
+        return cubetas[precision]
+
+    vecinos = []
+    for i, (lat, lng) in enumerate(coords):
+        def distancia(j):
+            return geohash.distancia_m(lat, lng, coords[j][0], coords[j][1])
+
+        elegidos = None
+        for precision in range(PRECISION_INICIAL_KNN, 0, -1):
+            grupos = cubeta(precision)
+            candidatos = [
+                j
+                for celda in geohash.celdas_alrededor(hashes[i][:precision])
+                for j in grupos.get(celda, ())
+                if j != i
+            ]
+            if len(candidatos) < k:
+                continue
+            candidatos.sort(key=distancia)
+            if distancia(candidatos[k - 1]) <= min(geohash.tamano_celda_m(precision, lat)):
+                elegidos = candidatos[:k]
+                break
+
+        if elegidos is None:
+            elegidos = sorted((j for j in range(n) if j != i), key=distancia)[:k]
+        vecinos.append(elegidos)
+
+    return vecinos
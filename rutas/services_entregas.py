@@ -0,0 +1,136 @@
+# rutas/services_entregas.py
+import logging
+
+from django.db import transaction
+from django.utils import timezone
+
+from crm.models import Venta
+
+from .models import PuntoEntrega
+from .services_geocoding import (
+    GeocodificacionError,
+    geocodificar_lote,
+    normalizar_direccion,
+    MAX_WORKERS_GEOCODING,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def direccion_cliente(direccion, comuna):
+    """Dirección completa para geocodificar: "calle, comuna" """
+    direccion = (direccion or '').strip()
+    comuna = (comuna or '').strip()
+    if not direccion:
+        return ''
+    if comuna and normalizar_direccion(comuna) not in normalizar_direccion(direccion):
+        return f"{direccion}, {comuna}"
+    return direccion
+
+
+def ventas_pendientes(dia):
+    """
+    Ventas con entrega comprometida hasta `dia` (incluye atrasadas)
+    que aún no se entregan. Las notas de crédito no se despachan.
+    """
+    return (
+        Venta.objects
+        .filter(fecha_entrega__lte=dia, entregada=False)
+        .exclude(tipo_documento=Venta.TipoDocumento.NOTA_CREDITO)
+    )
+
+
+def generar_puntos_del_dia(dia=None, api_key=None, max_workers=MAX_WORKERS_GEOCODING):
+    """
+    Crea o actualiza los PuntoEntrega de las ventas pendientes del día.
+
+    - Una sola consulta trae ventas + cliente (values, sin instanciar modelos)
+    - Un punto por (cliente, dirección), aunque el cliente tenga varias ventas
+    - Coordenadas desde la caché de geocodificación (Google sólo para direcciones nuevas)
+    - Los puntos existentes del cliente con la misma dirección se reutilizan
+    - Todo se escribe en una transacción con bulk_create / bulk_update
+
+    Returns:
+        {'ventas': int, 'puntos': [ids], 'creados': int, 'actualizados': int,
+         'errores': [{'cliente': str, 'error': str}]}
+    """
+    dia = dia or timezone.localdate()
+
+    filas = ventas_pendientes(dia).values_list(
+        'cliente_id', 'cliente__nombre', 'cliente__direccion', 'cliente__comuna'
+    )
+
+    total_ventas = 0
+    errores = []
+    paradas = {}  # (cliente_id, dirección normalizada) -> (nombre, dirección)
+    sin_direccion = {}
+    for cliente_id, nombre, direccion, comuna in filas:
+        total_ventas += 1
+        completa = direccion_cliente(direccion, comuna)
+        if not completa:
+            sin_direccion[cliente_id] = nombre
+            continue
+        paradas.setdefault((cliente_id, normalizar_direccion(completa)), (nombre, completa))
+
+    for nombre in sin_direccion.values():
+        errores.append({'cliente': nombre, 'error': 'El cliente no tiene dirección registrada.'})
+
+    coordenadas = {}
+    if paradas:
+        coordenadas = geocodificar_lote(
+            {completa for _, completa in paradas.values()}, api_key, max_workers=max_workers
+        )
+
+    existentes = {}
+    for punto in PuntoEntrega.objects.filter(cliente_id__in={c for c, _ in paradas}):
+        existentes.setdefault((punto.cliente_id, normalizar_direccion(punto.direccion)), punto)
+
+    ahora = timezone.now()
+    nuevos = []
+    actualizados = []
+    for clave, (nombre, completa) in paradas.items():
+        resultado = coordenadas.get(completa)
+        if isinstance(resultado, GeocodificacionError) or resultado is None:
+            errores.append({'cliente': nombre, 'error': str(resultado or 'Sin resultado de geocodificación')})
+            continue
+
+        latitud, longitud = round(resultado[0], 6), round(resultado[1], 6)
+        punto = existentes.get(clave)
+        if punto is None:
+            punto = PuntoEntrega(
+                cliente_id=clave[0],
+                nombre=nombre,
+                direccion=completa,
+                latitud=latitud,
+                longitud=longitud,
+            )
+            nuevos.append(punto)
+        else:
+            punto.nombre = nombre
+            punto.latitud = latitud
+            punto.longitud = longitud
+            punto.actualizado_en = ahora
+            actualizados.append(punto)
+        punto.actualizar_geohash()
+
+    with transaction.atomic():
+        if actualizados:
+            PuntoEntrega.objects.bulk_update(
+                actualizados,
+                ['nombre', 'latitud', 'longitud', 'geohash', 'actualizado_en'],
+                batch_size=500,
+            )
+        PuntoEntrega.objects.bulk_create(nuevos, batch_size=500)
+
+    logger.info(
+        f"Entregas {dia}: {total_ventas} ventas, {len(nuevos)} puntos creados, "
+        f"{len(actualizados)} actualizados, {len(errores)} errores"
+    )
+
+    return {
+        'ventas': total_ventas,
+        'puntos': [p.id for p in actualizados + nuevos],
+        'creados': len(nuevos),
+        'actualizados': len(actualizados),
+        'errores': errores,
+    }
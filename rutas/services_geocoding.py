@@ -0,0 +1,138 @@
+# rutas/services_geocoding.py
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from .models import GeocodificacionCache
+from . import telemetria
+
+logger = logging.getLogger(__name__)
+
+GEOCODE_URL = "https://maps.googleapis.com/maps/api/geocode/json"
+
+# Solicitudes simultáneas a Geocoding API en cargas masivas
+MAX_WORKERS_GEOCODING = 8
+
+
+class GeocodificacionError(Exception):
+    """No se pudo geocodificar una dirección (estado de la API o conexión)"""
+
+
+def normalizar_direccion(direccion):
+    """Normaliza la dirección para usarla como clave de caché"""
+    return " ".join((direccion or "").lower().split())
+
+
+def geocodificar_google(direccion, api_key):
+    """
+    Consulta Geocoding API (sin caché).
+
+    Returns:
+        (latitud, longitud) como float
+
+    Raises:
+        GeocodificacionError
+    """
+    params = {
+        "address": direccion,
+        "key": api_key
+    }
+    try:
+        response = requests.get(GEOCODE_URL, params=params, timeout=15)
+        data = response.json()
+    except requests.exceptions.RequestException as e:
+        raise GeocodificacionError(f"Error de conexión con la API de geocodificación: {e}")
+    except ValueError as e:
+        raise GeocodificacionError(f"Respuesta inválida de la API de geocodificación: {e}")
+
+    if data.get('status') == 'OK' and data.get('results'):
+        location = data['results'][0]['geometry']['location']
+        return float(location['lat']), float(location['lng'])
+
+    raise GeocodificacionError(
+        f"No se pudo geocodificar la dirección: {direccion}. Estado: {data.get('status')}"
+    )
+
+
+def geocodificar(direccion, api_key):
+    """
+    Geocodifica una dirección usando primero la caché persistente.
+
+    Raises:
+        GeocodificacionError
+    """
+    clave = normalizar_direccion(direccion)
+    cache = GeocodificacionCache.objects.filter(direccion=clave).first()
+    if cache is not None:
+        _registrar_geocodificacion('cache')
+        return float(cache.latitud), float(cache.longitud)
+
+    _registrar_geocodificacion('google')
+    latitud, longitud = geocodificar_google(direccion, api_key)
+    GeocodificacionCache.objects.get_or_create(
+        direccion=clave,
+        defaults={'latitud': latitud, 'longitud': longitud},
+    )
+    return latitud, longitud
+
+
+def geocodificar_lote(direcciones, api_key, max_workers=MAX_WORKERS_GEOCODING):
+    """
+    Geocodifica muchas direcciones:
+    - Una sola consulta a la caché para todas
+    - Las faltantes se piden a Google en paralelo (pool acotado de hilos;
+      los hilos sólo hacen HTTP, la base de datos se usa desde este hilo)
+    - Los resultados nuevos se guardan en caché con un solo bulk_create
+
+    Returns:
+        dict direccion -> (latitud, longitud) o GeocodificacionError
+    """
+    claves = {d: normalizar_direccion(d) for d in direcciones}
+    en_cache = {
+        c.direccion: (float(c.latitud), float(c.longitud))
+        for c in GeocodificacionCache.objects.filter(direccion__in=set(claves.values()))
+    }
+
+    resultados = {}
+    pendientes = {}
+    for direccion, clave in claves.items():
+        if clave in en_cache:
+            resultados[direccion] = en_cache[clave]
+        else:
+            # Direcciones que normalizan igual se consultan una sola vez
+            pendientes.setdefault(clave, direccion)
+
+    def _consultar(direccion):
+        try:
+            return geocodificar_google(direccion, api_key)
+        except GeocodificacionError as e:
+            return e
+
+    _registrar_geocodificacion('cache', len(resultados))
+    _registrar_geocodificacion('google', len(pendientes))
+
+    if pendientes:
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            respuestas = dict(zip(pendientes, pool.map(_consultar, pendientes.values())))
+
+        GeocodificacionCache.objects.bulk_create(
+            [
+                GeocodificacionCache(direccion=clave, latitud=r[0], longitud=r[1])
+                for clave, r in respuestas.items()
+                if not isinstance(r, GeocodificacionError)
+            ],
+            ignore_conflicts=True,
+        )
+
+        for direccion, clave in claves.items():
+            if direccion not in resultados:
+                resultados[direccion] = respuestas[clave]
+
+    return resultados
+
+
+def _registrar_geocodificacion(origen, cantidad=1):
+    tel = telemetria.actual()
+    if tel is not None and cantidad:
+        tel.geocodificacion[origen] += cantidad
@@ -0,0 +1,124 @@
+# rutas/services_mapa.py
+import hashlib
+
+from django.db.models import Avg, Count, Max, Min
+from django.db.models.functions import Substr
+
+from . import geohash
+from .models import PuntoEntrega
+
+# Con pocos puntos visibles (o mucho zoom) se envían individuales
+MAX_PUNTOS_SIN_CLUSTER = 300
+ZOOM_SIN_CLUSTER = 16
+
+
+def parsear_bbox(texto):
+    """
+    "lng_min,lat_min,lng_max,lat_max" (orden GeoJSON) -> tupla de float.
+
+    Raises:
+        ValueError si el formato o el rango no es válido
+    """
+    partes = [float(v) for v in (texto or '').split(',')]
+    if len(partes) != 4:
+        raise ValueError('bbox debe tener 4 valores: lng_min,lat_min,lng_max,lat_max')
+    lng_min, lat_min, lng_max, lat_max = partes
+    if not (-90 <= lat_min <= lat_max <= 90 and -180 <= lng_min <= lng_max <= 180):
+        raise ValueError('bbox fuera de rango')
+    return lng_min, lat_min, lng_max, lat_max
+
+
+def precision_para_zoom(zoom):
+    """
+    Largo del prefijo geohash usado como celda de cluster
+    (zoom 10 -> 5 caracteres ≈ 5 km, zoom 12 -> 6 ≈ 1 km, ...).
+    """
+    return max(1, min(geohash.PRECISION, int(zoom) // 2))
+
+
+def puntos_en_bbox(bbox):
+    lng_min, lat_min, lng_max, lat_max = bbox
+    return PuntoEntrega.objects.filter(
+        latitud__range=(lat_min, lat_max),
+        longitud__range=(lng_min, lng_max),
+    )
+
+
+def version_puntos(qs, *extra):
+    """
+    ETag barato: cantidad + última modificación de los puntos del área
+    (no serializa nada; una sola consulta agregada).
+    """
+    datos = qs.aggregate(n=Count('id'), ultimo=Max('actualizado_en'), id_max=Max('id'))
+    texto = "|".join(str(v) for v in (datos['n'], datos['ultimo'], datos['id_max']) + extra)
+    return hashlib.md5(texto.encode('utf-8')).hexdigest()
+
+
+def extension_puntos():
+    """Rectángulo que contiene todos los puntos, o None si no hay"""
+    ext = PuntoEntrega.objects.aggregate(
+        lat_min=Min('latitud'), lng_min=Min('longitud'),
+        lat_max=Max('latitud'), lng_max=Max('longitud'),
+    )
+    if ext['lat_min'] is None:
+        return None
+    return [float(ext['lng_min']), float(ext['lat_min']), float(ext['lng_max']), float(ext['lat_max'])]
+
+
+def geojson_puntos(qs, zoom):
+    """
+    FeatureCollection del área. Si hay demasiados puntos para el zoom,
+    agrupa en SQL por prefijo de geohash (GROUP BY sobre la columna indexada)
+    y devuelve un Feature por celda con la cantidad y el centroide.
+    """
+    total = qs.count()
+
+    if zoom >= ZOOM_SIN_CLUSTER or total <= MAX_PUNTOS_SIN_CLUSTER:
+        features = [
+            _feature(lng, lat, {
+                'id': pid,
+                'nombre': nombre,
+                'direccion': direccion,
+                'orden_optimo': orden,
+            })
+            for pid, nombre, direccion, lat, lng, orden in qs.values_list(
+                'id', 'nombre', 'direccion', 'latitud', 'longitud', 'orden_optimo'
+            )
+        ]
+        return _coleccion(features, total, agrupado=False)
+
+    precision = precision_para_zoom(zoom)
+    celdas = (
+        qs.annotate(celda=Substr('geohash', 1, precision))
+        .values('celda')
+        .annotate(cantidad=Count('id'), lat=Avg('latitud'), lng=Avg('longitud'))
+        .order_by()
+    )
+
+    features = []
+    for c in celdas:
+        lat_min, lng_min, lat_max, lng_max = geohash.limites(c['celda'])
+        features.append(_feature(c['lng'], c['lat'], {
+            'cluster': True,
+            'celda': c['celda'],
+            'cantidad': c['cantidad'],
+            'bbox': [lng_min, lat_min, lng_max, lat_max],
+        }))
+    return _coleccion(features, total, agrupado=True)
+
+
+def _feature(lng, lat, propiedades):
+    return {
+        'type': 'Feature',
+        'geometry': {'type': 'Point', 'coordinates': [float(lng), float(lat)]},
+        'properties': propiedades,
+    }
+
+
+def _coleccion(features, total, agrupado):
+    return {
+        'type': 'FeatureCollection',
+        'features': features,
+        'total': total,
+        'agrupado': agrupado,
+    }
@@ -0,0 +1,195 @@
+# rutas/services_matriz.py
+import logging
+import time
+from collections import defaultdict
+
+from django.utils import timezone
+
+from .models import TramoMatriz
+from . import optimizer
+from . import telemetria
+from .services_red_vial import red_configurada, matrices_locales
+
+logger = logging.getLogger(__name__)
+
+INF = float('inf')
+
+# Cantidad de claves por consulta "IN" al leer tramos guardados
+LOTE_LECTURA = 500
+
+
+def clave_coordenada(lat, lng):
+    """Clave normalizada "lat,lng" (6 decimales) usada en TramoMatriz"""
+    return f"{float(lat):.6f},{float(lng):.6f}"
+
+
+def claves_de_ruta(points, origin_coords, dest_coords=None):
+    """Claves en el mismo orden que los índices de la matriz del optimizador"""
+    claves = [clave_coordenada(origin_coords['latitud'], origin_coords['longitud'])]
+    claves.extend(clave_coordenada(p.latitud, p.longitud) for p in points)
+    if dest_coords is not None:
+        claves.append(clave_coordenada(dest_coords['latitud'], dest_coords['longitud']))
+    return claves
+
+
+def leer_tramos(claves, actualizados_desde=None):
+    """
+    Lee las celdas guardadas entre todas las claves.
+
+    Returns:
+        dict (origen, destino) -> (distancia_km, duracion_s)
+    """
+    unicas = sorted(set(claves))
+    celdas = {}
+    for i in range(0, len(unicas), LOTE_LECTURA):
+        qs = TramoMatriz.objects.filter(
+            origen__in=unicas[i:i + LOTE_LECTURA],
+            destino__in=unicas,
+        )
+        if actualizados_desde is not None:
+            qs = qs.filter(actualizado_en__gte=actualizados_desde)
+        for origen, destino, distancia_m, duracion_s in qs.values_list(
+            'origen', 'destino', 'distancia_m', 'duracion_s'
+        ):
+            celdas[(origen, destino)] = _a_celda(distancia_m, duracion_s)
+    return celdas
+
+
+def celdas_faltantes(claves, celdas):
+    """dict origen -> set(destinos) que aún no están en `celdas`"""
+    unicas = sorted(set(claves))
+    faltantes = defaultdict(set)
+    for origen in unicas:
+        for destino in unicas:
+            if origen != destino and (origen, destino) not in celdas:
+                faltantes[origen].add(destino)
+    return faltantes
+
+
+def agrupar_faltantes(faltantes):
+    """
+    Cubre las celdas faltantes con bloques de máx 10×10: agrupa los orígenes
+    que comparten el mismo conjunto de destinos faltantes y corta cada grupo
+    en bloques. Un origen puede sumar su propia celda (origen = destino,
+    que descargar_bloque no guarda) si así calza con más orígenes: en un
+    precálculo desde cero todos quedan en un grupo y n puntos cuestan
+    ⌈n/10⌉² bloques; agregar k puntos a n conocidos cuesta ~2·k·n
+    elementos y no (n+k)².
+
+    Returns:
+        lista de (origenes, destinos)
+    """
+    claves = {
+        origen: (frozenset(destinos), frozenset(destinos) | {origen})
+        for origen, destinos in faltantes.items() if destinos
+    }
+    frecuencia = defaultdict(int)
+    for exacto, con_diagonal in claves.values():
+        frecuencia[exacto] += 1
+        frecuencia[con_diagonal] += 1
+
+    grupos = defaultdict(list)
+    for origen, (exacto, con_diagonal) in claves.items():
+        # Empate: sin la diagonal (un elemento menos por bloque)
+        clave = con_diagonal if frecuencia[con_diagonal] > frecuencia[exacto] else exacto
+        grupos[clave].append(origen)
+
+    tam = optimizer.MAX_LOCATIONS_PER_CALL
+    bloques = []
+    for destinos, origenes in grupos.items():
+        origenes.sort()
+        destinos = sorted(destinos)
+        for i in range(0, len(origenes), tam):
+            for j in range(0, len(destinos), tam):
+                bloques.append((origenes[i:i + tam], destinos[j:j + tam]))
+    return bloques
+
+
+def descargar_bloque(origenes, destinos, api_key):
+    """
+    Consulta un bloque en Google y lo persiste de inmediato
+    (si el proceso se interrumpe, lo ya descargado no se vuelve a pedir).
+
+    Returns:
+        dict (origen, destino) -> (distancia_km, duracion_s), o None si falla
+    """
+    filas = optimizer.consultar_bloque(origenes, destinos, api_key)
+    if filas is None:
+        return None
+
+    celdas = {}
+    tramos = []
+    for origen, fila in zip(origenes, filas):
+        for destino, (distancia_km, duracion_s) in zip(destinos, fila):
+            if origen == destino:
+                continue
+            celdas[(origen, destino)] = (distancia_km, duracion_s)
+            tramos.append(TramoMatriz(
+                origen=origen,
+                destino=destino,
+                distancia_m=None if distancia_km == INF else int(round(distancia_km * 1000)),
+                duracion_s=None if duracion_s == INF else int(round(duracion_s)),
+                actualizado_en=timezone.now(),
+            ))
+
+    TramoMatriz.objects.bulk_create(
+        tramos,
+        update_conflicts=True,
+        unique_fields=['origen', 'destino'],
+        update_fields=['distancia_m', 'duracion_s', 'actualizado_en'],
+    )
+    return celdas
+
+
+def obtener_matrices(points, origin_coords, api_key, dest_coords=None):
+    """
+    Igual que optimizer.get_distance_duration_matrix, pero lee las celdas
+    ya precalculadas y sólo consulta a Google las que faltan
+    (puntos agregados desde la última corrida de `precalcular_matriz`).
+    Con una red vial local configurada (RUTAS_RED_VIAL) no consulta a Google.
+
+    Returns:
+        (distance_matrix, duration_matrix) o None si falla la API
+    """
+    red = red_configurada()
+    if red is not None:
+        tel = telemetria.actual()
+        if tel is not None:
+            tel.proveedor_matriz = 'red_local'
+        return matrices_locales(red, points, origin_coords, dest_coords)
+
+    claves = claves_de_ruta(points, origin_coords, dest_coords)
+    celdas = leer_tramos(claves)
+
+    tel = telemetria.actual()
+    if tel is not None:
+        unicas = len(set(claves))
+        tel.celdas_solicitadas += unicas * (unicas - 1)
+        tel.celdas_cache += len(celdas)
+
+    bloques = agrupar_faltantes(celdas_faltantes(claves, celdas))
+    if bloques:
+        logger.info(f"Matriz: {len(bloques)} bloque(s) faltantes se consultarán a Google")
+    for origenes, destinos in bloques:
+        nuevas = descargar_bloque(origenes, destinos, api_key)
+        if nuevas is None:
+            return None
+        celdas.update(nuevas)
+        time.sleep(optimizer.PAUSA_ENTRE_SOLICITUDES)
+
+    n = len(claves)
+    distance_matrix = [[0.0] * n for _ in range(n)]
+    duration_matrix = [[0.0] * n for _ in range(n)]
+    for i, origen in enumerate(claves):
+        for j, destino in enumerate(claves):
+            if origen == destino:
+                continue
+            distance_matrix[i][j], duration_matrix[i][j] = celdas.get((origen, destino), (INF, INF))
+
+    return distance_matrix, duration_matrix
+
+
+def _a_celda(distancia_m, duracion_s):
+    if distancia_m is None or duracion_s is None:
+        return (INF, INF)
+    return (distancia_m / 1000.0, float(duracion_s))
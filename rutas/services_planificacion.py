@@ -0,0 +1,109 @@
+# rutas/services_planificacion.py
+"""
+Plan de varios días: reparte un backlog de puntos en rutas diarias
+usando la matriz cacheada (services_matriz) y rutas.planificador, y lo
+persiste como un PlanRutas con una RutaOptimizada por día y vehículo.
+"""
+import datetime
+import logging
+
+from django.db import transaction
+
+from . import optimizer
+from . import planificador
+from .models import PlanRutas, RutaOptimizada
+from .services_matriz import obtener_matrices
+
+logger = logging.getLogger(__name__)
+
+HORA_SALIDA_POR_DEFECTO = datetime.time(8, 0)
+
+
+class PlanificacionError(Exception):
+    pass
+
+
+def planificar_backlog(puntos, origen_coords, fecha_inicio, dias, vehiculos=1,
+                       max_horas=None, max_km=None, hora_salida=None,
+                       direccion_origen='', api_key=None):
+    """
+    Args:
+        puntos: PuntoEntrega del backlog
+        origen_coords: {'latitud', 'longitud'} del depósito (inicio y fin de cada jornada)
+        dias / vehiculos: jornadas disponibles = dias × vehiculos
+        max_horas / max_km: presupuesto por jornada (al menos uno)
+
+    Returns:
+        PlanRutas (con sus rutas ya creadas)
+
+    Raises:
+        PlanificacionError
+    """
+    if not puntos:
+        raise PlanificacionError('No hay puntos para planificar.')
+    if dias < 1 or vehiculos < 1:
+        raise PlanificacionError('Debe haber al menos un día y un vehículo.')
+    if max_horas is None and max_km is None:
+        raise PlanificacionError('Indica un máximo de horas o de kilómetros por jornada.')
+
+    matrices = obtener_matrices(puntos, origen_coords, api_key)
+    if matrices is None:
+        raise PlanificacionError(
+            'No se pudo obtener la matriz de distancias. Revisa la clave API o la conexión.'
+        )
+    distancias, duraciones = matrices
+
+    coords = [(float(origen_coords['latitud']), float(origen_coords['longitud']))]
+    coords.extend((float(p.latitud), float(p.longitud)) for p in puntos)
+    servicio = [0] + [p.tiempo_servicio_min * 60 for p in puntos]
+
+    resultado = planificador.planificar(
+        distancias,
+        duraciones,
+        coords,
+        dias * vehiculos,
+        max_duracion_s=float(max_horas) * 3600 if max_horas is not None else None,
+        max_distancia_km=float(max_km) if max_km is not None else None,
+        tiempos_servicio=servicio,
+    )
+
+    salida = optimizer.hora_a_segundos(hora_salida or HORA_SALIDA_POR_DEFECTO)
+    with transaction.atomic():
+        plan = PlanRutas.objects.create(
+            fecha_inicio=fecha_inicio,
+            dias=dias,
+            vehiculos=vehiculos,
+            max_horas=max_horas,
+            max_km=max_km,
+            distancia_km=round(resultado['distancia_km'], 2),
+            sin_asignar=[puntos[i - 1].id for i in resultado['sin_asignar']],
+        )
+        rutas = []
+        for k, jornada in enumerate(resultado['jornadas']):
+            etas = optimizer.calcular_etas(
+                jornada['ruta'], duraciones, tiempos_servicio=servicio, hora_salida=salida,
+            )
+            rutas.append(RutaOptimizada(
+                plan=plan,
+                fecha=fecha_inicio + datetime.timedelta(days=k // vehiculos),
+                vehiculo=k % vehiculos + 1,
+                direccion_origen=direccion_origen,
+                direccion_destino=direccion_origen,
+                origen_lat=origen_coords['latitud'],
+                origen_lng=origen_coords['longitud'],
+                destino_lat=origen_coords['latitud'],
+                destino_lng=origen_coords['longitud'],
+                puntos=[puntos[i - 1].id for i in jornada['ruta'][1:-1]],
+                distancia_km=round(jornada['distancia_km'], 2),
+                etas={
+                    str(puntos[i - 1].id): optimizer.formatear_hora(segundos)
+                    for i, segundos in etas.items()
+                },
+            ))
+        RutaOptimizada.objects.bulk_create(rutas)
+
+    logger.info(
+        f"Plan #{plan.id}: {len(puntos)} puntos en {len(rutas)} jornadas, "
+        f"{plan.distancia_km} km, {len(plan.sin_asignar)} sin asignar"
+    )
+    return plan
@@ -0,0 +1,134 @@
+# rutas/services_polyline.py
+import logging
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+DIRECTIONS_URL = "https://maps.googleapis.com/maps/api/directions/json"
+
+# LÍMITE DE GOOGLE DIRECTIONS: 25 waypoints intermedios por solicitud
+# (más origen y destino = 27 puntos por tramo)
+MAX_WAYPOINTS_POR_TRAMO = 25
+
+
+# --- Formato "Encoded Polyline" de Google ---
+
+def codificar_polyline(coords):
+    """
+    Codifica una lista [(lat, lng), ...] en el formato Encoded Polyline de Google.
+    """
+    resultado = []
+    prev_lat = prev_lng = 0
+
+    for lat, lng in coords:
+        lat_e5 = int(round(lat * 1e5))
+        lng_e5 = int(round(lng * 1e5))
+        for delta in (lat_e5 - prev_lat, lng_e5 - prev_lng):
+            valor = ~(delta << 1) if delta < 0 else (delta << 1)
+            while valor >= 0x20:
+                resultado.append(chr((0x20 | (valor & 0x1f)) + 63))
+                valor >>= 5
+            resultado.append(chr(valor + 63))
+        prev_lat, prev_lng = lat_e5, lng_e5
+
+    return "".join(resultado)
+
+
+def decodificar_polyline(texto):
+    """
+    Decodifica un Encoded Polyline de Google a [(lat, lng), ...].
+    """
+    coords = []
+    idx = lat = lng = 0
+    largo = len(texto)
+
+    while idx < largo:
+        deltas = []
+        for _ in range(2):
+            shift = valor = 0
+            while True:
+                b = ord(texto[idx]) - 63
+                idx += 1
+                valor |= (b & 0x1f) << shift
+                shift += 5
+                if b < 0x20:
+                    break
+            deltas.append(~(valor >> 1) if valor & 1 else valor >> 1)
+        lat += deltas[0]
+        lng += deltas[1]
+        coords.append((lat / 1e5, lng / 1e5))
+
+    return coords
+
+
+# --- Directions API por tramos ---
+
+def dividir_en_tramos(coords, max_waypoints=MAX_WAYPOINTS_POR_TRAMO):
+    """
+    Divide la secuencia de coordenadas en tramos que respetan el límite
+    de waypoints. Tramos consecutivos comparten el punto de unión.
+    """
+    paso = max_waypoints + 1
+    tramos = []
+    for i in range(0, len(coords) - 1, paso):
+        tramos.append(coords[i:i + paso + 1])
+    return tramos
+
+
+def obtener_polyline_ruta(coords, api_key):
+    """
+    Pide a Directions API el recorrido completo (en tramos) y devuelve
+    la polyline codificada de toda la ruta, o None si falla.
+    """
+    if len(coords) < 2:
+        return None
+
+    puntos = []
+    for tramo in dividir_en_tramos(coords):
+        params = {
+            "origin": f"{tramo[0][0]},{tramo[0][1]}",
+            "destination": f"{tramo[-1][0]},{tramo[-1][1]}",
+            "mode": "driving",
+            "key": api_key,
+        }
+        if len(tramo) > 2:
+            params["waypoints"] = "|".join(f"{lat},{lng}" for lat, lng in tramo[1:-1])
+
+        try:
+            response = requests.get(DIRECTIONS_URL, params=params, timeout=30)
+            response.raise_for_status()
+            data = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.error(f"Error consultando Directions API: {e}")
+            return None
+
+        if data.get('status') != 'OK' or not data.get('routes'):
+            logger.error(
+                f"Directions API respondió {data.get('status')}: "
+                f"{data.get('error_message', 'Sin mensaje de error')}"
+            )
+            return None
+
+        tramo_puntos = decodificar_polyline(data['routes'][0]['overview_polyline']['points'])
+        if puntos and tramo_puntos:
+            # El primer punto del tramo es el último del anterior
+            tramo_puntos = tramo_puntos[1:]
+        puntos.extend(tramo_puntos)
+
+    return codificar_polyline(puntos)
+
+
+def asegurar_polyline(ruta, api_key):
+    """
+    Devuelve la polyline de la ruta; si aún no está guardada la pide
+    una sola vez a Google y la persiste.
+    """
+    if ruta.polyline:
+        return ruta.polyline
+
+    polyline = obtener_polyline_ruta(ruta.coordenadas(), api_key)
+    if polyline:
+        ruta.polyline = polyline
+        ruta.save(update_fields=['polyline'])
+    return ruta.polyline
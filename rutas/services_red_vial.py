@@ -0,0 +1,73 @@
+# rutas/services_red_vial.py
+"""
+Proveedor de matrices de distancia con la red vial local
+(alternativa a Google Distance Matrix; ver rutas.red_vial).
+"""
+import functools
+import logging
+import os
+
+from django.conf import settings
+
+from . import red_vial
+
+logger = logging.getLogger(__name__)
+
+INF = float('inf')
+
+
+@functools.lru_cache(maxsize=1)
+def _cargar(ruta, modificado):
+    red = red_vial.cargar(ruta)
+    logger.info(f"Red vial cargada desde {ruta}: {red.n} nodos")
+    return red
+
+
+def red_configurada():
+    """RedVial de settings.RUTAS_RED_VIAL (cacheada por proceso), o None"""
+    ruta = getattr(settings, 'RUTAS_RED_VIAL', '')
+    if not ruta:
+        return None
+    try:
+        return _cargar(ruta, os.path.getmtime(ruta))
+    except (OSError, ValueError) as e:
+        logger.error(f"No se pudo cargar la red vial {ruta}: {e}")
+        return None
+
+
+def version_red():
+    """
+    Identifica la red configurada (archivo + fecha de modificación), o
+    None si no hay red o no se pudo cargar (las matrices salen de Google)
+    """
+    ruta = getattr(settings, 'RUTAS_RED_VIAL', '')
+    if not ruta or red_configurada() is None:
+        return None
+    return f"red_local:{ruta}:{os.path.getmtime(ruta)}"
+
+
+def matrices_locales(red, points, origin_coords, dest_coords=None):
+    """
+    Mismo formato que services_matriz.obtener_matrices: el orden es
+    origen, puntos y (opcional) destino.
+
+    Returns:
+        (distance_matrix en km, duration_matrix en segundos)
+    """
+    coords = [(float(origin_coords['latitud']), float(origin_coords['longitud']))]
+    coords.extend((float(p.latitud), float(p.longitud)) for p in points)
+    if dest_coords is not None:
+        coords.append((float(dest_coords['latitud']), float(dest_coords['longitud'])))
+
+    nodos = [red.nodo_mas_cercano(lat, lng) for lat, lng in coords]
+    segundos, metros = red.matriz(nodos, nodos)
+
+    n = len(coords)
+    distance_matrix = [[0.0] * n for _ in range(n)]
+    duration_matrix = [[0.0] * n for _ in range(n)]
+    for i in range(n):
+        for j in range(n):
+            if i != j:
+                distance_matrix[i][j] = metros[i][j] / 1000 if metros[i][j] < INF else INF
+                duration_matrix[i][j] = segundos[i][j]
+    return distance_matrix, duration_matrix
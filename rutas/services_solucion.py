@@ -0,0 +1,142 @@
+# rutas/services_solucion.py
+"""
+Caché de soluciones de ruta.
+
+Volver a optimizar la misma selección (mismos puntos y coordenadas,
+origen, destino, versión de la matriz y configuración del solver) reutiliza
+la ruta ya resuelta: no se pide la matriz ni se corre el solver. Cambiar sólo
+el precio de la bencina o el rendimiento recalcula el costo al instante.
+
+Dos niveles: LRU en memoria del proceso + tabla SolucionRuta.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from django.db.models import Max
+
+from . import optimizer
+from .models import RutaOptimizada, SolucionRuta, TramoMatriz
+from .services_matriz import clave_coordenada
+from .services_red_vial import version_red
+
+# Soluciones recordadas en memoria por proceso
+MAX_SOLUCIONES_MEMORIA = 128
+
+# Subir al cambiar el optimizador: invalida las soluciones guardadas
+VERSION_SOLVER = 2
+
+_memoria = OrderedDict()
+_candado = threading.Lock()
+
+
+def version_matriz():
+    """
+    Cambia cuando cambian las celdas que puede usar el optimizador:
+    la red vial local configurada o el último tramo guardado de Google.
+    """
+    red = version_red()
+    if red is not None:
+        return red
+    ultima = TramoMatriz.objects.aggregate(ultima=Max('actualizado_en'))['ultima']
+    return f"google:{ultima.isoformat() if ultima else '-'}"
+
+
+def clave_solucion(puntos, origen, destino, version, config):
+    """sha256 de todo lo que determina la solución"""
+    datos = {
+        'puntos': sorted([p.id, clave_coordenada(p.latitud, p.longitud)] for p in puntos),
+        'origen': clave_coordenada(origen['latitud'], origen['longitud']),
+        'destino': clave_coordenada(destino['latitud'], destino['longitud']) if destino else None,
+        'matriz': version,
+        'solver': {**config, 'version': VERSION_SOLVER},
+    }
+    return hashlib.sha256(json.dumps(datos, sort_keys=True).encode()).hexdigest()
+
+
+def _recordar(clave, solucion):
+    with _candado:
+        _memoria[clave] = solucion
+        _memoria.move_to_end(clave)
+        while len(_memoria) > MAX_SOLUCIONES_MEMORIA:
+            _memoria.popitem(last=False)
+
+
+def olvidar_todo():
+    with _candado:
+        _memoria.clear()
+
+
+def buscar_solucion(clave):
+    """
+    Returns:
+        dict con ruta (RutaOptimizada), puntos (ids en orden), distancia_km,
+        tramos_s y factible; o None
+    """
+    with _candado:
+        solucion = _memoria.get(clave)
+        if solucion is not None:
+            _memoria.move_to_end(clave)
+
+    if solucion is None:
+        fila = SolucionRuta.objects.filter(clave=clave).select_related('ruta').first()
+        if fila is None:
+            return None
+        solucion = {
+            'ruta_id': fila.ruta_id,
+            'puntos': fila.ruta.puntos,
+            'distancia_km': fila.distancia_km,
+            'tramos_s': fila.tramos_s,
+            'factible': fila.factible,
+        }
+        _recordar(clave, solucion)
+
+    # La ruta pudo borrarse (en la base la solución se borra en cascada)
+    ruta = RutaOptimizada.objects.filter(pk=solucion['ruta_id']).first()
+    if ruta is None:
+        with _candado:
+            _memoria.pop(clave, None)
+        return None
+    return {**solucion, 'ruta': ruta}
+
+
+def guardar_solucion(clave, ruta, distancia_km, tramos_s, factible):
+    SolucionRuta.objects.update_or_create(
+        clave=clave,
+        defaults={
+            'ruta': ruta,
+            'distancia_km': distancia_km,
+            'tramos_s': tramos_s,
+            'factible': factible,
+        },
+    )
+    _recordar(clave, {
+        'ruta_id': ruta.id,
+        'puntos': ruta.puntos,
+        'distancia_km': distancia_km,
+        'tramos_s': tramos_s,
+        'factible': factible,
+    })
+
+
+def tramos_de_ruta(route, duration_matrix):
+    """Duración de cada tramo consecutivo de la ruta (índices de matriz)"""
+    return [duration_matrix[a][b] for a, b in zip(route, route[1:])]
+
+
+def etas_desde_tramos(tramos_s, ventanas, tiempos_servicio, hora_salida):
+    """
+    ETAs de una solución cacheada. Las ventanas y tiempos de atención van
+    por posición en la ruta (0 = origen).
+
+    Returns:
+        dict posición -> segundos desde medianoche
+    """
+    m = len(tramos_s) + 1
+    # "Matriz" con sólo los tramos de la ruta: posición k -> k+1
+    duraciones = [{k + 1: t} for k, t in enumerate(tramos_s)] + [{}]
+    return optimizer.calcular_etas(
+        list(range(m)), duraciones,
+        ventanas=ventanas, tiempos_servicio=tiempos_servicio, hora_salida=hora_salida,
+    )
@@ -0,0 +1,11 @@
+from django.db.models.signals import pre_save
+from django.dispatch import receiver
+
+from .models import PuntoEntrega
+
+
+@receiver(pre_save, sender=PuntoEntrega)
+def calcular_geohash_punto_cargado(sender, instance, raw=False, **kwargs):
+    # save() calcula el geohash; loaddata (raw) guarda sin pasar por save()
+    if raw:
+        instance.actualizar_geohash()
@@ -2,8 +2,12 @@
 
 let map;
 let markers = [];
-let directionsService = null;
-let directionsRenderer = null;
+let routeLine = null;
+
+// Capa de puntos visibles (api_puntos): se recarga al mover el mapa
+let viewportMarkers = [];
+let viewportRequest = null;
+let viewportTimer = null;
 
 function initMap() {
     console.log("initMap llamado");
@@ -24,13 +28,105 @@ function initMap() {
         zoom: 12
     });
 
-    directionsService = new google.maps.DirectionsService();
-    directionsRenderer = new google.maps.DirectionsRenderer({
-        suppressMarkers: true
-    });
-    directionsRenderer.setMap(map);
-
     renderPuntosEntrega();
+
+    // Sin ruta seleccionada: los puntos se piden por área visible
+    const hayRuta = Array.isArray(puntos_entrega_data) && puntos_entrega_data.length > 0;
+    if (!hayRuta && typeof puntos_api_url !== "undefined") {
+        if (Array.isArray(puntos_extension) && !(typeof origen_coords !== "undefined" && origen_coords)) {
+            const [lngMin, latMin, lngMax, latMax] = puntos_extension;
+            map.fitBounds(new google.maps.LatLngBounds(
+                { lat: latMin, lng: lngMin },
+                { lat: latMax, lng: lngMax }
+            ));
+        }
+        map.addListener("idle", () => {
+            clearTimeout(viewportTimer);
+            viewportTimer = setTimeout(cargarPuntosVisibles, 150);
+        });
+    }
+}
+
+// Redondea el área hacia afuera a una grilla según el zoom: al mover
+// poco el mapa se repite la misma URL y el navegador revalida con ETag.
+function bboxVisible() {
+    const bounds = map.getBounds();
+    if (!bounds) return null;
+
+    const paso = Math.min(1, 0.01 * Math.pow(2, 12 - map.getZoom()));
+    const sw = bounds.getSouthWest();
+    const ne = bounds.getNorthEast();
+    const abajo = (v) => (Math.floor(v / paso) * paso).toFixed(5);
+    const arriba = (v) => (Math.ceil(v / paso) * paso).toFixed(5);
+
+    return [
+        Math.max(-180, abajo(sw.lng())),
+        Math.max(-90, abajo(sw.lat())),
+        Math.min(180, arriba(ne.lng())),
+        Math.min(90, arriba(ne.lat()))
+    ].join(",");
+}
+
+function cargarPuntosVisibles() {
+    const bbox = bboxVisible();
+    if (!bbox) return;
+
+    if (viewportRequest) viewportRequest.abort();
+    viewportRequest = new AbortController();
+
+    const url = `${puntos_api_url}?bbox=${bbox}&zoom=${map.getZoom()}`;
+    fetch(url, { credentials: "same-origin", signal: viewportRequest.signal })
+        .then((response) => {
+            if (!response.ok) throw new Error("HTTP " + response.status);
+            return response.json();
+        })
+        .then(renderPuntosVisibles)
+        .catch((err) => {
+            if (err.name !== "AbortError") console.error("Error cargando puntos:", err);
+        });
+}
+
+function renderPuntosVisibles(geojson) {
+    viewportMarkers.forEach((m) => m.setMap(null));
+    viewportMarkers = [];
+
+    geojson.features.forEach((f) => {
+        const [lng, lat] = f.geometry.coordinates;
+        const props = f.properties;
+        let marker;
+
+        if (props.cluster) {
+            marker = new google.maps.Marker({
+                position: { lat: lat, lng: lng },
+                map: map,
+                label: { text: String(props.cantidad), color: "white", fontWeight: "600" },
+                title: `${props.cantidad} puntos`,
+                icon: {
+                    path: google.maps.SymbolPath.CIRCLE,
+                    scale: Math.min(28, 12 + 3 * Math.log2(props.cantidad)),
+                    fillColor: "#4f46e5",
+                    fillOpacity: 0.85,
+                    strokeColor: "white",
+                    strokeWeight: 2
+                }
+            });
+            marker.addListener("click", () => {
+                const [lngMin, latMin, lngMax, latMax] = props.bbox;
+                map.fitBounds(new google.maps.LatLngBounds(
+                    { lat: latMin, lng: lngMin },
+                    { lat: latMax, lng: lngMax }
+                ));
+            });
+        } else {
+            marker = new google.maps.Marker({
+                position: { lat: lat, lng: lng },
+                map: map,
+                title: `${props.nombre} - ${props.direccion}`
+            });
+        }
+
+        viewportMarkers.push(marker);
+    });
 }
 
 function renderPuntosEntrega() {
@@ -82,7 +178,9 @@ function renderPuntosEntrega() {
                 position: position,
                 map: map,
                 label: labelText,
-                title: `${p.nombre} - ${p.direccion}`
+                title: p.eta
+                    ? `${p.nombre} - ${p.direccion} (llegada ${p.eta})`
+                    : `${p.nombre} - ${p.direccion}`
             });
 
             markers.push(marker);
@@ -112,37 +210,26 @@ function renderPuntosEntrega() {
     }
 
     if (path.length > 1) {
-        drawRouteWithDirectionsAPI(path);
+        drawRoute(path);
     }
 }
 
-function drawRouteWithDirectionsAPI(path) {
-    if (!directionsService || !directionsRenderer) return;
-    if (!Array.isArray(path) || path.length < 2) return;
-
-    const origin = path[0];
-    const destination = path[path.length - 1];
-
-    const waypoints = path.slice(1, -1).map((pos) => ({
-        location: pos,
-        stopover: true
-    }));
-
-    const request = {
-        origin: origin,
-        destination: destination,
-        waypoints: waypoints,
-        travelMode: google.maps.TravelMode.DRIVING,
-        optimizeWaypoints: false
-    };
-
-    directionsService.route(request, (result, status) => {
-        console.log("Directions status:", status);
-        if (status === "OK" || status === google.maps.DirectionsStatus.OK) {
-            directionsRenderer.setDirections(result);
-        } else {
-            console.error("Error en Directions API:", status);
-        }
+// La polyline viene calculada y cacheada por el backend (una vez por ruta).
+// Sin polyline se dibuja una línea recta entre paradas, sin llamar a Google.
+function drawRoute(path) {
+    let routePath = path;
+
+    if (typeof ruta_polyline !== "undefined" && ruta_polyline &&
+        google.maps.geometry && google.maps.geometry.encoding) {
+        routePath = google.maps.geometry.encoding.decodePath(ruta_polyline);
+    }
+
+    routeLine = new google.maps.Polyline({
+        path: routePath,
+        map: map,
+        strokeColor: "#2563eb",
+        strokeOpacity: 0.85,
+        strokeWeight: 5
     });
 }
 
@@ -152,8 +239,9 @@ function clearMap() {
         markers = [];
     }
 
-    if (directionsRenderer) {
-        directionsRenderer.set("directions", null);
+    if (routeLine) {
+        routeLine.setMap(null);
+        routeLine = null;
     }
 }
 
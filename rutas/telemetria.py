@@ -0,0 +1,133 @@
+# rutas/telemetria.py
+"""
+Telemetría de una optimización de ruta: llamadas a Google, aciertos de
+caché, reintentos, solver usado, curva de mejora y tiempo por fase.
+
+La vista activa un registro con `@con_telemetria`; el optimizador y los
+servicios anotan en él vía `actual()` sin cambiar sus firmas (si no hay
+registro activo, no hacen nada).
+"""
+import contextvars
+import functools
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+_actual = contextvars.ContextVar('telemetria_optimizacion', default=None)
+
+# La curva de mejora se guarda con a lo más estos puntos
+MAX_PUNTOS_CURVA = 200
+
+
+class Telemetria:
+    def __init__(self):
+        self._inicio = time.perf_counter()
+        self._ultima_marca = self._inicio
+        self.fases_ms = {}
+        self.proveedor_matriz = 'google'
+        self.celdas_solicitadas = 0
+        self.celdas_cache = 0
+        self.bloques = []
+        self.reintentos = 0
+        self.geocodificacion = {'cache': 0, 'google': 0}
+        self.solver = None
+        self.solucion_en_cache = False
+        self.curva = []  # (ms, distancia): solución inicial y cada mejora
+
+    def ms(self):
+        """Milisegundos desde el inicio del registro"""
+        return round((time.perf_counter() - self._inicio) * 1000, 1)
+
+    def marcar(self, nombre):
+        """Cierra la fase `nombre`: el tiempo desde la marca anterior"""
+        ahora = time.perf_counter()
+        self.fases_ms[nombre] = round(
+            self.fases_ms.get(nombre, 0) + (ahora - self._ultima_marca) * 1000, 1
+        )
+        self._ultima_marca = ahora
+
+    def registrar_bloque(self, elementos, latencia_s, intentos, ok):
+        self.bloques.append({
+            'elementos': elementos,
+            'latencia_ms': round(latencia_s * 1000, 1),
+            'intentos': intentos,
+            'ok': ok,
+        })
+        self.reintentos += intentos - 1
+
+    def registrar_mejora(self, distancia):
+        self.curva.append((self.ms(), round(distancia, 3)))
+
+    def como_dict(self):
+        curva = self.curva
+        if len(curva) > MAX_PUNTOS_CURVA:
+            paso = len(curva) / (MAX_PUNTOS_CURVA - 1)
+            curva = [curva[int(i * paso)] for i in range(MAX_PUNTOS_CURVA - 1)] + [curva[-1]]
+
+        latencias = [b['latencia_ms'] for b in self.bloques]
+        return {
+            'total_ms': self.ms(),
+            'fases_ms': self.fases_ms,
+            'matriz': {
+                'proveedor': self.proveedor_matriz,
+                'celdas_solicitadas': self.celdas_solicitadas,
+                'celdas_cache': self.celdas_cache,
+                'bloques_google': len(self.bloques),
+                'reintentos': self.reintentos,
+                'latencia_ms_total': round(sum(latencias), 1),
+                'latencia_ms_max': max(latencias, default=0),
+                'bloques': self.bloques,
+            },
+            'geocodificacion': self.geocodificacion,
+            'solver': {
+                'solucion_en_cache': self.solucion_en_cache,
+                'estrategia': self.solver,
+                'iteraciones': max(0, len(self.curva) - 1),
+                'curva': curva,
+            },
+        }
+
+
+def actual():
+    """Registro activo en este contexto, o None"""
+    return _actual.get()
+
+
+def con_telemetria(vista):
+    """Decorador: un registro nuevo por request (se descarta al salir)"""
+    @functools.wraps(vista)
+    def envoltura(*args, **kwargs):
+        token = _actual.set(Telemetria())
+        try:
+            return vista(*args, **kwargs)
+        finally:
+            _actual.reset(token)
+    return envoltura
+
+
+def registrar_solver(nombre):
+    tel = actual()
+    if tel is not None:
+        tel.solver = nombre
+
+
+def registrar_mejora(distancia):
+    tel = actual()
+    if tel is not None:
+        tel.registrar_mejora(distancia)
+
+
+def emitir(ruta_id, datos):
+    """
+    Registro de log estructurado (logger "rutas.telemetria"): el mensaje
+    es legible y los datos completos van en `record.telemetria`.
+    """
+    logger.info(
+        f"Ruta #{ruta_id}: {json.dumps(datos['fases_ms'])} total {datos['total_ms']} ms, "
+        f"solver {datos['solver']['estrategia']} ({datos['solver']['iteraciones']} mejoras), "
+        f"{datos['matriz']['celdas_cache']}/{datos['matriz']['celdas_solicitadas']} celdas en caché, "
+        f"{datos['matriz']['bloques_google']} bloques a Google ({datos['matriz']['reintentos']} reintentos)",
+        extra={'ruta_id': ruta_id, 'telemetria': datos},
+    )
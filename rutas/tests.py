@@ -1,3 +1,664 @@
-from django.test import TestCase
+import datetime
+import io
+import json
+import os
+import random
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from crm.models import Cliente, Venta
+
+from . import benchmark
+from . import geohash
+from . import optimizer
+from . import planificador
+from . import red_vial
+from . import services_cercania
+from . import services_geocoding
+from . import services_mapa
+from . import services_matriz
+from . import services_red_vial
+from . import services_solucion
+from . import telemetria
+from .models import GeocodificacionCache, PlanRutas, PuntoEntrega, RutaOptimizada, TramoMatriz
+from .services_carga import leer_filas, importar_puntos
+from .services_entregas import generar_puntos_del_dia
+from .services_polyline import codificar_polyline, decodificar_polyline, dividir_en_tramos
+
+
+def _matriz_linea(posiciones):
+    """Matriz simétrica de puntos sobre una recta (distancia = |a - b|)"""
+    return [[abs(a - b) for b in posiciones] for a in posiciones]
+
+
+class VentanasHorariasTestCase(SimpleTestCase):
+    def setUp(self):
+        # Origen en 0, entregas en 1, 2 y 3 km; 1 km = 60 s
+        self.distancias = _matriz_linea([0, 1, 2, 3])
+        self.duraciones = [[d * 60 for d in fila] for fila in self.distancias]
+
+    def test_respeta_ventanas_que_invierten_el_orden(self):
+        # El punto más cercano (1) sólo recibe desde los 10 minutos
+        # y el más lejano (3) sólo hasta los 200 segundos
+        ventanas = [None, (600, 700), None, (0, 200)]
+        ruta, distancia, etas, factible = optimizer.solve_tsp_ventanas(
+            self.distancias, self.duraciones, 3, ventanas=ventanas
+        )
+        self.assertTrue(factible)
+        self.assertEqual(ruta[0], 0)
+        self.assertEqual(ruta[-1], 0)
+        self.assertEqual(ruta[-2], 1)
+        self.assertLessEqual(etas[3], 200)
+        self.assertEqual(etas[1], 600)
+        self.assertEqual(distancia, optimizer._route_distance(self.distancias, ruta))
+
+    def test_sin_ventanas_encuentra_ruta_optima(self):
+        ruta, distancia, etas, factible = optimizer.solve_tsp_ventanas(
+            self.distancias, self.duraciones, 3
+        )
+        self.assertTrue(factible)
+        self.assertEqual(distancia, 6)
+        self.assertEqual(set(etas), {1, 2, 3})
+
+    def test_ventanas_imposibles_marcan_ruta_no_factible(self):
+        ventanas = [None, (0, 10), (0, 10), None]
+        ruta, _, _, factible = optimizer.solve_tsp_ventanas(
+            self.distancias, self.duraciones, 3, ventanas=ventanas
+        )
+        self.assertFalse(factible)
+        self.assertEqual(sorted(ruta[1:-1]), [1, 2, 3])
+
+    def test_etas_esperan_inicio_de_ventana(self):
+        ventanas = [None, (600, 900), None, None]
+        etas = optimizer.calcular_etas(
+            [0, 1, 2, 3, 0], self.duraciones, ventanas=ventanas,
+            tiempos_servicio=[0, 120, 0, 0], hora_salida=0,
+        )
+        self.assertEqual(etas[1], 600)
+        self.assertEqual(etas[2], 600 + 120 + 60)
+
+
+class PolylineTestCase(SimpleTestCase):
+    # Ejemplo de la documentación de Google
+    COORDS = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+    CODIFICADA = "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+
+    def test_codificar(self):
+        self.assertEqual(codificar_polyline(self.COORDS), self.CODIFICADA)
+
+    def test_decodificar(self):
+        self.assertEqual(decodificar_polyline(self.CODIFICADA), self.COORDS)
+
+    def test_tramos_respetan_limite_y_comparten_union(self):
+        coords = [(i, i) for i in range(60)]
+        tramos = dividir_en_tramos(coords, max_waypoints=25)
+        self.assertTrue(all(len(t) <= 27 for t in tramos))
+        for anterior, siguiente in zip(tramos, tramos[1:]):
+            self.assertEqual(anterior[-1], siguiente[0])
+        self.assertEqual(tramos[0][0], coords[0])
+        self.assertEqual(tramos[-1][-1], coords[-1])
+
+
+class MatrizPrecalculadaTestCase(TestCase):
+    def setUp(self):
+        self.origen = {'latitud': -36.8, 'longitud': -73.0}
+        self.puntos = [
+            PuntoEntrega.objects.create(nombre=f"P{i}", direccion="x", latitud=-36.8 + i / 100, longitud=-73.0)
+            for i in range(1, 4)
+        ]
+        self.claves = services_matriz.claves_de_ruta(self.puntos, self.origen)
+
+    def _guardar_todo(self, claves):
+        TramoMatriz.objects.bulk_create([
+            TramoMatriz(origen=o, destino=d, distancia_m=1000, duracion_s=60)
+            for o in claves for d in claves if o != d
+        ])
+
+    def test_lee_matriz_completa_sin_consultar_google(self):
+        self._guardar_todo(self.claves)
+        with mock.patch.object(optimizer, 'consultar_bloque') as consultar:
+            dist, dur = services_matriz.obtener_matrices(self.puntos, self.origen, 'key')
+        consultar.assert_not_called()
+        self.assertEqual(dist[0][1], 1.0)
+        self.assertEqual(dur[2][3], 60.0)
+        self.assertEqual(dist[1][1], 0.0)
+
+    def test_solo_consulta_celdas_de_puntos_nuevos(self):
+        self._guardar_todo(self.claves)
+        nuevo = PuntoEntrega.objects.create(nombre="N", direccion="x", latitud=-36.9, longitud=-73.1)
+        claves = services_matriz.claves_de_ruta(self.puntos + [nuevo], self.origen)
+
+        bloques = services_matriz.agrupar_faltantes(
+            services_matriz.celdas_faltantes(claves, services_matriz.leer_tramos(claves))
+        )
+        # 4 conocidos -> nuevo, y nuevo -> 4 conocidos
+        self.assertEqual(sum(len(o) * len(d) for o, d in bloques), 8)
+
+        def responder(origenes, destinos, api_key):
+            return [[(2.0, 120.0) for _ in destinos] for _ in origenes]
+
+        with mock.patch.object(optimizer, 'consultar_bloque', side_effect=responder), \
+                mock.patch.object(services_matriz.time, 'sleep'):
+            dist, _ = services_matriz.obtener_matrices(self.puntos + [nuevo], self.origen, 'key')
+
+        self.assertEqual(dist[4][0], 2.0)
+        self.assertEqual(dist[0][1], 1.0)
+        self.assertEqual(TramoMatriz.objects.count(), 20)
+
+    def test_precalculo_desde_cero_usa_bloques_cuadrados(self):
+        claves = [services_matriz.clave_coordenada(-36.8 + i / 1000, -73.0) for i in range(25)]
+        faltantes = services_matriz.celdas_faltantes(claves, {})
+        bloques = services_matriz.agrupar_faltantes(faltantes)
+
+        self.assertEqual(len(bloques), 9)  # ⌈25/10⌉²
+        self.assertTrue(all(len(o) <= 10 and len(d) <= 10 for o, d in bloques))
+        cubiertas = {(o, d) for origenes, destinos in bloques for o in origenes for d in destinos if o != d}
+        self.assertEqual(cubiertas, {(o, d) for o, destinos in faltantes.items() for d in destinos})
+
+
+class CargaMasivaTestCase(TestCase):
+    CSV = (
+        "nombre;direccion;latitud;longitud;ventana_inicio\n"
+        "Con coords;Calle 1;-36,81;-73,05;\n"
+        "Sin coords;Calle 2, Concepción;;;09:00\n"
+        ";Sin nombre;;;\n"
+        "Mala hora;Calle 3;-36.8;-73.0;nueve\n"
+    )
+
+    def _importar(self):
+        filas = leer_filas(io.BytesIO(self.CSV.encode('utf-8')), 'puntos.csv')
+        with mock.patch.object(
+            services_geocoding, 'geocodificar_google', return_value=(-36.82, -73.04)
+        ) as google:
+            reporte = importar_puntos(filas, 'key', max_workers=2)
+        return reporte, google
+
+    def test_crea_puntos_validos_y_reporta_errores_por_fila(self):
+        reporte, google = self._importar()
+        self.assertEqual(reporte['total'], 4)
+        self.assertEqual(reporte['creados'], 2)
+        self.assertEqual([e['fila'] for e in reporte['errores']], [4, 5])
+        google.assert_called_once()
+        geocodificado = PuntoEntrega.objects.get(nombre="Sin coords")
+        self.assertEqual(float(geocodificado.latitud), -36.82)
+        self.assertIsNotNone(geocodificado.ventana_inicio)
+
+    def test_reutiliza_cache_de_geocodificacion(self):
+        self._importar()
+        self.assertEqual(GeocodificacionCache.objects.count(), 1)
+        _, google = self._importar()
+        google.assert_not_called()
+
+
+class EntregasDelDiaTestCase(TestCase):
+    def setUp(self):
+        self.hoy = datetime.date(2025, 3, 10)
+        self.ana = Cliente.objects.create(nombre="Ana", direccion="Calle 1", comuna="Concepción")
+        self.beto = Cliente.objects.create(nombre="Beto", direccion="Calle 2", comuna="Talcahuano")
+        sin_dir = Cliente.objects.create(nombre="Sin dirección")
+
+        # Ana tiene dos ventas pendientes (una atrasada): debe quedar un solo punto
+        Venta.objects.create(cliente=self.ana, fecha_entrega=self.hoy)
+        Venta.objects.create(cliente=self.ana, fecha_entrega=self.hoy - datetime.timedelta(days=1))
+        Venta.objects.create(cliente=self.beto, fecha_entrega=self.hoy)
+        Venta.objects.create(cliente=sin_dir, fecha_entrega=self.hoy)
+        # No corresponden: futura, ya entregada y nota de crédito
+        Venta.objects.create(cliente=self.beto, fecha_entrega=self.hoy + datetime.timedelta(days=1))
+        Venta.objects.create(cliente=self.beto, fecha_entrega=self.hoy, entregada=True)
+        Venta.objects.create(
+            cliente=self.beto, fecha_entrega=self.hoy,
+            tipo_documento=Venta.TipoDocumento.NOTA_CREDITO,
+        )
+
+    def _generar(self):
+        with mock.patch.object(
+            services_geocoding, 'geocodificar_google', return_value=(-36.82, -73.04)
+        ) as google:
+            reporte = generar_puntos_del_dia(self.hoy, 'key', max_workers=2)
+        return reporte, google
+
+    def test_un_punto_por_cliente_y_direccion(self):
+        reporte, google = self._generar()
+        self.assertEqual(reporte['ventas'], 4)
+        self.assertEqual(reporte['creados'], 2)
+        self.assertEqual(len(reporte['errores']), 1)
+        self.assertEqual(google.call_count, 2)
+        punto = PuntoEntrega.objects.get(cliente=self.ana)
+        self.assertEqual(punto.direccion, "Calle 1, Concepción")
+        self.assertEqual(sorted(reporte['puntos']), sorted(PuntoEntrega.objects.values_list('id', flat=True)))
+
+    def test_segunda_corrida_reutiliza_puntos_y_cache(self):
+        primero, _ = self._generar()
+        segundo, google = self._generar()
+        google.assert_not_called()
+        self.assertEqual(segundo['creados'], 0)
+        self.assertEqual(segundo['actualizados'], 2)
+        self.assertEqual(sorted(segundo['puntos']), sorted(primero['puntos']))
+        self.assertEqual(PuntoEntrega.objects.count(), 2)
+
+
+class GeohashTestCase(SimpleTestCase):
+    def test_codificar_ejemplo_conocido(self):
+        self.assertEqual(geohash.codificar(42.6, -5.6, precision=5), "ezs42")
+
+    def test_celda_contiene_al_punto(self):
+        lat, lng = -36.827, -73.050
+        lat_min, lng_min, lat_max, lng_max = geohash.limites(geohash.codificar(lat, lng, 6))
+        self.assertTrue(lat_min <= lat <= lat_max and lng_min <= lng <= lng_max)
+
+
+class CargaFixtureTestCase(TestCase):
+    def test_loaddata_calcula_geohash(self):
+        datos = [{"model": "rutas.puntoentrega", "pk": 1, "fields": {
+            "nombre": "Bodega", "direccion": "Av. Pedro de Valdivia 1000",
+            "latitud": "-36.827000", "longitud": "-73.050000",
+        }}]
+        with tempfile.NamedTemporaryFile("w", suffix=".json") as archivo:
+            json.dump(datos, archivo)
+            archivo.flush()
+            call_command("loaddata", archivo.name, verbosity=0)
+
+        punto = PuntoEntrega.objects.get(pk=1)
+        self.assertEqual(punto.geohash, geohash.codificar(punto.latitud, punto.longitud))
+
+
+class ApiPuntosTestCase(TestCase):
+    BBOX = "-73.2,-37.0,-72.9,-36.7"
+
+    def setUp(self):
+        usuario = User.objects.create_user("operador", password="x")
+        self.client.force_login(usuario)
+        # Dos grupos separados ~10 km y un punto fuera del área
+        for i in range(3):
+            PuntoEntrega.objects.create(nombre=f"A{i}", direccion="x", latitud=-36.82 + i / 1000, longitud=-73.05)
+            PuntoEntrega.objects.create(nombre=f"B{i}", direccion="x", latitud=-36.92 + i / 1000, longitud=-73.15)
+        PuntoEntrega.objects.create(nombre="Lejos", direccion="x", latitud=-33.45, longitud=-70.66)
+
+    def _get(self, zoom=12, **headers):
+        return self.client.get(reverse('api_puntos'), {'bbox': self.BBOX, 'zoom': zoom}, **headers)
+
+    def test_filtra_por_area_visible(self):
+        data = self._get().json()
+        self.assertFalse(data['agrupado'])
+        self.assertEqual(data['total'], 6)
+        self.assertNotIn("Lejos", [f['properties']['nombre'] for f in data['features']])
+
+    def test_agrupa_por_celda_con_muchos_puntos(self):
+        with mock.patch.object(services_mapa, 'MAX_PUNTOS_SIN_CLUSTER', 2):
+            data = self._get(zoom=10).json()
+        self.assertTrue(data['agrupado'])
+        self.assertEqual(sorted(f['properties']['cantidad'] for f in data['features']), [3, 3])
+
+    def test_etag_devuelve_304_hasta_que_cambian_los_puntos(self):
+        etag = self._get()['ETag']
+        self.assertEqual(self._get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        PuntoEntrega.objects.create(nombre="Nuevo", direccion="x", latitud=-36.85, longitud=-73.0)
+        self.assertEqual(self._get(HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_bbox_invalido(self):
+        respuesta = self.client.get(reverse('api_puntos'), {'bbox': 'a,b'})
+        self.assertEqual(respuesta.status_code, 400)
+
+
+class CercaniaTestCase(TestCase):
+    def setUp(self):
+        rnd = random.Random(7)
+        self.coords = [(-36.83 + rnd.uniform(-0.05, 0.05), -73.05 + rnd.uniform(-0.05, 0.05)) for _ in range(80)]
+        for i, (lat, lng) in enumerate(self.coords):
+            PuntoEntrega.objects.create(nombre=f"P{i}", direccion="x", latitud=round(lat, 6), longitud=round(lng, 6))
+        self.centro = (-36.83, -73.05)
+
+    def _fuerza_bruta(self):
+        return sorted(
+            (geohash.distancia_m(*self.centro, p.latitud, p.longitud), p.id)
+            for p in PuntoEntrega.objects.all()
+        )
+
+    def test_k_mas_cercanos_coincide_con_fuerza_bruta(self):
+        esperado = [pid for _, pid in self._fuerza_bruta()[:5]]
+        obtenido = [p.id for p, _ in services_cercania.k_mas_cercanos(*self.centro, 5)]
+        self.assertEqual(obtenido, esperado)
+
+    def test_puntos_en_radio(self):
+        esperado = [pid for d, pid in self._fuerza_bruta() if d <= 1500]
+        obtenido = [p.id for p, _ in services_cercania.puntos_en_radio(*self.centro, 1500)]
+        self.assertEqual(obtenido, esperado)
+
+    def test_detecta_duplicado_a_pocos_metros(self):
+        punto = PuntoEntrega.objects.first()
+        duplicado = services_cercania.punto_duplicado(float(punto.latitud) + 0.0001, float(punto.longitud))
+        self.assertEqual(duplicado[0], punto)
+        self.assertIsNone(services_cercania.punto_duplicado(-33.45, -70.66))
+
+    def test_listas_vecinos_y_two_opt_acotado(self):
+        vecinos = services_cercania.listas_vecinos(self.coords, 6)
+        for i, lista in enumerate(vecinos):
+            esperado = sorted(
+                (j for j in range(len(self.coords)) if j != i),
+                key=lambda j: geohash.distancia_m(*self.coords[i], *self.coords[j]),
+            )[:6]
+            self.assertEqual(lista, esperado)
+
+        matriz = [[geohash.distancia_m(*a, *b) / 1000 for b in self.coords[:30]] for a in self.coords[:30]]
+        vecinos = services_cercania.listas_vecinos(self.coords[:30], 6)
+        ruta, distancia = optimizer.solve_tsp(matriz, 29, vecinos=vecinos)
+        self.assertEqual(sorted(ruta[1:-1]), list(range(1, 30)))
+        self.assertEqual((ruta[0], ruta[-1]), (0, 0))
+        self.assertAlmostEqual(distancia, optimizer._route_distance(matriz, ruta))
+
+
+class BenchmarkTestCase(SimpleTestCase):
+    def test_instancias_reproducibles(self):
+        self.assertEqual(benchmark.generar_instancia(15, 'agrupada'), benchmark.generar_instancia(15, 'agrupada'))
+        self.assertNotEqual(
+            benchmark.generar_instancia(15, 'agrupada', semilla=1),
+            benchmark.generar_instancia(15, 'agrupada'),
+        )
+        self.assertEqual(len(benchmark.generar_instancia(50)), 51)
+
+    def test_fuerza_bruta_no_pierde_contra_heuristicas(self):
+        resultados = benchmark.ejecutar(tamanos=[7], tipos=['aleatoria'], memoria=False)
+        optimo = resultados['fuerza_bruta/aleatoria/7']['largo_km']
+        for estrategia in benchmark.ESTRATEGIAS:
+            self.assertGreaterEqual(resultados[f'{estrategia}/aleatoria/7']['largo_km'], optimo - 1e-9)
+
+    def test_comparar_detecta_regresiones(self):
+        base = {'heuristica/aleatoria/50': {'tiempo_s': 0.1, 'memoria_kb': 10, 'largo_km': 100.0}}
+        igual = {'heuristica/aleatoria/50': {'tiempo_s': 0.12, 'memoria_kb': 10, 'largo_km': 100.0}}
+        peor = {'heuristica/aleatoria/50': {'tiempo_s': 0.5, 'memoria_kb': 10, 'largo_km': 101.0}}
+        self.assertEqual(benchmark.comparar(igual, base), [])
+        self.assertEqual(len(benchmark.comparar(peor, base)), 2)
+
+
+class TelemetriaTestCase(TestCase):
+    def setUp(self):
+        self.origen = {'latitud': -36.8, 'longitud': -73.0}
+        self.puntos = [
+            PuntoEntrega.objects.create(nombre=f"P{i}", direccion="x", latitud=-36.8 + i / 100, longitud=-73.0)
+            for i in range(1, 4)
+        ]
+        self.llamadas = 0
+
+    def _responder(self, url, params, timeout):
+        # La primera llamada falla por timeout (se reintenta)
+        self.llamadas += 1
+        if self.llamadas == 1:
+            raise optimizer.requests.exceptions.Timeout()
+        destinos = params['destinations'].split('|')
+        respuesta = mock.Mock()
+        respuesta.json.return_value = {
+            'status': 'OK',
+            'rows': [
+                {'elements': [
+                    {'status': 'OK', 'distance': {'value': 1000}, 'duration': {'value': 60}}
+                    for _ in destinos
+                ]}
+                for _ in params['origins'].split('|')
+            ],
+        }
+        return respuesta
+
+    @telemetria.con_telemetria
+    def _optimizar(self):
+        with mock.patch.object(optimizer.requests, 'get', side_effect=self._responder), \
+                mock.patch.object(optimizer.time, 'sleep'), \
+                mock.patch.object(services_matriz.time, 'sleep'):
+            dist, _ = services_matriz.obtener_matrices(self.puntos, self.origen, 'key')
+        optimizer.solve_tsp(dist, len(self.puntos))
+        return telemetria.actual().como_dict()
+
+    def test_registra_bloques_reintentos_cache_y_solver(self):
+        datos = self._optimizar()
+        self.assertEqual(datos['matriz']['celdas_solicitadas'], 12)
+        self.assertEqual(datos['matriz']['celdas_cache'], 0)
+        self.assertEqual(datos['matriz']['reintentos'], 1)
+        # Un bloque 4×4: las 12 celdas más la diagonal, que no se guarda
+        self.assertEqual([b['elementos'] for b in datos['matriz']['bloques']], [16])
+        self.assertEqual(datos['solver']['estrategia'], 'fuerza_bruta')
+        self.assertTrue(datos['solver']['curva'])
+
+        # Segunda corrida: todo sale de la matriz guardada
+        datos = self._optimizar()
+        self.assertEqual(datos['matriz']['celdas_cache'], 12)
+        self.assertEqual(datos['matriz']['bloques_google'], 0)
+
+    def test_sin_registro_activo_no_falla(self):
+        self.assertIsNone(telemetria.actual())
+        telemetria.registrar_mejora(10.0)
+        optimizer.solve_tsp(_matriz_linea([0, 1, 2]), 2)
+
+
+RED_SINTETICA = os.path.join(os.path.dirname(__file__), 'tests_data', 'red_sintetica.osm')
+
+
+class RedVialTestCase(SimpleTestCase):
+    def setUp(self):
+        self.red = red_vial.construir_red(*red_vial.leer_osm(RED_SINTETICA))
+        self.red.contraer()
+
+    def _grilla_aleatoria(self, n, semilla):
+        rnd = random.Random(semilla)
+        coords = {
+            i * n + j: (-36.8 + i * 0.001 + rnd.uniform(0, 0.0003), -73.0 + j * 0.001)
+            for i in range(n) for j in range(n)
+        }
+        vias = []
+        for i in range(n):
+            vias.append(([i * n + j for j in range(n)], rnd.choice([0, 0, 1, -1]), rnd.choice([30, 50])))
+            vias.append(([j * n + i for j in range(n)], rnd.choice([0, 0, 1, -1]), rnd.choice([30, 50])))
+        return red_vial.construir_red(coords, vias)
+
+    def test_lee_solo_vias_para_autos(self):
+        # 25 esquinas de la grilla; el paso peatonal y su nodo quedan fuera
+        self.assertEqual(self.red.n, 25)
+        self.assertEqual(len(self.red.hasta), 2 * 40 - 4)
+
+    def test_respeta_calle_de_un_sentido(self):
+        a = self.red.nodo_mas_cercano(-36.819, -73.050)
+        b = self.red.nodo_mas_cercano(-36.819, -73.048)
+        segundos, metros = self.red.matriz([a, b], [a, b])
+        self.assertLess(segundos[0][1], segundos[1][0])
+        self.assertAlmostEqual(metros[0][1], geohash.distancia_m(-36.819, -73.050, -36.819, -73.048))
+
+    def test_ch_coincide_con_dijkstra(self):
+        red = self._grilla_aleatoria(12, semilla=5)
+        red.contraer()
+        nodos = random.Random(1).sample(range(red.n), 25)
+        segundos, metros = red.matriz(nodos, nodos)
+        for i, origen in enumerate(nodos):
+            referencia = red.dijkstra(origen)
+            for j, destino in enumerate(nodos):
+                t, d = referencia.get(destino, (red_vial.INF, red_vial.INF))
+                self.assertAlmostEqual(segundos[i][j], t)
+                self.assertAlmostEqual(metros[i][j], d)
+
+    def test_guardar_y_cargar(self):
+        with tempfile.TemporaryDirectory() as carpeta:
+            ruta = os.path.join(carpeta, 'red.bin')
+            self.red.guardar(ruta)
+            cargada = red_vial.cargar(ruta)
+        nodos = list(range(self.red.n))
+        self.assertEqual(cargada.matriz(nodos, nodos), self.red.matriz(nodos, nodos))
+
+    def test_pbf_sin_pyosmium_explica_que_instalar(self):
+        with mock.patch.dict('sys.modules', {'osmium': None}):
+            with self.assertRaisesMessage(ValueError, 'pyosmium'):
+                red_vial.leer_osm('region.osm.pbf')
+
+    def test_obtener_matrices_usa_red_local_sin_google(self):
+        puntos = [
+            PuntoEntrega(nombre='A', direccion='x', latitud=-36.8230, longitud=-73.0460),
+            PuntoEntrega(nombre='B', direccion='x', latitud=-36.8190, longitud=-73.0420),
+        ]
+        origen = {'latitud': -36.8270, 'longitud': -73.0500}
+        with tempfile.TemporaryDirectory() as carpeta:
+            ruta = os.path.join(carpeta, 'red.bin')
+            self.red.guardar(ruta)
+            with override_settings(RUTAS_RED_VIAL=ruta), \
+                    mock.patch.object(services_matriz, 'descargar_bloque') as descargar:
+                distancias, duraciones = services_matriz.obtener_matrices(puntos, origen, 'clave')
+            services_red_vial._cargar.cache_clear()
+
+        descargar.assert_not_called()
+        self.assertEqual(len(distancias), 3)
+        # Origen -> A: 2 cuadras al norte y 2 al este por la grilla
+        esperado = (geohash.distancia_m(-36.827, -73.050, -36.823, -73.050)
+                    + geohash.distancia_m(-36.823, -73.050, -36.823, -73.046)) / 1000
+        self.assertAlmostEqual(distancias[0][1], esperado, places=3)
+        self.assertTrue(all(duraciones[i][j] > 0 for i in range(3) for j in range(3) if i != j))
+
+
+    def test_version_red_solo_si_la_red_carga(self):
+        with tempfile.TemporaryDirectory() as carpeta:
+            ruta = os.path.join(carpeta, 'red.bin')
+            with open(ruta, 'wb') as archivo:
+                archivo.write(b'no es una red')
+            with override_settings(RUTAS_RED_VIAL=ruta):
+                self.assertIsNone(services_red_vial.version_red())
+                self.red.guardar(ruta)
+                self.assertTrue(services_red_vial.version_red().startswith('red_local:'))
+            services_red_vial._cargar.cache_clear()
+
+class SolucionCacheTestCase(TestCase):
+    def setUp(self):
+        usuario = User.objects.create_user('despacho', password='x')
+        self.client.force_login(usuario)
+        GeocodificacionCache.objects.create(direccion='bodega central', latitud=-36.8, longitud=-73.0)
+        self.puntos = [
+            PuntoEntrega.objects.create(nombre=f"P{i}", direccion="x", latitud=-36.8 + i / 100, longitud=-73.0)
+            for i in (3, 1, 2)
+        ]
+        services_solucion.olvidar_todo()
+        self.addCleanup(services_solucion.olvidar_todo)
+
+    def _matrices(self, puntos, origen, api_key, dest_coords=None):
+        posiciones = [0] + [round((float(p.latitud) + 36.8) * 100) for p in puntos] + [0]
+        distancias = _matriz_linea(posiciones)
+        return distancias, [[d * 60 for d in fila] for fila in distancias]
+
+    def _optimizar(self, **datos):
+        datos = {
+            'puntos_seleccionados': [p.id for p in self.puntos],
+            'origen_predefinido': 'Bodega Central',
+            'hora_salida': '09:00',
+            **datos,
+        }
+        with mock.patch('rutas.views.obtener_matrices', side_effect=self._matrices) as matrices, \
+                mock.patch('rutas.views.asegurar_polyline', return_value=True):
+            self.client.post(reverse('optimizar_ruta'), datos)
+        return matrices.call_count, self.client.session
+
+    def test_cambiar_solo_bencina_reutiliza_la_solucion(self):
+        llamadas, sesion = self._optimizar(precio_bencina='1000')
+        self.assertEqual(llamadas, 1)
+        ruta_id, costo, etas = sesion['ruta_id'], sesion['fuel_cost_clp'], sesion['etas']
+        telemetria_original = RutaOptimizada.objects.get(pk=ruta_id).telemetria
+        self.assertEqual(sesion['total_distance_km'], 6)
+
+        llamadas, sesion = self._optimizar(precio_bencina='2000')
+        self.assertEqual(llamadas, 0)
+        self.assertEqual(sesion['ruta_id'], ruta_id)
+        self.assertEqual(sesion['fuel_cost_clp'], costo * 2)
+        ruta = RutaOptimizada.objects.get(pk=ruta_id)
+        # La telemetría guardada sigue siendo la de la corrida que resolvió la ruta
+        self.assertEqual(ruta.telemetria, telemetria_original)
+        self.assertFalse(ruta.telemetria['solver']['solucion_en_cache'])
+        self.assertEqual(ruta.etas, etas)
+
+        # Otra hora de salida sin ventanas: misma solución, ETAs recalculadas
+        llamadas, sesion = self._optimizar(hora_salida='10:00')
+        self.assertEqual(llamadas, 0)
+        self.assertEqual(sesion['etas'], {pid: '10' + eta[2:] for pid, eta in etas.items()})
+
+    def test_cambia_la_clave_con_la_seleccion_o_la_matriz(self):
+        self._optimizar()
+        self.puntos.pop()
+        llamadas, _ = self._optimizar()
+        self.assertEqual(llamadas, 1)
+
+        TramoMatriz.objects.create(origen='a', destino='b', distancia_m=1, duracion_s=1)
+        llamadas, _ = self._optimizar()
+        self.assertEqual(llamadas, 1)
+
+    def test_etas_desde_tramos_coincide_con_calcular_etas(self):
+        distancias = _matriz_linea([0, 2, 5, 1, 0])
+        duraciones = [[d * 60 for d in fila] for fila in distancias]
+        ruta = [0, 3, 1, 2, 4]
+        ventanas = [None, (0, None), (900, 1200), None, None]
+        servicio = [0, 30, 60, 90, 0]
+        esperado = optimizer.calcular_etas(ruta, duraciones, ventanas, servicio, hora_salida=100)
+        obtenido = services_solucion.etas_desde_tramos(
+            services_solucion.tramos_de_ruta(ruta, duraciones),
+            [ventanas[i] for i in ruta], [servicio[i] for i in ruta], 100,
+        )
+        self.assertEqual({ruta[pos]: t for pos, t in obtenido.items()}, esperado)
+
+
+class PlanificadorTestCase(TestCase):
+    def setUp(self):
+        self.coords = benchmark.generar_instancia(300, 'agrupada')
+        self.distancias, self.duraciones = benchmark.matrices(self.coords)
+        self.servicio = [0] + [300] * 300
+
+    def _planificar(self, n_jornadas, **presupuesto):
+        return planificador.planificar(
+            self.distancias, self.duraciones, self.coords, n_jornadas,
+            tiempos_servicio=self.servicio, **presupuesto,
+        )
+
+    def test_reparte_el_backlog_dentro_del_presupuesto(self):
+        plan = self._planificar(10, max_duracion_s=6 * 3600)
+        visitados = [k for j in plan['jornadas'] for k in j['ruta'][1:-1]]
+        self.assertEqual(sorted(visitados + plan['sin_asignar']), list(range(1, 301)))
+        self.assertEqual(plan['sin_asignar'], [])
+        for jornada in plan['jornadas']:
+            self.assertEqual((jornada['ruta'][0], jornada['ruta'][-1]), (0, 0))
+            self.assertLessEqual(jornada['duracion_s'], 6 * 3600)
+            self.assertAlmostEqual(jornada['distancia_km'], optimizer._route_distance(self.distancias, jornada['ruta']))
+
+    def test_sin_jornadas_suficientes_informa_lo_que_no_cabe(self):
+        plan = self._planificar(2, max_distancia_km=40)
+        self.assertLessEqual(len(plan['jornadas']), 2)
+        self.assertTrue(plan['sin_asignar'])
+        self.assertTrue(all(j['distancia_km'] <= 40 for j in plan['jornadas']))
+
+    def test_vista_persiste_una_ruta_por_jornada(self):
+        usuario = User.objects.create_user('despacho', password='x')
+        self.client.force_login(usuario)
+        GeocodificacionCache.objects.create(direccion='bodega central', latitud=self.coords[0][0], longitud=self.coords[0][1])
+        puntos = [
+            PuntoEntrega.objects.create(nombre=f"P{i}", direccion="x", latitud=round(lat, 6), longitud=round(lng, 6))
+            for i, (lat, lng) in enumerate(self.coords[1:41], start=1)
+        ]
+
+        def matrices(puntos, origen, api_key, dest_coords=None):
+            return benchmark.matrices([self.coords[0]] + [(float(p.latitud), float(p.longitud)) for p in puntos])
+
+        with mock.patch('rutas.services_planificacion.obtener_matrices', side_effect=matrices):
+            respuesta = self.client.post(reverse('planificar_rutas'), {
+                'puntos_seleccionados': [p.id for p in puntos],
+                'origen_predefinido': 'Bodega Central',
+                'fecha_inicio': '2026-03-02',
+                'dias': '3',
+                'vehiculos': '2',
+                'max_km': '30',
+            })
+        self.assertRedirects(respuesta, reverse('mapa'), fetch_redirect_response=False)
+
+        plan = PlanRutas.objects.get()
+        rutas = list(plan.rutas.order_by('fecha', 'vehiculo'))
+        self.assertTrue(rutas)
+        self.assertEqual(rutas[0].fecha, datetime.date(2026, 3, 2))
+        self.assertEqual(rutas[0].etas[str(rutas[0].puntos[0])][:2], '08')
+        self.assertEqual(
+            sorted([pid for r in rutas for pid in r.puntos] + plan.sin_asignar),
+            sorted(p.id for p in puntos),
+        )
+        self.assertTrue(all(r.distancia_km <= 30 for r in rutas))
+        self.assertContains(self.client.get(reverse('mapa')), f"Plan #{plan.id}")
@@ -4,7 +4,11 @@ from . import views
 urlpatterns = [
     path('', views.mapa_view, name='mapa'),
     path('agregar_punto/', views.agregar_punto, name='agregar_punto'),
+    path('cargar_puntos/', views.cargar_puntos, name='cargar_puntos'),
+    path('generar_entregas/', views.generar_entregas, name='generar_entregas'),
     path('optimizar_ruta/', views.optimizar_ruta, name='optimizar_ruta'),
+    path('planificar_rutas/', views.planificar_rutas, name='planificar_rutas'),
     path('borrar_puntos/', views.borrar_puntos, name='borrar_puntos'),
     path('borrar_punto/<int:punto_id>/', views.borrar_punto, name='borrar_punto'),
+    path('api/puntos/', views.api_puntos, name='api_puntos'),
 ]
@@ -1,22 +1,62 @@
 # rutas/views.py
 import json
-import requests
 import logging
 
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, redirect, get_object_or_404
 from django.http import JsonResponse
-from django.views.decorators.http import require_POST
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_time
+from django.views.decorators.http import condition, require_GET, require_POST
 from django.views.decorators.csrf import ensure_csrf_cookie
 
-from .models import PuntoEntrega
+from .models import PlanRutas, PuntoEntrega, RutaOptimizada
 from . import optimizer
+from .optimizer import formatear_hora, hora_a_segundos
+from .services_carga import leer_filas, importar_puntos
+from .services_cercania import listas_vecinos, punto_duplicado
+from .services_entregas import generar_puntos_del_dia
+from .services_geocoding import geocodificar, GeocodificacionError
+from .services_planificacion import PlanificacionError, planificar_backlog
+from .services_mapa import extension_puntos, geojson_puntos, parsear_bbox, puntos_en_bbox, version_puntos
+from .services_matriz import obtener_matrices
+from .services_polyline import asegurar_polyline
+from .services_solucion import (
+    buscar_solucion, clave_solucion, etas_desde_tramos, guardar_solucion, tramos_de_ruta, version_matriz,
+)
+from .telemetria import con_telemetria
+from . import telemetria
 
 logger = logging.getLogger(__name__)
 
 DEFAULT_FUEL_PRICE = 1250
 DEFAULT_RENDIMIENTO = getattr(optimizer, 'AUTO_RENDIMIENTO_KM_POR_LITRO', 12)
+K_VECINOS = 10
+# El 2-opt acotado a vecinos da rutas algo más largas; sólo compensa
+# cuando el 2-opt completo pasa de ~1 s (benchmark_optimizer: con
+# 300 puntos es 0.3-0.8 s; con 400, 1.2-2.6 s)
+MIN_PUNTOS_VECINOS = 300
+
+
+def _resumen_plan(plan_id):
+    """Plan de varios días con sus jornadas (para el resumen del mapa), o None"""
+    plan = PlanRutas.objects.filter(id=plan_id).first() if plan_id else None
+    if plan is None:
+        return None
+    return {
+        'plan': plan,
+        'jornadas': [
+            {
+                'fecha': ruta.fecha,
+                'vehiculo': ruta.vehiculo,
+                'paradas': len(ruta.puntos),
+                'distancia_km': ruta.distancia_km,
+                'ultima_eta': ruta.etas.get(str(ruta.puntos[-1])) if ruta.puntos else None,
+            }
+            for ruta in plan.rutas.order_by('fecha', 'vehiculo')
+        ],
+    }
 
 
 @login_required
@@ -32,24 +72,56 @@ def mapa_view(request):
 
     selected_ids = request.session.get('selected_ids')
 
+    # Sin selección el mapa pide los puntos visibles a api_puntos (GeoJSON),
+    # así la página no incrusta todos los puntos.
     if selected_ids:
         puntos_para_mapa = PuntoEntrega.objects.filter(
             id__in=selected_ids
         ).order_by('orden_optimo', 'id')
     else:
-        puntos_para_mapa = puntos_entrega
-
-    puntos_json = json.dumps([
+        puntos_para_mapa = PuntoEntrega.objects.none()
+
+    etas = request.session.pop('etas', None) or {}
+
+    # Polyline cacheada de la última ruta persistida (sin llamadas desde el navegador)
+    polyline = ''
+    ruta_id = request.session.get('ruta_id')
+    if ruta_id:
+        polyline = (
+            RutaOptimizada.objects.filter(id=ruta_id)
+            .values_list('polyline', flat=True)
+            .first()
+        ) or ''
+
+    puntos_json = json.dumps({
+        'puntos': [
+            {
+                'id': p.id,
+                'nombre': p.nombre,
+                'direccion': p.direccion,
+                'latitud': float(p.latitud),
+                'longitud': float(p.longitud),
+                'orden_optimo': p.orden_optimo,
+                'eta': etas.get(str(p.id)),
+            }
+            for p in puntos_para_mapa
+        ],
+        'polyline': polyline,
+        'extension': None if selected_ids else extension_puntos(),
+    })
+
+    # Itinerario (ETA por parada) de la última optimización
+    itinerario = [
         {
-            'id': p.id,
+            'orden': p.orden_optimo,
             'nombre': p.nombre,
-            'direccion': p.direccion,
-            'latitud': float(p.latitud),
-            'longitud': float(p.longitud),
-            'orden_optimo': p.orden_optimo,
+            'eta': etas[str(p.id)],
+            'ventana_inicio': p.ventana_inicio,
+            'ventana_fin': p.ventana_fin,
         }
-        for p in puntos_para_mapa
-    ])
+        for p in sorted(puntos_para_mapa, key=lambda p: p.orden_optimo or 0)
+        if str(p.id) in etas
+    ]
 
     context = {
         'google_maps_api_key': settings.GOOGLE_MAPS_API_KEY,
@@ -72,6 +144,14 @@ def mapa_view(request):
         'destino_lng': request.session.pop('destino_lng', None),
 
         'error_message': request.session.pop('error_message', None),
+        'carga_resultado': request.session.pop('carga_resultado', None),
+        'entregas_resultado': request.session.pop('entregas_resultado', None),
+        'plan': _resumen_plan(request.session.pop('plan_id', None)),
+        'hoy': timezone.localdate(),
+
+        'hora_salida': request.session.pop('hora_salida', ''),
+        'itinerario': itinerario,
+        'ruta_factible': request.session.pop('ruta_factible', True),
 
         'selected_ids': selected_ids,
     }
@@ -79,6 +159,41 @@ def mapa_view(request):
     return render(request, "rutas/mapa.html", context)
 
 
+def _parametros_mapa(request):
+    """bbox y zoom de la consulta del mapa (ValueError si no son válidos)"""
+    bbox = parsear_bbox(request.GET.get('bbox'))
+    zoom = int(request.GET.get('zoom', 12))
+    return bbox, zoom
+
+
+def _etag_puntos(request):
+    try:
+        bbox, zoom = _parametros_mapa(request)
+    except ValueError:
+        return None
+    return version_puntos(puntos_en_bbox(bbox), bbox, zoom)
+
+
+@login_required
+@require_GET
+@condition(etag_func=_etag_puntos)
+def api_puntos(request):
+    """
+    GeoJSON de los puntos dentro del área visible (?bbox=lng_min,lat_min,lng_max,lat_max&zoom=z).
+    Con muchos puntos devuelve clusters por celda geohash. Responde 304 si
+    el ETag coincide (los puntos del área no cambiaron).
+    """
+    try:
+        bbox, zoom = _parametros_mapa(request)
+    except ValueError as e:
+        return JsonResponse({"ok": False, "error": str(e)}, status=400)
+
+    response = JsonResponse(geojson_puntos(puntos_en_bbox(bbox), zoom))
+    # Siempre revalidar con el ETag (los puntos cambian al agregar/borrar)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
 @login_required
 def agregar_punto(request):
     """
@@ -97,29 +212,30 @@ def agregar_punto(request):
     latitud = request.POST.get('latitud')
     longitud = request.POST.get('longitud')
 
-    # Geocodificación si no se proporcionan lat/lng
+    # Ventana horaria opcional
+    try:
+        ventana_inicio = parse_time(request.POST.get('ventana_inicio', '').strip() or '')
+        ventana_fin = parse_time(request.POST.get('ventana_fin', '').strip() or '')
+        tiempo_servicio_min = int(request.POST.get('tiempo_servicio_min', '').strip() or 0)
+    except ValueError:
+        request.session['error_message'] = 'Ventana horaria o tiempo de atención con formato incorrecto.'
+        return redirect('mapa')
+
+    if ventana_inicio and ventana_fin and ventana_inicio >= ventana_fin:
+        request.session['error_message'] = 'El inicio de la ventana debe ser anterior al fin.'
+        return redirect('mapa')
+
+    if tiempo_servicio_min < 0:
+        request.session['error_message'] = 'El tiempo de atención no puede ser negativo.'
+        return redirect('mapa')
+
+    # Geocodificación si no se proporcionan lat/lng (con caché persistente)
     if not latitud or not longitud:
         try:
-            geocode_url = "https://maps.googleapis.com/maps/api/geocode/json"
-            params = {
-                "address": direccion,
-                "key": settings.GOOGLE_MAPS_API_KEY
-            }
-            response = requests.get(geocode_url, params=params)
-            data = response.json()
-            if data['status'] == 'OK' and data['results']:
-                location = data['results'][0]['geometry']['location']
-                latitud = location['lat']
-                longitud = location['lng']
-            else:
-                request.session['error_message'] = (
-                    f"No se pudo geocodificar la dirección: {direccion}. "
-                    f"Estado: {data.get('status')}"
-                )
-                return redirect('mapa')
-        except requests.exceptions.RequestException as e:
+            latitud, longitud = geocodificar(direccion, settings.GOOGLE_MAPS_API_KEY)
+        except GeocodificacionError as e:
             logger.error(f"Error geocodificando dirección para {request.user.username}: {e}")
-            request.session['error_message'] = f"Error de conexión con la API de geocodificación: {e}"
+            request.session['error_message'] = str(e)
             return redirect('mapa')
         except Exception as e:
             logger.error(f"Error inesperado geocodificando: {e}", exc_info=True)
@@ -134,11 +250,24 @@ def agregar_punto(request):
         request.session['error_message'] = 'Latitud o Longitud con formato incorrecto.'
         return redirect('mapa')
 
+    # Misma parada ya registrada (a pocos metros)
+    duplicado = punto_duplicado(latitud, longitud)
+    if duplicado is not None and not request.POST.get('permitir_duplicado'):
+        existente, distancia = duplicado
+        request.session['error_message'] = (
+            f"Ya existe el punto \"{existente.nombre}\" ({existente.direccion}) "
+            f"a {distancia:.0f} m de esa dirección."
+        )
+        return redirect('mapa')
+
     punto = PuntoEntrega.objects.create(
         nombre=nombre,
         direccion=direccion,
         latitud=latitud,
         longitud=longitud,
+        ventana_inicio=ventana_inicio,
+        ventana_fin=ventana_fin,
+        tiempo_servicio_min=tiempo_servicio_min,
     )
     
     logger.info(f"Punto #{punto.id} agregado por {request.user.username}: {nombre}")
@@ -146,6 +275,76 @@ def agregar_punto(request):
 
 
 @login_required
+@require_POST
+def cargar_puntos(request):
+    """
+    Carga masiva de puntos desde un CSV/XLSX. Geocodifica en paralelo
+    las filas sin coordenadas y crea todo con un solo bulk_create.
+    Devuelve JSON con el reporte por fila si la llamada es AJAX.
+    """
+    archivo = request.FILES.get('archivo')
+    es_ajax = request.headers.get('x-requested-with') == 'XMLHttpRequest'
+
+    if archivo is None:
+        error = 'Debes adjuntar un archivo .csv o .xlsx.'
+        if es_ajax:
+            return JsonResponse({"ok": False, "error": error}, status=400)
+        request.session['error_message'] = error
+        return redirect('mapa')
+
+    try:
+        filas = leer_filas(archivo, archivo.name)
+    except ValueError as e:
+        if es_ajax:
+            return JsonResponse({"ok": False, "error": str(e)}, status=400)
+        request.session['error_message'] = str(e)
+        return redirect('mapa')
+
+    reporte = importar_puntos(filas, settings.GOOGLE_MAPS_API_KEY)
+
+    logger.info(
+        f"Carga masiva por {request.user.username}: {reporte['creados']}/{reporte['total']} "
+        f"puntos creados desde {archivo.name}"
+    )
+
+    if es_ajax:
+        return JsonResponse({"ok": True, **reporte})
+
+    request.session['carga_resultado'] = reporte
+    return redirect('mapa')
+
+
+@login_required
+@require_POST
+def generar_entregas(request):
+    """
+    Genera/actualiza los puntos de entrega desde las ventas pendientes
+    del día (CRM) y los deja seleccionados para optimizar la ruta.
+    """
+    fecha = request.POST.get('fecha', '').strip()
+    try:
+        dia = parse_date(fecha) if fecha else timezone.localdate()
+    except ValueError:
+        dia = None
+    if dia is None:
+        request.session['error_message'] = 'Fecha de entrega con formato incorrecto.'
+        return redirect('mapa')
+
+    reporte = generar_puntos_del_dia(dia, settings.GOOGLE_MAPS_API_KEY)
+
+    logger.info(
+        f"Entregas del {dia} generadas por {request.user.username}: "
+        f"{len(reporte['puntos'])} puntos desde {reporte['ventas']} ventas"
+    )
+
+    if reporte['puntos']:
+        request.session['selected_ids'] = [str(pid) for pid in reporte['puntos']]
+    request.session['entregas_resultado'] = {**reporte, 'fecha': dia.isoformat()}
+    return redirect('mapa')
+
+
+@login_required
+@con_telemetria
 def optimizar_ruta(request):
     """
     Toma los puntos de entrega seleccionados, el origen/destino,
@@ -215,104 +414,221 @@ def optimizar_ruta(request):
         request.session['error_message'] = 'La dirección de destino no puede estar vacía.'
         return redirect('mapa')
 
-    # 3) GEOCODIFICAR ORIGEN
-    geocode_url = "https://maps.googleapis.com/maps/api/geocode/json"
+    # 3) GEOCODIFICAR ORIGEN Y DESTINO (caché persistente de direcciones)
     try:
-        params_origen = {
-            "address": direccion_origen,
-            "key": settings.GOOGLE_MAPS_API_KEY
-        }
-        resp_o = requests.get(geocode_url, params=params_origen)
-        data_o = resp_o.json()
-
-        if data_o['status'] == 'OK' and data_o['results']:
-            loc_o = data_o['results'][0]['geometry']['location']
-            lat_inicio = float(loc_o['lat'])
-            lng_inicio = float(loc_o['lng'])
-            punto_inicio_coords = {'latitud': lat_inicio, 'longitud': lng_inicio}
-            request.session['origen_lat'] = lat_inicio
-            request.session['origen_lng'] = lng_inicio
-        else:
+        lat_inicio, lng_inicio = geocodificar(direccion_origen, settings.GOOGLE_MAPS_API_KEY)
+    except GeocodificacionError as e:
+        logger.error(f"Error geocodificando origen: {e}")
+        request.session['error_message'] = f"No se pudo geocodificar la dirección de origen: {e}"
+        return redirect('mapa')
+    punto_inicio_coords = {'latitud': lat_inicio, 'longitud': lng_inicio}
+    request.session['origen_lat'] = lat_inicio
+    request.session['origen_lng'] = lng_inicio
+
+    if direccion_destino == direccion_origen:
+        lat_dest, lng_dest = lat_inicio, lng_inicio
+    else:
+        try:
+            lat_dest, lng_dest = geocodificar(direccion_destino, settings.GOOGLE_MAPS_API_KEY)
+        except GeocodificacionError as e:
+            logger.error(f"Error geocodificando destino: {e}")
+            request.session['error_message'] = f"No se pudo geocodificar la dirección destino: {e}"
+            return redirect('mapa')
+    destino_coords = {'latitud': lat_dest, 'longitud': lng_dest}
+    request.session['destino_lat'] = lat_dest
+    request.session['destino_lng'] = lng_dest
+
+    tel = telemetria.actual()
+    tel.marcar('geocodificacion')
+
+    num_delivery_points = len(puntos_entrega_db)
+    end_index = num_delivery_points + 1
+
+    # Hora de salida (por defecto: ahora)
+    hora_salida_str = request.POST.get('hora_salida', '').strip()
+    try:
+        hora_salida = parse_time(hora_salida_str) if hora_salida_str else None
+    except ValueError:
+        hora_salida = None
+    if hora_salida is None:
+        hora_salida = timezone.localtime().time().replace(second=0, microsecond=0)
+
+    # Ventanas y tiempos de atención por punto
+    ventanas_punto = {
+        punto.id: (hora_a_segundos(punto.ventana_inicio), hora_a_segundos(punto.ventana_fin))
+        for punto in puntos_entrega_db
+    }
+    servicio_punto = {punto.id: punto.tiempo_servicio_min * 60 for punto in puntos_entrega_db}
+
+    # Configuración del solver: las ventanas y la hora de salida sólo
+    # cambian la solución cuando algún punto tiene ventana o atención
+    con_ventanas = any(p.tiene_ventana for p in puntos_entrega_db)
+    config_solver = {
+        'estrategia': 'ventanas' if con_ventanas else 'heuristica',
+        'k_vecinos': K_VECINOS if num_delivery_points > MIN_PUNTOS_VECINOS and not con_ventanas else None,
+        'ventanas': sorted(
+            [pid, *ventanas_punto[pid], servicio_punto[pid]] for pid in ventanas_punto
+        ) if con_ventanas else None,
+        'hora_salida': hora_a_segundos(hora_salida) if con_ventanas else None,
+    }
+
+    # 4) SOLUCIÓN EN CACHÉ (misma selección, extremos, matriz y solver)
+    solucion = buscar_solucion(clave_solucion(
+        puntos_entrega_db, punto_inicio_coords, destino_coords, version_matriz(), config_solver,
+    ))
+    tel.solucion_en_cache = solucion is not None
+    tel.marcar('cache_solucion')
+
+    if solucion is not None:
+        ruta = solucion['ruta']
+        total_distance_km = solucion['distancia_km']
+        ruta_factible = solucion['factible']
+        puntos_por_id = {p.id: p for p in puntos_entrega_db}
+        orden = [puntos_por_id[pid] for pid in solucion['puntos']]
+        posiciones = [None] + [ventanas_punto[p.id] for p in orden] + [None]
+        etas_pos = etas_desde_tramos(
+            solucion['tramos_s'],
+            ventanas=posiciones,
+            tiempos_servicio=[0] + [servicio_punto[p.id] for p in orden] + [0],
+            hora_salida=hora_a_segundos(hora_salida),
+        )
+        etas_por_punto = {orden[pos - 1]: segundos for pos, segundos in etas_pos.items()}
+        tel.marcar('solver')
+    else:
+        # 5) MATRIZ DE DISTANCIAS Y DURACIONES (precalculada; sólo se piden celdas nuevas)
+        matrices = obtener_matrices(
+            puntos_entrega_db,
+            punto_inicio_coords,
+            settings.GOOGLE_MAPS_API_KEY,
+            dest_coords=destino_coords,
+        )
+
+        if matrices is None:
             request.session['error_message'] = (
-                f"No se pudo geocodificar la dirección de origen: {direccion_origen} "
-                f"(estado: {data_o.get('status')})."
+                'No se pudo obtener la matriz de distancias. '
+                'Revisa la clave API o la conexión.'
             )
             return redirect('mapa')
-    except Exception as e:
-        logger.error(f"Error geocodificando origen: {e}", exc_info=True)
-        request.session['error_message'] = f"Error al geocodificar la dirección de origen: {e}"
-        return redirect('mapa')
 
-    # 4) GEOCODIFICAR DESTINO
-    destino_coords = None
-    try:
-        if direccion_destino == direccion_origen:
-            destino_coords = {'latitud': lat_inicio, 'longitud': lng_inicio}
-            request.session['destino_lat'] = lat_inicio
-            request.session['destino_lng'] = lng_inicio
+        distance_matrix, duration_matrix = matrices
+        tel.marcar('matriz')
+
+        # Ventanas y tiempos de atención por índice de la matriz
+        n_matriz = len(distance_matrix)
+        ventanas = [None] * n_matriz
+        tiempos_servicio = [0] * n_matriz
+        for idx, punto in enumerate(puntos_entrega_db, start=1):
+            ventanas[idx] = ventanas_punto[punto.id]
+            tiempos_servicio[idx] = servicio_punto[punto.id]
+
+        tel.marcar('preparacion')
+
+        # 6) OPTIMIZAR RUTA
+        ruta_factible = True
+        if con_ventanas:
+            optimized_route_indices, total_distance_km, etas_idx, ruta_factible = optimizer.solve_tsp_ventanas(
+                distance_matrix,
+                duration_matrix,
+                num_delivery_points,
+                ventanas=ventanas,
+                tiempos_servicio=tiempos_servicio,
+                hora_salida=hora_a_segundos(hora_salida),
+                start_index=0,
+                end_index=end_index,
+            )
         else:
-            params_dest = {
-                "address": direccion_destino,
-                "key": settings.GOOGLE_MAPS_API_KEY
-            }
-            resp_d = requests.get(geocode_url, params=params_dest)
-            data_d = resp_d.json()
-            if data_d['status'] == 'OK' and data_d['results']:
-                loc_d = data_d['results'][0]['geometry']['location']
-                lat_dest = float(loc_d['lat'])
-                lng_dest = float(loc_d['lng'])
-                destino_coords = {'latitud': lat_dest, 'longitud': lng_dest}
-                request.session['destino_lat'] = lat_dest
-                request.session['destino_lng'] = lng_dest
-            else:
-                request.session['error_message'] = (
-                    f"No se pudo geocodificar la dirección destino: {direccion_destino} "
-                    f"(estado: {data_d.get('status')})."
-                )
-                return redirect('mapa')
-    except Exception as e:
-        logger.error(f"Error geocodificando destino: {e}", exc_info=True)
-        request.session['error_message'] = f"Error al geocodificar la dirección destino: {e}"
-        return redirect('mapa')
+            # Listas de vecinos (índice geohash) para acotar el 2-opt en rutas grandes
+            coords_matriz = [(punto_inicio_coords['latitud'], punto_inicio_coords['longitud'])]
+            coords_matriz.extend((p.latitud, p.longitud) for p in puntos_entrega_db)
+            coords_matriz.append((destino_coords['latitud'], destino_coords['longitud']))
+
+            optimized_route_indices, total_distance_km = optimizer.solve_tsp(
+                distance_matrix,
+                num_delivery_points,
+                start_index=0,
+                end_index=end_index,
+                vecinos=listas_vecinos(coords_matriz, K_VECINOS) if config_solver['k_vecinos'] else None,
+            )
+            etas_idx = optimizer.calcular_etas(
+                optimized_route_indices,
+                duration_matrix,
+                ventanas=ventanas,
+                tiempos_servicio=tiempos_servicio,
+                hora_salida=hora_a_segundos(hora_salida),
+            )
 
-    # 5) MATRIZ DE DISTANCIAS
-    distance_matrix = optimizer.get_distance_matrix(
-        puntos_entrega_db,
-        punto_inicio_coords,
-        settings.GOOGLE_MAPS_API_KEY,
-        dest_coords=destino_coords,
-    )
+        tel.marcar('solver')
 
-    if distance_matrix is None:
-        request.session['error_message'] = (
-            'No se pudo obtener la matriz de distancias. '
-            'Revisa la clave API o la conexión.'
-        )
-        return redirect('mapa')
+        if not optimized_route_indices:
+            request.session['error_message'] = (
+                'No se pudo optimizar la ruta. Verifica los puntos o el algoritmo.'
+            )
+            return redirect('mapa')
 
-    num_delivery_points = len(puntos_entrega_db)
-    end_index = num_delivery_points + 1 if destino_coords is not None else None
-
-    # 6) OPTIMIZAR RUTA
-    optimized_route_indices, total_distance_km = optimizer.solve_tsp(
-        distance_matrix,
-        num_delivery_points,
-        start_index=0,
-        end_index=end_index,
-    )
+        orden = [
+            puntos_entrega_db[idx - 1]
+            for idx in optimized_route_indices[1:-1]
+            if 1 <= idx <= num_delivery_points
+        ]
+        etas_por_punto = {
+            puntos_entrega_db[idx - 1]: segundos
+            for idx, segundos in etas_idx.items()
+            if 1 <= idx <= num_delivery_points
+        }
 
-    if not optimized_route_indices:
-        request.session['error_message'] = (
-            'No se pudo optimizar la ruta. Verifica los puntos o el algoritmo.'
+        # 6b) PERSISTIR RUTA + POLYLINE (Directions se consulta una sola vez por ruta)
+        ruta = RutaOptimizada.objects.create(
+            direccion_origen=direccion_origen,
+            direccion_destino=direccion_destino,
+            origen_lat=punto_inicio_coords['latitud'],
+            origen_lng=punto_inicio_coords['longitud'],
+            destino_lat=destino_coords['latitud'],
+            destino_lng=destino_coords['longitud'],
+            puntos=[p.id for p in orden],
+            distancia_km=round(total_distance_km, 2) if total_distance_km != float('inf') else 0,
         )
-        return redirect('mapa')
+        # La versión se lee después de obtener la matriz: incluye las celdas recién pedidas
+        guardar_solucion(
+            clave_solucion(
+                puntos_entrega_db, punto_inicio_coords, destino_coords, version_matriz(), config_solver,
+            ),
+            ruta,
+            total_distance_km,
+            tramos_de_ruta(optimized_route_indices, duration_matrix),
+            ruta_factible,
+        )
+        tel.marcar('guardado')
+        if not asegurar_polyline(ruta, settings.GOOGLE_MAPS_API_KEY):
+            logger.warning(f"Ruta #{ruta.id}: no se pudo obtener la polyline desde Directions API")
+        tel.marcar('polyline')
 
     # 7) GUARDAR ORDEN ÓPTIMO
-    for i, matrix_idx in enumerate(optimized_route_indices[1:-1]):
-        if 1 <= matrix_idx <= num_delivery_points:
-            punto = puntos_entrega_db[matrix_idx - 1]
-            punto.orden_optimo = i + 1
-            punto.save()
+    for i, punto in enumerate(orden, start=1):
+        punto.orden_optimo = i
+        punto.save()
+
+    # ETA por punto (id -> 'HH:MM')
+    request.session['etas'] = {
+        str(punto.id): formatear_hora(segundos) for punto, segundos in etas_por_punto.items()
+    }
+
+    # Telemetría: registro estructurado + persistida con la ruta (y las ETAs de esta corrida).
+    # Con la solución en caché la ruta es la de la corrida original: se conserva su telemetría
+    ruta.etas = request.session['etas']
+    campos = ['etas']
+    if not tel.solucion_en_cache:
+        ruta.telemetria = tel.como_dict()
+        campos.append('telemetria')
+    ruta.save(update_fields=campos)
+    telemetria.emitir(ruta.id, tel.como_dict())
+    request.session['ruta_id'] = ruta.id
+    request.session['hora_salida'] = hora_salida.strftime('%H:%M')
+    request.session['ruta_factible'] = ruta_factible
+
+    if not ruta_factible:
+        logger.warning(
+            f"Ruta de {request.user.username} no cumple todas las ventanas horarias"
+        )
 
     # 8) CONSUMO Y COSTO
     rendimiento_str = request.POST.get('rendimiento_vehiculo', '').strip()
@@ -351,6 +667,73 @@ def optimizar_ruta(request):
     return redirect('mapa')
 
 
+@login_required
+@require_POST
+def planificar_rutas(request):
+    """
+    Reparte los puntos seleccionados en rutas diarias (días × vehículos)
+    con un máximo de horas y/o km por jornada. Cada jornada queda
+    persistida como RutaOptimizada del plan.
+    """
+    selected_ids = request.POST.getlist('puntos_seleccionados')
+    puntos = list(PuntoEntrega.objects.filter(id__in=selected_ids).order_by('id'))
+    if not puntos:
+        request.session['error_message'] = 'Debes seleccionar los puntos a planificar.'
+        return redirect('mapa')
+    request.session['selected_ids'] = selected_ids
+
+    origen_predef = request.POST.get('origen_predefinido', '').strip()
+    if origen_predef == 'custom':
+        direccion_origen = request.POST.get('origen_custom', '').strip()
+    else:
+        direccion_origen = origen_predef
+    if not direccion_origen:
+        request.session['error_message'] = 'Debes seleccionar o escribir una dirección de origen.'
+        return redirect('mapa')
+
+    try:
+        fecha = request.POST.get('fecha_inicio', '').strip()
+        fecha_inicio = parse_date(fecha) if fecha else timezone.localdate()
+        hora = request.POST.get('hora_salida', '').strip()
+        hora_salida = parse_time(hora) if hora else None
+        dias = int(request.POST.get('dias') or 5)
+        vehiculos = int(request.POST.get('vehiculos') or 1)
+        max_horas = request.POST.get('max_horas', '').strip()
+        max_horas = round(float(max_horas), 2) if max_horas else None
+        max_km = request.POST.get('max_km', '').strip()
+        max_km = round(float(max_km), 2) if max_km else None
+    except ValueError:
+        fecha_inicio = None
+    if fecha_inicio is None:
+        request.session['error_message'] = 'Parámetros de planificación con formato incorrecto.'
+        return redirect('mapa')
+
+    try:
+        latitud, longitud = geocodificar(direccion_origen, settings.GOOGLE_MAPS_API_KEY)
+        plan = planificar_backlog(
+            puntos,
+            {'latitud': latitud, 'longitud': longitud},
+            fecha_inicio,
+            dias,
+            vehiculos=vehiculos,
+            max_horas=max_horas,
+            max_km=max_km,
+            hora_salida=hora_salida,
+            direccion_origen=direccion_origen,
+            api_key=settings.GOOGLE_MAPS_API_KEY,
+        )
+    except (GeocodificacionError, PlanificacionError) as e:
+        request.session['error_message'] = str(e)
+        return redirect('mapa')
+
+    logger.info(
+        f"Plan #{plan.id} creado por {request.user.username}: {len(puntos)} puntos, "
+        f"{dias} días × {vehiculos} vehículos"
+    )
+    request.session['plan_id'] = plan.id
+    return redirect('mapa')
+
+
 @login_required
 def borrar_puntos(request):
     """
@@ -361,9 +744,10 @@ def borrar_puntos(request):
         PuntoEntrega.objects.all().delete()
         logger.warning(f"{count} puntos borrados por {request.user.username}")
         
-        # Limpiar selección si borras todos
+        # Limpiar selección y ruta si borras todos
         if 'selected_ids' in request.session:
             del request.session['selected_ids']
+        request.session.pop('ruta_id', None)
     return redirect('mapa')
 
 